@@ -5,6 +5,7 @@ from sqlalchemy import engine_from_config, pool
 from alembic import context
 from app.db.base import Base
 from app.db.models import *
+from app.db.settings import DatabaseSettings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -15,6 +16,11 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Migrate the database the app writes to, see app/db/settings.py
+config.set_main_option(
+    "sqlalchemy.url", DatabaseSettings.from_env().url.replace("%", "%%")
+)
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -8,7 +8,6 @@ Create Date: 2024-11-03 20:15:03.950102
 from typing import Sequence, Union
 
 from alembic import op
-from app.db import custom_types
 import sqlalchemy as sa
 
 
@@ -24,7 +23,7 @@ def upgrade() -> None:
     op.create_table('firewall',
     sa.Column('id', sa.Integer(), nullable=False),
     sa.Column('name', sa.String(length=50), nullable=False),
-    sa.Column('ip_address', custom_types.IPv4Address(length=15), nullable=False),
+    sa.Column('ip_address', sa.String(length=15), nullable=False),
     sa.Column('port', sa.Integer(), nullable=False),
     sa.PrimaryKeyConstraint('id'),
     sa.UniqueConstraint('ip_address', 'port')
@@ -0,0 +1,46 @@
+"""Add rule hits table
+
+Revision ID: 4f8c2a61d9e7
+Revises: e51a7b93c0d4
+Create Date: 2026-10-18 18:42:11.507316
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4f8c2a61d9e7"
+down_revision: Union[str, None] = "e51a7b93c0d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite rebuilds the table with AUTOINCREMENT so that ids of deleted rules
+    # are never reused, like the sequences of other databases
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table(
+            "rule", recreate="always", table_kwargs={"sqlite_autoincrement": True}
+        ):
+            pass
+
+    op.create_table(
+        "rule_hits",
+        sa.Column("rule_id", sa.Integer(), nullable=False),
+        sa.Column("hits", sa.BigInteger(), nullable=False),
+        sa.Column("last_hit_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["rule_id"], ["rule.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("rule_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rule_hits")
+
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table("rule", recreate="always"):
+            pass
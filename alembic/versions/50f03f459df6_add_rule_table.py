@@ -11,7 +11,6 @@ from typing import Sequence, Union
 import sqlalchemy as sa
 
 from alembic import op
-from app.db import custom_types
 
 # revision identifiers, used by Alembic.
 revision: str = "50f03f459df6"
@@ -27,10 +26,8 @@ def upgrade() -> None:
         sa.Column("id", sa.Integer(), nullable=False),
         sa.Column("name", sa.String(length=50), nullable=True),
         sa.Column("filtering_policy_id", sa.Integer(), nullable=False),
-        sa.Column("source_ip", custom_types.IPv4Address(length=15), nullable=False),
-        sa.Column(
-            "destination_ip", custom_types.IPv4Address(length=15), nullable=False
-        ),
+        sa.Column("source_ip", sa.String(length=15), nullable=False),
+        sa.Column("destination_ip", sa.String(length=15), nullable=False),
         sa.Column("destination_port", sa.Integer(), nullable=False),
         sa.Column(
             "protocol",
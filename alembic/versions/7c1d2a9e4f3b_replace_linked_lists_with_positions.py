@@ -0,0 +1,139 @@
+"""Replace next_policy_id and next_rule_id linked lists with positions
+
+Revision ID: 7c1d2a9e4f3b
+Revises: 50f03f459df6
+Create Date: 2026-10-18 09:12:41.503117
+
+"""
+
+from typing import Optional, Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c1d2a9e4f3b"
+down_revision: Union[str, None] = "50f03f459df6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+POSITION_GAP = 1 << 16
+
+# (table, parent column, linked list column)
+ORDERED_TABLES = (
+    ("filtering_policy", "firewall_id", "next_policy_id"),
+    ("rule", "filtering_policy_id", "next_rule_id"),
+)
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    for table_name, parent_column, next_column in ORDERED_TABLES:
+        op.add_column(
+            table_name,
+            sa.Column("position", sa.BigInteger(), nullable=False, server_default="0"),
+        )
+
+        table = sa.table(
+            table_name,
+            sa.column("id"),
+            sa.column(parent_column),
+            sa.column(next_column),
+            sa.column("position"),
+        )
+        rows = connection.execute(
+            sa.select(table.c.id, table.c[parent_column], table.c[next_column])
+        ).all()
+
+        positions = [
+            {"row_id": id, "position": (rank + 1) * POSITION_GAP}
+            for ordered_ids in _walk_linked_lists(rows).values()
+            for rank, id in enumerate(ordered_ids)
+        ]
+        if positions:
+            connection.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam("row_id"))
+                .values(position=sa.bindparam("position")),
+                positions,
+            )
+
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.alter_column("position", server_default=None)
+            batch_op.drop_column(next_column)
+            batch_op.create_index(
+                f"ix_{table_name}_{parent_column}_position",
+                [parent_column, "position"],
+            )
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+
+    for table_name, parent_column, next_column in reversed(ORDERED_TABLES):
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_index(f"ix_{table_name}_{parent_column}_position")
+            batch_op.add_column(sa.Column(next_column, sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(
+                f"fk_{table_name}_{next_column}", table_name, [next_column], ["id"]
+            )
+
+        table = sa.table(
+            table_name,
+            sa.column("id"),
+            sa.column(parent_column),
+            sa.column(next_column),
+            sa.column("position"),
+        )
+        rows = connection.execute(
+            sa.select(table.c.id, table.c[parent_column]).order_by(
+                table.c[parent_column], table.c.position, table.c.id
+            )
+        ).all()
+
+        next_ids = [
+            {"row_id": id, "next_id": next_row[0]}
+            for (id, parent_id), next_row in zip(rows, rows[1:])
+            if next_row[1] == parent_id
+        ]
+        if next_ids:
+            connection.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam("row_id"))
+                .values({next_column: sa.bindparam("next_id")}),
+                next_ids,
+            )
+
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column("position")
+
+
+def _walk_linked_lists(
+    rows: Sequence[tuple[int, int, Optional[int]]]
+) -> dict[int, list[int]]:
+    """Order the ids of every parent following the next id links."""
+    rows_by_parent: dict[int, dict[int, Optional[int]]] = {}
+    for id, parent_id, next_id in rows:
+        rows_by_parent.setdefault(parent_id, {})[id] = next_id
+
+    ordered_ids_by_parent = {}
+    for parent_id, next_id_by_id in rows_by_parent.items():
+        linked_ids = set(next_id_by_id.values())
+        ordered_ids = []
+        visited = set()
+
+        for id in sorted(next_id_by_id):
+            if id in linked_ids:
+                continue
+            while id is not None and id in next_id_by_id and id not in visited:
+                visited.add(id)
+                ordered_ids.append(id)
+                id = next_id_by_id[id]
+
+        # Rows out of any chain (broken links or cycles) are kept at the end
+        ordered_ids.extend(id for id in sorted(next_id_by_id) if id not in visited)
+        ordered_ids_by_parent[parent_id] = ordered_ids
+
+    return ordered_ids_by_parent
@@ -0,0 +1,45 @@
+"""Add firewall revision
+
+Revision ID: 9e4b6f0a2c15
+Revises: 7c1d2a9e4f3b
+Create Date: 2026-10-18 15:20:07.318562
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4b6f0a2c15"
+down_revision: Union[str, None] = "7c1d2a9e4f3b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("firewall") as batch_op:
+        batch_op.add_column(
+            sa.Column("revision", sa.Integer(), nullable=False, server_default="0")
+        )
+
+    # SQLite rebuilds the table with AUTOINCREMENT so that ids of deleted
+    # firewalls are never reused, like the sequences of other databases
+    with op.batch_alter_table(
+        "firewall",
+        recreate=_sqlite_recreate(),
+        table_kwargs={"sqlite_autoincrement": True},
+    ) as batch_op:
+        batch_op.alter_column("revision", server_default=None)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("firewall", recreate=_sqlite_recreate()) as batch_op:
+        batch_op.drop_column("revision")
+
+
+def _sqlite_recreate() -> str:
+    """Rebuild the table on SQLite only, other databases have foreign keys to it."""
+    return "always" if op.get_bind().dialect.name == "sqlite" else "auto"
@@ -0,0 +1,295 @@
+"""Add configuration history
+
+Revision ID: a7e3c9d51b26
+Revises: 4f8c2a61d9e7
+Create Date: 2026-10-18 21:05:43.918204
+
+"""
+
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a7e3c9d51b26"
+down_revision: Union[str, None] = "4f8c2a61d9e7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The column of the versions holding the row's id, the firewall of a row (OLD
+# or NEW) and the columns copied from the row, by versioned table
+HISTORIES = {
+    "filtering_policy": (
+        "filtering_policy_id",
+        "{row}.firewall_id",
+        ("name", "position"),
+    ),
+    "rule": (
+        "rule_id",
+        "(SELECT firewall_id FROM filtering_policy WHERE id = {row}.filtering_policy_id)",
+        (
+            "filtering_policy_id",
+            "name",
+            "source_ip",
+            "source_ip_end",
+            "destination_ip",
+            "destination_ip_end",
+            "destination_port",
+            "destination_port_end",
+            "protocol",
+            "action",
+            "position",
+        ),
+    ),
+}
+
+# The current time in UTC, in the format of the DateTime columns
+NOW = {
+    "sqlite": "strftime('%Y-%m-%d %H:%M:%f000', 'now')",
+    "postgresql": "clock_timestamp() AT TIME ZONE 'UTC'",
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect not in NOW:
+        raise NotImplementedError(
+            f"The configuration history has no triggers for {dialect}"
+        )
+
+    op.create_table(
+        "firewall_revision",
+        sa.Column("firewall_id", sa.Integer(), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.Column("changed_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["firewall_id"], ["firewall.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("firewall_id", "revision"),
+    )
+    op.create_index(
+        "ix_firewall_revision_firewall_id_changed_at",
+        "firewall_revision",
+        ["firewall_id", "changed_at"],
+    )
+
+    op.create_table(
+        "filtering_policy_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("filtering_policy_id", sa.Integer(), nullable=False),
+        sa.Column("firewall_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("position", sa.BigInteger(), nullable=False),
+        sa.Column("valid_from", sa.Integer(), nullable=False),
+        sa.Column("valid_to", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["firewall_id"], ["firewall.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "rule_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("rule_id", sa.Integer(), nullable=False),
+        sa.Column("firewall_id", sa.Integer(), nullable=False),
+        sa.Column("filtering_policy_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=50), nullable=True),
+        sa.Column("source_ip", sa.BigInteger(), nullable=False),
+        sa.Column("source_ip_end", sa.BigInteger(), nullable=False),
+        sa.Column("destination_ip", sa.BigInteger(), nullable=False),
+        sa.Column("destination_ip_end", sa.BigInteger(), nullable=False),
+        sa.Column("destination_port", sa.Integer(), nullable=False),
+        sa.Column("destination_port_end", sa.Integer(), nullable=False),
+        sa.Column(
+            "protocol",
+            sa.Enum("ANY", "TCP", "UDP", "ICMP", name="protocol").with_variant(
+                postgresql.ENUM(name="protocol", create_type=False), "postgresql"
+            ),
+            nullable=False,
+        ),
+        sa.Column(
+            "action",
+            sa.Enum("DENY", "ALLOW", name="ruleaction").with_variant(
+                postgresql.ENUM(name="ruleaction", create_type=False), "postgresql"
+            ),
+            nullable=False,
+        ),
+        sa.Column("position", sa.BigInteger(), nullable=False),
+        sa.Column("valid_from", sa.Integer(), nullable=False),
+        sa.Column("valid_to", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["firewall_id"], ["firewall.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    for table, (id_column, _, _) in HISTORIES.items():
+        op.create_index(
+            f"ix_{table}_version_{id_column}", f"{table}_version", [id_column]
+        )
+        op.create_index(
+            f"ix_{table}_version_firewall_id_valid_from",
+            f"{table}_version",
+            ["firewall_id", "valid_from"],
+        )
+
+    # The current configurations are the first versions of the history
+    op.execute(
+        sa.text(
+            "INSERT INTO firewall_revision (firewall_id, revision, changed_at) "
+            "SELECT id, revision, :changed_at FROM firewall"
+        ).bindparams(changed_at=datetime.now(timezone.utc).replace(tzinfo=None))
+    )
+    op.execute(
+        "INSERT INTO filtering_policy_version "
+        "(filtering_policy_id, firewall_id, name, position, valid_from) "
+        "SELECT filtering_policy.id, firewall.id, filtering_policy.name, "
+        "filtering_policy.position, firewall.revision "
+        "FROM filtering_policy "
+        "JOIN firewall ON firewall.id = filtering_policy.firewall_id"
+    )
+    rule_columns = HISTORIES["rule"][2]
+    op.execute(
+        f"INSERT INTO rule_version (rule_id, firewall_id, {', '.join(rule_columns)}, "
+        "valid_from) "
+        f"SELECT rule.id, firewall.id, "
+        f"{', '.join(f'rule.{column}' for column in rule_columns)}, firewall.revision "
+        "FROM rule "
+        "JOIN filtering_policy ON filtering_policy.id = rule.filtering_policy_id "
+        "JOIN firewall ON firewall.id = filtering_policy.firewall_id"
+    )
+
+    # Triggers are dropped by SQLite when a batch operation recreates their
+    # table, they must be created again by the migration
+    if dialect == "postgresql":
+        _create_postgresql_triggers()
+    else:
+        _create_sqlite_triggers()
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        for table in ("firewall", *HISTORIES):
+            op.execute(f"DROP TRIGGER {table}_history ON {table}")
+            op.execute(f"DROP FUNCTION {table}_history()")
+    else:
+        for event in ("insert", "update"):
+            op.execute(f"DROP TRIGGER firewall_history_{event}")
+        for table in HISTORIES:
+            for event in ("insert", "update", "delete"):
+                op.execute(f"DROP TRIGGER {table}_history_{event}")
+
+    op.drop_table("rule_version")
+    op.drop_table("filtering_policy_version")
+    op.drop_table("firewall_revision")
+
+
+# Versions written by a transaction are dated with the revision its
+# bump_revision gives to the firewall, the current one plus one. A version
+# replaced in the transaction that wrote it never was part of a revision, it
+# is deleted instead of being closed. Updates leaving the versioned columns
+# unchanged write no version.
+
+
+def _create_sqlite_triggers() -> None:
+    # SQLite transactions write one at a time, the revision can't change
+    # between the triggers and the bump
+    record_revision = (
+        "INSERT INTO firewall_revision (firewall_id, revision, changed_at) "
+        f"VALUES (NEW.id, NEW.revision, {NOW['sqlite']});"
+    )
+    for event, condition in (
+        ("INSERT", ""),
+        ("UPDATE OF revision", "WHEN NEW.revision <> OLD.revision "),
+    ):
+        op.execute(
+            f"CREATE TRIGGER firewall_history_{event.split()[0].lower()} "
+            f"AFTER {event} ON firewall FOR EACH ROW {condition}"
+            f"BEGIN {record_revision} END"
+        )
+
+    for table, (id_column, firewall_id, columns) in HISTORIES.items():
+        next_revision = (
+            "(SELECT revision + 1 FROM firewall "
+            f"WHERE id = {firewall_id.format(row='OLD')})"
+        )
+        close_version = (
+            f"DELETE FROM {table}_version "
+            f"WHERE {id_column} = OLD.id AND valid_from = {next_revision}; "
+            f"UPDATE {table}_version SET valid_to = {next_revision} "
+            f"WHERE {id_column} = OLD.id AND valid_to IS NULL;"
+        )
+        open_version = (
+            f"INSERT INTO {table}_version "
+            f"({id_column}, firewall_id, {', '.join(columns)}, valid_from) "
+            f"SELECT NEW.id, id, {', '.join(f'NEW.{column}' for column in columns)}, "
+            f"revision + 1 FROM firewall WHERE id = {firewall_id.format(row='NEW')};"
+        )
+
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+
+        for event, condition, body in (
+            ("INSERT", "", open_version),
+            ("UPDATE", f"WHEN {changed} ", close_version + " " + open_version),
+            ("DELETE", "", close_version),
+        ):
+            op.execute(
+                f"CREATE TRIGGER {table}_history_{event.lower()} "
+                f"AFTER {event} ON {table} FOR EACH ROW {condition}"
+                f"BEGIN {body} END"
+            )
+
+
+def _create_postgresql_triggers() -> None:
+    op.execute(
+        "CREATE FUNCTION firewall_history() RETURNS trigger AS $$ "
+        "BEGIN "
+        "IF TG_OP = 'INSERT' OR NEW.revision <> OLD.revision THEN "
+        "INSERT INTO firewall_revision (firewall_id, revision, changed_at) "
+        f"VALUES (NEW.id, NEW.revision, {NOW['postgresql']}); "
+        "END IF; "
+        "RETURN NULL; "
+        "END $$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER firewall_history AFTER INSERT OR UPDATE OF revision "
+        "ON firewall FOR EACH ROW EXECUTE FUNCTION firewall_history()"
+    )
+
+    for table, (id_column, firewall_id, columns) in HISTORIES.items():
+        # The firewall stays locked until the transaction commits, so a
+        # concurrent transaction reads the revision once it is bumped
+        lock_firewall = (
+            "SELECT revision + 1 INTO next_revision FROM firewall "
+            "WHERE id = {firewall_id} FOR UPDATE; "
+        )
+        old_columns, new_columns = (
+            ", ".join(f"{row}.{column}" for column in columns) for row in ("OLD", "NEW")
+        )
+        op.execute(
+            f"CREATE FUNCTION {table}_history() RETURNS trigger AS $$ "
+            "DECLARE next_revision integer; "
+            "BEGIN "
+            "IF TG_OP = 'UPDATE' "
+            f"AND ({old_columns}) IS NOT DISTINCT FROM ({new_columns}) THEN "
+            "RETURN NULL; "
+            "END IF; "
+            "IF TG_OP <> 'INSERT' THEN "
+            + lock_firewall.format(firewall_id=firewall_id.format(row="OLD"))
+            + f"DELETE FROM {table}_version "
+            f"WHERE {id_column} = OLD.id AND valid_from = next_revision; "
+            f"UPDATE {table}_version SET valid_to = next_revision "
+            f"WHERE {id_column} = OLD.id AND valid_to IS NULL; "
+            "END IF; "
+            "IF TG_OP <> 'DELETE' THEN "
+            + lock_firewall.format(firewall_id=firewall_id.format(row="NEW"))
+            + f"INSERT INTO {table}_version "
+            f"({id_column}, firewall_id, {', '.join(columns)}, valid_from) "
+            f"VALUES (NEW.id, {firewall_id.format(row='NEW')}, "
+            f"{new_columns}, next_revision); "
+            "END IF; "
+            "RETURN NULL; "
+            "END $$ LANGUAGE plpgsql"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_history "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_history()"
+        )
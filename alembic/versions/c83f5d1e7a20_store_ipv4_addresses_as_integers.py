@@ -0,0 +1,116 @@
+"""Store IPv4 addresses as integers
+
+Revision ID: c83f5d1e7a20
+Revises: 9e4b6f0a2c15
+Create Date: 2026-10-18 15:41:53.702931
+
+"""
+
+from ipaddress import IPv4Address
+from typing import Callable, Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c83f5d1e7a20"
+down_revision: Union[str, None] = "9e4b6f0a2c15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, address columns, table options kept when SQLite rebuilds the table)
+ADDRESS_COLUMNS = (
+    ("firewall", ("ip_address",), {"sqlite_autoincrement": True}),
+    ("rule", ("source_ip", "destination_ip"), {}),
+)
+
+ADDRESS_INDEXES = (
+    ("ix_rule_source_ip", "rule", "source_ip"),
+    ("ix_rule_destination_ip", "rule", "destination_ip"),
+)
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    for table_name, column_names, table_kwargs in ADDRESS_COLUMNS:
+        # SQLite stores the integers as text until the column type changes
+        _convert_addresses(
+            connection,
+            table_name,
+            column_names,
+            lambda address: int(IPv4Address(address)),
+        )
+
+        # SQLite rebuilds the table, other databases alter the column in place
+        with op.batch_alter_table(table_name, table_kwargs=table_kwargs) as batch_op:
+            for column_name in column_names:
+                batch_op.alter_column(
+                    column_name,
+                    existing_type=sa.String(length=15),
+                    type_=sa.BigInteger(),
+                    existing_nullable=False,
+                    postgresql_using=f"{column_name}::bigint",
+                )
+
+    for index_name, table_name, column_name in ADDRESS_INDEXES:
+        op.create_index(index_name, table_name, [column_name])
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+
+    for index_name, table_name, _ in ADDRESS_INDEXES:
+        op.drop_index(index_name, table_name)
+
+    for table_name, column_names, table_kwargs in ADDRESS_COLUMNS:
+        with op.batch_alter_table(table_name, table_kwargs=table_kwargs) as batch_op:
+            for column_name in column_names:
+                batch_op.alter_column(
+                    column_name,
+                    existing_type=sa.BigInteger(),
+                    type_=sa.String(length=15),
+                    existing_nullable=False,
+                )
+
+        _convert_addresses(
+            connection,
+            table_name,
+            column_names,
+            lambda address: str(IPv4Address(int(address))),
+        )
+
+
+def _convert_addresses(
+    connection: sa.Connection,
+    table_name: str,
+    column_names: Sequence[str],
+    convert: Callable[[Union[str, int]], Union[str, int]],
+) -> None:
+    table = sa.table(
+        table_name,
+        sa.column("id"),
+        *(sa.column(column_name) for column_name in column_names),
+    )
+    rows = connection.execute(
+        sa.select(table.c.id, *(table.c[name] for name in column_names))
+    ).all()
+    if not rows:
+        return
+
+    connection.execute(
+        table.update()
+        .where(table.c.id == sa.bindparam("row_id"))
+        .values({name: sa.bindparam(f"new_{name}") for name in column_names}),
+        [
+            {
+                "row_id": row[0],
+                **{
+                    f"new_{name}": convert(address)
+                    for name, address in zip(column_names, row[1:])
+                },
+            }
+            for row in rows
+        ],
+    )
@@ -0,0 +1,133 @@
+"""Add address prefixes and port ranges to rules
+
+Revision ID: e51a7b93c0d4
+Revises: c83f5d1e7a20
+Create Date: 2026-10-18 16:07:29.448150
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e51a7b93c0d4"
+down_revision: Union[str, None] = "c83f5d1e7a20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (range start column, range end column)
+RANGE_COLUMNS = (
+    ("source_ip", "source_ip_end"),
+    ("destination_ip", "destination_ip_end"),
+    ("destination_port", "destination_port_end"),
+)
+
+# Addresses are unsigned 32 bits integers, too large for a signed INTEGER
+END_COLUMN_TYPES = {
+    "source_ip_end": sa.BigInteger,
+    "destination_ip_end": sa.BigInteger,
+    "destination_port_end": sa.Integer,
+}
+
+# Names the unnamed unique constraint of the rule table so SQLite can drop it,
+# other databases name it themselves
+NAMING_CONVENTION = {"uq": "uq_%(table_name)s_%(column_0_name)s"}
+UNIQUE_CONSTRAINT_NAME = "uq_rule_filtering_policy_id"
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("rule") as batch_op:
+        for _, end_column in RANGE_COLUMNS:
+            batch_op.add_column(
+                sa.Column(end_column, END_COLUMN_TYPES[end_column](), nullable=True)
+            )
+
+    rule = sa.table(
+        "rule", *(sa.column(column) for columns in RANGE_COLUMNS for column in columns)
+    )
+    op.execute(
+        rule.update().values(
+            {
+                end_column: rule.c[start_column]
+                for start_column, end_column in RANGE_COLUMNS
+            }
+        )
+    )
+
+    unique_constraint_name = _unique_constraint_name()
+    with op.batch_alter_table(
+        "rule", recreate=_sqlite_recreate(), naming_convention=NAMING_CONVENTION
+    ) as batch_op:
+        for _, end_column in RANGE_COLUMNS:
+            batch_op.alter_column(
+                end_column,
+                existing_type=END_COLUMN_TYPES[end_column](),
+                nullable=False,
+            )
+        batch_op.drop_constraint(unique_constraint_name, type_="unique")
+        batch_op.create_unique_constraint(
+            UNIQUE_CONSTRAINT_NAME,
+            [
+                "filtering_policy_id",
+                *(column for columns in RANGE_COLUMNS for column in columns),
+                "protocol",
+            ],
+        )
+        for start_column, end_column in RANGE_COLUMNS:
+            batch_op.create_index(
+                f"ix_rule_filtering_policy_id_{start_column}_range",
+                ["filtering_policy_id", start_column, end_column],
+            )
+
+
+def downgrade() -> None:
+    # Rules on prefixes or port ranges can't be represented anymore
+    rule = sa.table(
+        "rule", *(sa.column(column) for columns in RANGE_COLUMNS for column in columns)
+    )
+    op.execute(
+        rule.delete().where(
+            sa.or_(
+                *(
+                    rule.c[start_column] != rule.c[end_column]
+                    for start_column, end_column in RANGE_COLUMNS
+                )
+            )
+        )
+    )
+
+    with op.batch_alter_table(
+        "rule", recreate=_sqlite_recreate(), naming_convention=NAMING_CONVENTION
+    ) as batch_op:
+        for start_column, _ in RANGE_COLUMNS:
+            batch_op.drop_index(f"ix_rule_filtering_policy_id_{start_column}_range")
+        batch_op.drop_constraint(UNIQUE_CONSTRAINT_NAME, type_="unique")
+        batch_op.create_unique_constraint(
+            UNIQUE_CONSTRAINT_NAME,
+            [
+                "filtering_policy_id",
+                "source_ip",
+                "destination_ip",
+                "destination_port",
+                "protocol",
+            ],
+        )
+        for _, end_column in RANGE_COLUMNS:
+            batch_op.drop_column(end_column)
+
+
+def _sqlite_recreate() -> str:
+    """Rebuild the table on SQLite only, other databases alter it in place."""
+    return "always" if op.get_bind().dialect.name == "sqlite" else "auto"
+
+
+def _unique_constraint_name() -> str:
+    """Find the name the database gave to the rule table's unique constraint."""
+    for constraint in sa.inspect(op.get_bind()).get_unique_constraints("rule"):
+        if constraint["name"] is not None:
+            return constraint["name"]
+
+    return UNIQUE_CONSTRAINT_NAME
@@ -0,0 +1,38 @@
+"""In-process caches of data loaded from the database"""
+
+from .decision_cache import (
+    CachedDecision,
+    add_decision,
+    decision_cache,
+    find_decision,
+)
+from .firewall_configuration import (
+    FirewallConfiguration,
+    async_get_configuration,
+    async_get_snapshot,
+    cached_configuration,
+    configuration_cache,
+    get_configuration,
+    get_snapshot,
+    snapshot_cache,
+    snapshot_configuration,
+)
+from .lru_cache import CacheStats, LRUCache
+
+__all__ = [
+    "CacheStats",
+    "CachedDecision",
+    "FirewallConfiguration",
+    "LRUCache",
+    "add_decision",
+    "async_get_configuration",
+    "async_get_snapshot",
+    "cached_configuration",
+    "configuration_cache",
+    "decision_cache",
+    "find_decision",
+    "get_configuration",
+    "get_snapshot",
+    "snapshot_cache",
+    "snapshot_configuration",
+]
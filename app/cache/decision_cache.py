@@ -0,0 +1,72 @@
+"""
+Cache of the decisions of single flows.
+
+Decisions are keyed by the flow and the firewall's id and revision. Any change
+of the firewall's configuration bumps its revision, so the decisions of the
+previous revision are never found again and age out of the cache, there is no
+explicit invalidation.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import NamedTuple, Optional
+
+from app.evaluation import Flow
+
+from .firewall_configuration import FirewallConfiguration
+from .lru_cache import LRUCache
+
+DECISION_CACHE_SIZE = 65_536
+
+
+class CachedDecision(NamedTuple):
+    rule_id: Optional[int]
+    # The decision as a JSON document
+    decision: str
+
+
+decision_cache: LRUCache[tuple[int, int, Flow], CachedDecision] = LRUCache(
+    DECISION_CACHE_SIZE
+)
+
+
+def find_decision(
+    firewall_id: int, revision: int, flow: Flow
+) -> Optional[CachedDecision]:
+    """
+    Find the cached decision of a flow.
+
+    :param firewall_id: The firewall's id
+    :param revision: The firewall's revision
+    :param flow: The flow
+
+    :return: The decision, None if it isn't cached
+    """
+    return decision_cache.get((firewall_id, revision, flow))
+
+
+def add_decision(
+    configuration: FirewallConfiguration, flow: Flow
+) -> Optional[CachedDecision]:
+    """
+    Evaluate a flow against a configuration and cache its decision.
+
+    :param configuration: The configuration, loaded with its rules
+    :param flow: The flow
+
+    :return: The decision, None if the firewall was deleted
+    """
+    compiled_firewall = configuration.compiled
+    if compiled_firewall is None:
+        return None
+
+    action, rule_id = compiled_firewall.evaluate(flow)
+    decision = CachedDecision(
+        rule_id, json.dumps({"action": action.name, "rule_id": rule_id})
+    )
+    decision_cache.put(
+        (configuration.firewall_id, configuration.revision, flow), decision
+    )
+
+    return decision
@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+from datetime import datetime
+from functools import cached_property
+from itertools import islice
+from typing import Awaitable, Callable, Iterator, Optional, Union
+
+from sqlalchemy import Row
+
+from app.db.repositories import AsyncFirewallRepository, FirewallRepository
+from app.evaluation import (
+    CompiledFirewall,
+    attach_compiled_firewall,
+    publish_compiled_firewall,
+)
+from app.serialization import (
+    RULESET_RENDERERS,
+    add_members,
+    array_fragment,
+    filtering_policy_fragment,
+    firewall_fragment,
+    rule_fragment,
+)
+
+from .lru_cache import LRUCache
+
+CONFIGURATION_CACHE_SIZE = 128
+SNAPSHOT_CACHE_SIZE = 32
+RULESET_CHUNK_LINES = 1000
+
+
+class FirewallConfiguration:
+    """
+    Views of a firewall's configuration at a given revision.
+
+    Each view is loaded from the database the first time it is used, then
+    kept as long as the configuration stays in the cache. Views are JSON
+    documents serialized from Core rows, the firewall and filtering policy
+    fragments are serialized once and shared by the documents embedding them.
+    Rulesets rendered for devices are kept the same way once fully rendered.
+    The current filtering policies and rules are only kept when the firewall
+    is still at the revision once they are read, else the revision's ones are
+    read from the history, so the views never mix revisions. When the firewall
+    was deleted after its revision was read, the views are None or empty.
+
+    Snapshots read the filtering policies and rules from the history, so they
+    can be built for any past revision. The firewall's name and address
+    aren't versioned, they are the current ones.
+    """
+
+    def __init__(self, firewall_id: int, revision: int, snapshot: bool = False) -> None:
+        """
+        :param firewall_id: The firewall's id
+        :param revision: The firewall's revision
+        :param snapshot: Read the configuration from the history, else from the
+            current filtering policies and rules
+        """
+        self.firewall_id = firewall_id
+        self.revision = revision
+        self.snapshot = snapshot
+        self._rulesets: dict[str, list[bytes]] = {}
+
+    @cached_property
+    def firewall(self) -> Optional[str]:
+        """The firewall without its filtering policies"""
+        if self._firewall_row is None:
+            return None
+
+        return firewall_fragment(self._firewall_row)
+
+    @cached_property
+    def filtering_policies(self) -> Optional[str]:
+        """The firewall with its ordered filtering policies"""
+        if self.firewall is None:
+            return None
+
+        return add_members(
+            self.firewall,
+            filtering_policies=array_fragment(
+                self._filtering_policy_fragments.values()
+            ),
+        )
+
+    @cached_property
+    def filtering_policies_by_id(self) -> dict[int, str]:
+        """The filtering policies with their firewall, by id"""
+        if self.firewall is None:
+            return {}
+
+        return {
+            id: add_members(fragment, firewall=self.firewall)
+            for id, fragment in self._filtering_policy_fragments.items()
+        }
+
+    @cached_property
+    def filtering_policies_with_rules_by_id(self) -> dict[int, str]:
+        """The filtering policies with their firewall and ordered rules, by id"""
+        return {
+            id: add_members(fragment, rules=array_fragment(rule_fragments))
+            for (id, fragment), rule_fragments in zip(
+                self.filtering_policies_by_id.items(), self._rule_fragments.values()
+            )
+        }
+
+    @cached_property
+    def configuration(self) -> Optional[str]:
+        """
+        The firewall with its revision and its ordered filtering policies and
+        rules
+        """
+        if self.firewall is None:
+            return None
+
+        return add_members(
+            self.firewall,
+            revision=str(self.revision),
+            filtering_policies=array_fragment(
+                add_members(fragment, rules=array_fragment(rule_fragments))
+                for fragment, rule_fragments in zip(
+                    self._filtering_policy_fragments.values(),
+                    self._rule_fragments.values(),
+                )
+            ),
+        )
+
+    @cached_property
+    def compiled(self) -> Optional[CompiledFirewall]:
+        """The compiled firewall, shared with the other processes if enabled"""
+        compiled_firewall = attach_compiled_firewall(self.firewall_id, self.revision)
+        if compiled_firewall is not None:
+            return compiled_firewall
+
+        if self._firewall_row is None:
+            return None
+
+        compiled_firewall = CompiledFirewall.from_rules(
+            self.firewall_id, self._rule_rows
+        )
+        # Publishing an older revision would remove the segments of the newer
+        # ones until they are compiled again
+        if self.snapshot:
+            return compiled_firewall
+
+        return publish_compiled_firewall(compiled_firewall, self.revision)
+
+    def ruleset(self, format: str) -> Iterator[bytes]:
+        """
+        Render the configuration as a ruleset loadable by devices.
+
+        The first pull of a format renders the ruleset while it is sent, the
+        chunks are kept once it is complete and sent as is by the next pulls.
+        The rows are read before returning, so the chunks can be sent after
+        the end of the unit of work.
+
+        :param format: The format, a key of RULESET_RENDERERS
+
+        :return: The ruleset's UTF-8 chunks
+        """
+        chunks = self._rulesets.get(format)
+        if chunks is not None:
+            return iter(chunks)
+
+        return self._render_ruleset(
+            format, self._firewall_row, self._filtering_policy_rows, self._rule_rows
+        )
+
+    async def load(self, with_rules: bool = False) -> FirewallConfiguration:
+        """
+        Load the rows the views are built from with the async repository.
+
+        Views used from a coroutine must be loaded first, so they don't query
+        the database from the event loop.
+
+        :param with_rules: Load the rules too, needed by the
+            filtering_policies_with_rules_by_id, configuration and compiled
+            views
+
+        :return: The configuration
+        """
+        if "_firewall_row" not in self.__dict__:
+            self._firewall_row = await AsyncFirewallRepository.find_row(
+                self.firewall_id
+            )
+        if "_filtering_policy_rows" not in self.__dict__:
+            self._filtering_policy_rows = await self._async_find_rows(
+                AsyncFirewallRepository.find_filtering_policy_rows
+            )
+        if with_rules and "_rule_rows" not in self.__dict__:
+            self._rule_rows = await self._async_find_rows(
+                AsyncFirewallRepository.find_rule_rows
+            )
+
+        return self
+
+    def _render_ruleset(
+        self,
+        format: str,
+        firewall: Row,
+        filtering_policies: list[Row],
+        rules: list[Row],
+    ) -> Iterator[bytes]:
+        lines = RULESET_RENDERERS[format](firewall, filtering_policies, rules)
+        chunks = []
+        while chunk := "".join(islice(lines, RULESET_CHUNK_LINES)):
+            chunks.append(chunk.encode())
+            yield chunks[-1]
+
+        self._rulesets[format] = chunks
+
+    @cached_property
+    def _filtering_policy_fragments(self) -> dict[int, str]:
+        return {
+            filtering_policy.id: filtering_policy_fragment(filtering_policy)
+            for filtering_policy in self._filtering_policy_rows
+        }
+
+    @cached_property
+    def _rule_fragments(self) -> dict[int, list[str]]:
+        # The rules of each filtering policy, in the filtering policies' order
+        rule_fragments = {id: [] for id in self._filtering_policy_fragments}
+        for rule in self._rule_rows:
+            if rule.filtering_policy_id in rule_fragments:
+                rule_fragments[rule.filtering_policy_id].append(rule_fragment(rule))
+
+        return rule_fragments
+
+    def _find_rows(
+        self, find_rows: Callable[[int, Optional[int]], list[Row]]
+    ) -> list[Row]:
+        # The revision is read after the rows: when it didn't move, no change
+        # was committed before the rows were read
+        if not self.snapshot:
+            rows = find_rows(self.firewall_id, None)
+            if FirewallRepository.find_revision(self.firewall_id) == self.revision:
+                return rows
+
+        return find_rows(self.firewall_id, self.revision)
+
+    async def _async_find_rows(
+        self, find_rows: Callable[[int, Optional[int]], Awaitable[list[Row]]]
+    ) -> list[Row]:
+        if not self.snapshot:
+            rows = await find_rows(self.firewall_id, None)
+            revision = await AsyncFirewallRepository.find_revision(self.firewall_id)
+            if revision == self.revision:
+                return rows
+
+        return await find_rows(self.firewall_id, self.revision)
+
+    @cached_property
+    def _firewall_row(self) -> Optional[Row]:
+        return FirewallRepository.find_row(self.firewall_id)
+
+    @cached_property
+    def _filtering_policy_rows(self) -> list[Row]:
+        return self._find_rows(FirewallRepository.find_filtering_policy_rows)
+
+    @cached_property
+    def _rule_rows(self) -> list[Row]:
+        return self._find_rows(FirewallRepository.find_rule_rows)
+
+
+configuration_cache: LRUCache[tuple[int, int], FirewallConfiguration] = LRUCache(
+    CONFIGURATION_CACHE_SIZE
+)
+# Snapshots of past revisions, kept apart so they don't evict the current
+# configurations
+snapshot_cache: LRUCache[tuple[int, int], FirewallConfiguration] = LRUCache(
+    SNAPSHOT_CACHE_SIZE
+)
+
+
+def get_configuration(firewall_id: int) -> Optional[FirewallConfiguration]:
+    """
+    Find the current configuration of a firewall.
+
+    Only the firewall's revision is read from the database, the configuration
+    is reloaded when it changed.
+
+    :param firewall_id: The firewall's id
+
+    :return: The configuration, None if there is no firewall with this id
+    """
+    revision = FirewallRepository.find_revision(firewall_id)
+    if revision is None:
+        return None
+
+    return cached_configuration(firewall_id, revision)
+
+
+async def async_get_configuration(
+    firewall_id: int, with_rules: bool = False
+) -> Optional[FirewallConfiguration]:
+    """
+    Find the current configuration of a firewall with the async repository.
+
+    :param firewall_id: The firewall's id
+    :param with_rules: Load the firewall with its rules
+
+    :return: The loaded configuration, None if there is no firewall with this id
+    """
+    revision = await AsyncFirewallRepository.find_revision(firewall_id)
+    if revision is None:
+        return None
+
+    return await cached_configuration(firewall_id, revision).load(with_rules)
+
+
+def cached_configuration(firewall_id: int, revision: int) -> FirewallConfiguration:
+    """
+    Find the configuration of a firewall at a revision already read.
+
+    :param firewall_id: The firewall's id
+    :param revision: The firewall's revision
+
+    :return: The configuration
+    """
+    return configuration_cache.get_or_add(
+        (firewall_id, revision), lambda: FirewallConfiguration(firewall_id, revision)
+    )
+
+
+def snapshot_configuration(firewall_id: int, revision: int) -> FirewallConfiguration:
+    """
+    Find the configuration of a firewall at a past revision.
+
+    :param firewall_id: The firewall's id
+    :param revision: The revision, found with find_snapshot_revision
+
+    :return: The configuration read from the history
+    """
+    return snapshot_cache.get_or_add(
+        (firewall_id, revision),
+        lambda: FirewallConfiguration(firewall_id, revision, snapshot=True),
+    )
+
+
+def get_snapshot(
+    firewall_id: int, at: Union[int, datetime]
+) -> Optional[FirewallConfiguration]:
+    """
+    Find the configuration of a firewall at a revision or a time.
+
+    :param firewall_id: The firewall's id
+    :param at: The revision, or the time in UTC
+
+    :return: The configuration, None if the firewall had no such revision or
+        none at this time
+    """
+    revision = FirewallRepository.find_snapshot_revision(firewall_id, at)
+    if revision is None:
+        return None
+
+    return snapshot_configuration(firewall_id, revision)
+
+
+async def async_get_snapshot(
+    firewall_id: int, at: Union[int, datetime], with_rules: bool = False
+) -> Optional[FirewallConfiguration]:
+    """
+    Find the configuration of a firewall at a revision or a time with the async
+    repository.
+
+    :param firewall_id: The firewall's id
+    :param at: The revision, or the time in UTC
+    :param with_rules: Load the configuration with its rules
+
+    :return: The loaded configuration, None if the firewall had no such
+        revision or none at this time
+    """
+    revision = await AsyncFirewallRepository.find_snapshot_revision(firewall_id, at)
+    if revision is None:
+        return None
+
+    return await snapshot_configuration(firewall_id, revision).load(with_rules)
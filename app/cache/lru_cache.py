@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Hashable, NamedTuple, Optional, TypeVar
+
+Key = TypeVar("Key", bound=Hashable)
+Value = TypeVar("Value")
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class LRUCache(Generic[Key, Value]):
+    """
+    Thread-safe mapping holding at most maxsize entries.
+
+    When full, adding an entry evicts the least recently used one.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Key, Value] = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Key) -> Optional[Value]:
+        """
+        Find an entry and mark it as the most recently used one.
+
+        :param key: The entry's key
+
+        :return: The entry's value, None if there is no entry with this key
+        """
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            return self._entries[key]
+
+    def get_or_add(self, key: Key, factory: Callable[[], Value]) -> Value:
+        """
+        Find an entry, adding it if there is none.
+
+        :param key: The entry's key
+        :param factory: Builds the entry's value on a miss, it is called with
+            the cache locked so it must be cheap
+
+        :return: The entry's value
+        """
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self._misses += 1
+                value = self._entries[key] = factory()
+                self._evict()
+                return value
+
+            self._hits += 1
+            return self._entries[key]
+
+    def put(self, key: Key, value: Value) -> None:
+        """
+        Add or replace an entry.
+
+        :param key: The entry's key
+        :param value: The entry's value
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove every entry, the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                self._hits,
+                self._misses,
+                self._evictions,
+                len(self._entries),
+                self.maxsize,
+            )
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
@@ -1,20 +1,36 @@
 from __future__ import annotations
 
 import ipaddress
-from typing import Optional
+from typing import Optional, Union
 
 from sqlalchemy import types
+from sqlalchemy.engine import Dialect
 
 
 class IPv4Address(types.TypeDecorator):
-    impl = types.String(15)
+    """
+    IPv4 address stored as an unsigned 32 bits integer, in a 64 bits column as
+    PostgreSQL has no unsigned integers.
+
+    Addresses keep their numeric order, so equality and range comparisons are
+    answered by B-tree indexes, and loading one builds the IPv4Address from
+    its integer without parsing any string.
+    Bound values can be IPv4Address objects, dotted strings or integers.
+    """
+
+    impl = types.BigInteger
+    cache_ok = True
 
     def process_bind_param(
-        self, value: Optional[ipaddress.IPv4Address], dialect: Dialect
-    ) -> Optional[str]:
-        return value and str(value)
+        self, value: Optional[Union[ipaddress.IPv4Address, str, int]], dialect: Dialect
+    ) -> Optional[int]:
+        if value is None or isinstance(value, int):
+            return value
+        return int(ipaddress.IPv4Address(value))
 
     def process_result_value(
-        self, value: Optional[str], dialect: Dialect
+        self, value: Optional[int], dialect: Dialect
     ) -> Optional[ipaddress.IPv4Address]:
-        return value and ipaddress.IPv4Address(value)
+        if value is None:
+            return None
+        return ipaddress.IPv4Address(value)
@@ -2,6 +2,18 @@
 
 from .filtering_policy import FilteringPolicy
 from .firewall import Firewall
+from .history import FilteringPolicyVersion, FirewallRevision, RuleVersion
 from .rule import Protocol, Rule, RuleAction
+from .rule_hits import RuleHits
 
-__all__ = ["FilteringPolicy", "Firewall", "Protocol", "Rule", "RuleAction"]
+__all__ = [
+    "FilteringPolicy",
+    "FilteringPolicyVersion",
+    "Firewall",
+    "FirewallRevision",
+    "Protocol",
+    "Rule",
+    "RuleAction",
+    "RuleHits",
+    "RuleVersion",
+]
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List, Optional
+from typing import TYPE_CHECKING, List
 
-from sqlalchemy import ForeignKey, String, UniqueConstraint
+from sqlalchemy import BigInteger, ForeignKey, Index, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..base import Base
@@ -14,58 +14,23 @@ if TYPE_CHECKING:
 
 class FilteringPolicy(Base):
     __tablename__ = "filtering_policy"
-    __table_args__ = (UniqueConstraint("firewall_id", "name"),)
+    __table_args__ = (
+        UniqueConstraint("firewall_id", "name"),
+        Index("ix_filtering_policy_firewall_id_position", "firewall_id", "position"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     firewall_id: Mapped[int] = mapped_column(ForeignKey("firewall.id"))
     firewall: Mapped[Firewall] = relationship(
-        back_populates="_filtering_policies", lazy="joined"
+        back_populates="filtering_policies", lazy="joined"
     )
     name: Mapped[str] = mapped_column(String(50))
-    next_policy_id: Mapped[Optional[int]] = mapped_column(
-        ForeignKey("filtering_policy.id")
-    )
-    _rules: Mapped[List[Rule]] = relationship(
-        back_populates="filtering_policy", cascade="all, delete-orphan"
+    position: Mapped[int] = mapped_column(BigInteger)
+    rules: Mapped[List[Rule]] = relationship(
+        back_populates="filtering_policy",
+        cascade="all, delete-orphan",
+        order_by="(Rule.position, Rule.id)",
     )
-    _is_rules_list_ordered: bool = False
-
-    @property
-    def rules(self) -> list[Rule]:
-        """
-        Get the ordered rules list.
-
-        The first call to this method sorts the list
-        """
-        if not self._is_rules_list_ordered:
-            self._sort_rules_list()
-
-        return self._rules
-
-    @rules.setter
-    def rules(self, value: list[Rule]) -> None:
-        self._rules = value
-
-    def _sort_rules_list(self):
-        rules_by_id = {rule.id: rule for rule in self._rules}
-
-        non_first_rules_id = {
-            rule.next_rule_id for rule in self._rules if rule.next_rule_id is not None
-        }
-        try:
-            rule = [rule for rule in self._rules if rule.id not in non_first_rules_id][
-                0
-            ]
-        except IndexError:
-            rule = None
-        ordered_rules = []
-
-        while rule is not None:
-            ordered_rules.append(rule)
-            rule = rule.next_rule_id and rules_by_id[rule.next_rule_id]
-
-        self._rules = ordered_rules
-        self._is_rules_list_ordered = True
 
     def convert_to_json(
         self, show_firewall: bool = True, show_rules: bool = False
@@ -15,63 +15,22 @@ if TYPE_CHECKING:
 
 class Firewall(Base):
     __tablename__ = "firewall"
-    __table_args__ = (UniqueConstraint("ip_address", "port"),)
+    __table_args__ = (
+        UniqueConstraint("ip_address", "port"),
+        # Ids are never reused, so (id, revision) identifies a configuration
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50))
     ip_address: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
     port: Mapped[int] = mapped_column()
-    _filtering_policies: Mapped[List[FilteringPolicy]] = relationship(
-        back_populates="firewall", cascade="all, delete-orphan"
+    revision: Mapped[int] = mapped_column(default=0)
+    filtering_policies: Mapped[List[FilteringPolicy]] = relationship(
+        back_populates="firewall",
+        cascade="all, delete-orphan",
+        order_by="(FilteringPolicy.position, FilteringPolicy.id)",
     )
-    _is_filtering_policies_list_ordered: bool = False
-
-    @property
-    def filtering_policies(self) -> list[FilteringPolicy]:
-        """
-        Get the ordered filtering policies list.
-
-        The first call to this method sorts the list
-        """
-        if not self._is_filtering_policies_list_ordered:
-            self._sort_filtering_policies_list()
-
-        return self._filtering_policies
-
-    @filtering_policies.setter
-    def filtering_policies(self, value: list[FilteringPolicy]) -> None:
-        self._filtering_policies = value
-
-    def _sort_filtering_policies_list(self):
-        filtering_policies_by_id = {
-            filtering_policy.id: filtering_policy
-            for filtering_policy in self._filtering_policies
-        }
-
-        non_first_filtering_policies_id = {
-            filtering_policy.next_policy_id
-            for filtering_policy in self._filtering_policies
-            if filtering_policy.next_policy_id is not None
-        }
-        try:
-            filtering_policy = [
-                filtering_policy
-                for filtering_policy in self._filtering_policies
-                if filtering_policy.id not in non_first_filtering_policies_id
-            ][0]
-        except IndexError:
-            filtering_policy = None
-        ordered_filtering_policies = []
-
-        while filtering_policy is not None:
-            ordered_filtering_policies.append(filtering_policy)
-            filtering_policy = (
-                filtering_policy.next_policy_id
-                and filtering_policies_by_id[filtering_policy.next_policy_id]
-            )
-
-        self._filtering_policies = ordered_filtering_policies
-        self._is_filtering_policies_list_ordered = True
 
     def __eq__(self, value: object) -> bool:
         if value is None or not isinstance(value, Firewall):
@@ -0,0 +1,106 @@
+"""
+History of the firewalls' configurations.
+
+Every write to a filtering policy or a rule adds a version of the row, by
+triggers of the database (see the migration adding the history), so bulk
+statements are recorded like ORM changes and writes cost no other statement.
+Versions are valid for a range of revisions of their firewall, starting at
+the revision bump_revision gives to the transaction writing them. A row left
+unchanged by later revisions keeps a single version, so the history grows
+with the changes, whatever the size of the configuration, and the
+configuration at a revision is the versions valid at this revision.
+"""
+
+from datetime import datetime
+from ipaddress import IPv4Address
+from typing import Optional
+
+from sqlalchemy import BigInteger, Enum, ForeignKey, Index, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .. import custom_types
+from ..base import Base
+from .rule import Protocol, RuleAction
+
+
+class FirewallRevision(Base):
+    """
+    Time at which a revision of a firewall's configuration was made, recorded
+    by a trigger when the firewall is created or its revision bumped.
+    """
+
+    __tablename__ = "firewall_revision"
+    __table_args__ = (
+        Index(
+            "ix_firewall_revision_firewall_id_changed_at", "firewall_id", "changed_at"
+        ),
+    )
+
+    firewall_id: Mapped[int] = mapped_column(
+        ForeignKey("firewall.id", ondelete="CASCADE"), primary_key=True
+    )
+    revision: Mapped[int] = mapped_column(primary_key=True)
+    # In UTC
+    changed_at: Mapped[datetime]
+
+
+class FilteringPolicyVersion(Base):
+    """
+    Version of a filtering policy, valid from a revision of its firewall until
+    another one.
+
+    valid_to is None while the version is current.
+    """
+
+    __tablename__ = "filtering_policy_version"
+    __table_args__ = (
+        Index("ix_filtering_policy_version_filtering_policy_id", "filtering_policy_id"),
+        Index(
+            "ix_filtering_policy_version_firewall_id_valid_from",
+            "firewall_id",
+            "valid_from",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    filtering_policy_id: Mapped[int]
+    firewall_id: Mapped[int] = mapped_column(
+        ForeignKey("firewall.id", ondelete="CASCADE")
+    )
+    name: Mapped[str] = mapped_column(String(50))
+    position: Mapped[int] = mapped_column(BigInteger)
+    valid_from: Mapped[int]
+    valid_to: Mapped[Optional[int]]
+
+
+class RuleVersion(Base):
+    """
+    Version of a rule, valid from a revision of its firewall until another one.
+
+    valid_to is None while the version is current.
+    """
+
+    __tablename__ = "rule_version"
+    __table_args__ = (
+        Index("ix_rule_version_rule_id", "rule_id"),
+        Index("ix_rule_version_firewall_id_valid_from", "firewall_id", "valid_from"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    rule_id: Mapped[int]
+    firewall_id: Mapped[int] = mapped_column(
+        ForeignKey("firewall.id", ondelete="CASCADE")
+    )
+    filtering_policy_id: Mapped[int]
+    name: Mapped[Optional[str]] = mapped_column(String(50))
+    source_ip: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
+    source_ip_end: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
+    destination_ip: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
+    destination_ip_end: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
+    destination_port: Mapped[int]
+    destination_port_end: Mapped[int]
+    protocol: Mapped[Protocol] = mapped_column(Enum(Protocol))
+    action: Mapped[RuleAction] = mapped_column(Enum(RuleAction))
+    position: Mapped[int] = mapped_column(BigInteger)
+    valid_from: Mapped[int]
+    valid_to: Mapped[Optional[int]]
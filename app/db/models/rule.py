@@ -3,9 +3,10 @@ from __future__ import annotations
 import enum
 from ipaddress import IPv4Address
 from os import name
-from typing import TYPE_CHECKING, Optional
+from socket import inet_ntoa
+from typing import TYPE_CHECKING, Optional, Union
 
-from sqlalchemy import Enum, ForeignKey, String, UniqueConstraint
+from sqlalchemy import BigInteger, Enum, ForeignKey, Index, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .. import custom_types
@@ -27,43 +28,117 @@ class Protocol(enum.Enum):
     ICMP = "ICMP"
 
 
+def format_address(address: Union[IPv4Address, int]) -> str:
+    """
+    Format an IPv4 address, rows hold them as integers which are formatted
+    without creating IPv4Address objects.
+    """
+    return inet_ntoa(int(address).to_bytes(4, "big"))
+
+
+def format_address_range(
+    start: Union[IPv4Address, int], end: Union[IPv4Address, int]
+) -> str:
+    """
+    Format the address range of a rule.
+
+    :param start: The first address of the range, or its integer
+    :param end: The last address of the range, or its integer, it must end a
+        CIDR prefix starting at start
+
+    :return: The address if the range holds a single one, else the CIDR prefix
+    """
+    if start == end:
+        return format_address(start)
+
+    return f"{format_address(start)}/{32 - (int(end) - int(start)).bit_length()}"
+
+
 class Rule(Base):
+    """
+    Rule matching flows whose source and destination addresses are in CIDR
+    prefixes and whose destination port is in a range.
+
+    Prefixes and port ranges are stored as their inclusive (start, end) integer
+    bounds, a single address or port having equal bounds.
+    """
+
     __tablename__ = "rule"
     __table_args__ = (
         UniqueConstraint(
             "filtering_policy_id",
             "source_ip",
+            "source_ip_end",
             "destination_ip",
+            "destination_ip_end",
             "destination_port",
+            "destination_port_end",
             "protocol",
+            name="uq_rule_filtering_policy_id",
+        ),
+        Index(
+            "ix_rule_filtering_policy_id_position", "filtering_policy_id", "position"
+        ),
+        Index("ix_rule_source_ip", "source_ip"),
+        Index("ix_rule_destination_ip", "destination_ip"),
+        # Covering indexes answering "which rules of a policy match a value"
+        Index(
+            "ix_rule_filtering_policy_id_source_ip_range",
+            "filtering_policy_id",
+            "source_ip",
+            "source_ip_end",
+        ),
+        Index(
+            "ix_rule_filtering_policy_id_destination_ip_range",
+            "filtering_policy_id",
+            "destination_ip",
+            "destination_ip_end",
+        ),
+        Index(
+            "ix_rule_filtering_policy_id_destination_port_range",
+            "filtering_policy_id",
+            "destination_port",
+            "destination_port_end",
         ),
+        # Ids are never reused, so the hit counters of a deleted rule are
+        # never taken for the ones of a new rule
+        {"sqlite_autoincrement": True},
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[Optional[str]] = mapped_column(String(50))
     filtering_policy_id: Mapped[int] = mapped_column(ForeignKey("filtering_policy.id"))
     filtering_policy: Mapped[FilteringPolicy] = relationship(
-        back_populates="_rules", lazy="joined"
+        back_populates="rules", lazy="joined"
     )
     source_ip: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
+    source_ip_end: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
     destination_ip: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
+    destination_ip_end: Mapped[IPv4Address] = mapped_column(custom_types.IPv4Address)
     destination_port: Mapped[int]
+    destination_port_end: Mapped[int]
     protocol: Mapped[Protocol] = mapped_column(Enum(Protocol))
     action: Mapped[RuleAction] = mapped_column(Enum(RuleAction))
-    next_rule_id: Mapped[Optional[int]] = mapped_column(ForeignKey("rule.id"))
+    position: Mapped[int] = mapped_column(BigInteger)
 
     def is_similar(self, other: Rule) -> bool:
         return (
             self.filtering_policy_id,
             self.source_ip,
+            self.source_ip_end,
             self.destination_ip,
+            self.destination_ip_end,
             self.destination_port,
+            self.destination_port_end,
             self.action,
         ) == (
             other.filtering_policy_id,
             other.source_ip,
+            other.source_ip_end,
             other.destination_ip,
+            other.destination_ip_end,
             other.destination_port,
+            other.destination_port_end,
             other.action,
         )
 
@@ -76,16 +151,22 @@ class Rule(Base):
             self.filtering_policy_id,
             self.name,
             self.source_ip,
+            self.source_ip_end,
             self.destination_ip,
+            self.destination_ip_end,
             self.destination_port,
+            self.destination_port_end,
             self.protocol,
             self.action,
         ) == (
             value.filtering_policy_id,
             value.name,
             value.source_ip,
+            value.source_ip_end,
             value.destination_ip,
+            value.destination_ip_end,
             value.destination_port,
+            value.destination_port_end,
             value.protocol,
             value.action,
         )
@@ -100,9 +181,12 @@ class Rule(Base):
         """
         result = {
             "id": self.id,
-            "source_ip": str(self.source_ip),
-            "destination_ip": str(self.destination_ip),
+            "source_ip": format_address_range(self.source_ip, self.source_ip_end),
+            "destination_ip": format_address_range(
+                self.destination_ip, self.destination_ip_end
+            ),
             "destination_port": self.destination_port,
+            "destination_port_end": self.destination_port_end,
             "protocol": self.protocol.name,
             "action": self.action.name,
         }
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..base import Base
+
+
+class RuleHits(Base):
+    """
+    Number of evaluated flows decided by a rule, and time of the last one.
+
+    Counters are written by batched upserts of the evaluation's in-memory
+    counters, rules never hit have no row.
+    """
+
+    __tablename__ = "rule_hits"
+
+    rule_id: Mapped[int] = mapped_column(
+        ForeignKey("rule.id", ondelete="CASCADE"), primary_key=True
+    )
+    hits: Mapped[int] = mapped_column(BigInteger)
+    # In UTC
+    last_hit_at: Mapped[datetime]
@@ -1,8 +1,20 @@
 """Classes used to interact with the database"""
 
+from .async_filtering_policy_repository import AsyncFilteringPolicyRepository
+from .async_firewall_repository import AsyncFirewallRepository
+from .async_rule_repository import AsyncRuleRepository
 from .filtering_policy_repository import FilteringPolicyRepository
 from .firewall_repository import FirewallRepository
+from .rule_hits_repository import RuleHitsRepository
 from .rule_repository import RuleRepository
 
-__all__ = ["FilteringPolicyRepository", "FirewallRepository", "RuleRepository"]
+__all__ = [
+    "AsyncFilteringPolicyRepository",
+    "AsyncFirewallRepository",
+    "AsyncRuleRepository",
+    "FilteringPolicyRepository",
+    "FirewallRepository",
+    "RuleHitsRepository",
+    "RuleRepository",
+]
 
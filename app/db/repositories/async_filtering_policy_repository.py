@@ -0,0 +1,155 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import NoResultFound
+
+from ..models import FilteringPolicy, Firewall
+from ..unit_of_work import async_transaction
+from .filtering_policy_repository import (
+    following_filtering_policy_statement,
+    page_by_firewall_id_statement,
+)
+from .positions import position_after
+from .revisions import bump_revision
+
+
+class AsyncFilteringPolicyRepository:
+    """
+    Async variant of FilteringPolicyRepository, used when the app is served by
+    ASGI
+    """
+
+    @staticmethod
+    async def add_to_firewall_as_first_policy(
+        firewall_id: int, filtering_policy: FilteringPolicy
+    ) -> FilteringPolicy:
+        async with async_transaction() as session:
+            firewall = await session.get_one(Firewall, firewall_id)
+            filtering_policy.position = await session.run_sync(
+                position_after,
+                FilteringPolicy,
+                FilteringPolicy.firewall_id,
+                firewall_id,
+                None,
+            )
+            filtering_policy.firewall = firewall
+            session.add(filtering_policy)
+            await session.run_sync(bump_revision, firewall_id)
+
+        return filtering_policy
+
+    @staticmethod
+    async def add_after_filtering_policy(
+        previous_filtering_policy_id: int, filtering_policy: FilteringPolicy
+    ) -> FilteringPolicy:
+        async with async_transaction() as session:
+            previous_filtering_policy = await session.get_one(
+                FilteringPolicy, previous_filtering_policy_id
+            )
+            filtering_policy.position = await session.run_sync(
+                position_after,
+                FilteringPolicy,
+                FilteringPolicy.firewall_id,
+                previous_filtering_policy.firewall_id,
+                previous_filtering_policy,
+            )
+            filtering_policy.firewall = previous_filtering_policy.firewall
+            session.add(filtering_policy)
+            await session.run_sync(bump_revision, previous_filtering_policy.firewall_id)
+
+        return filtering_policy
+
+    @staticmethod
+    async def find_by_firewall_id_and_name(
+        firewall_id: int, name: str
+    ) -> Optional[FilteringPolicy]:
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                select(FilteringPolicy).where(
+                    FilteringPolicy.firewall_id == firewall_id,
+                    FilteringPolicy.name == name,
+                )
+            )
+
+    @staticmethod
+    async def find_by_firewall_id_and_id(
+        firewall_id: int, id: int
+    ) -> Optional[FilteringPolicy]:
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                select(FilteringPolicy).where(
+                    FilteringPolicy.id == id, FilteringPolicy.firewall_id == firewall_id
+                )
+            )
+
+    @staticmethod
+    async def find_page_by_firewall_id(
+        firewall_id: int, limit: int, after: Optional[tuple[int, int]] = None
+    ) -> list[FilteringPolicy]:
+        """
+        Find a page of the ordered filtering policies of a firewall.
+
+        :param firewall_id: The firewall's id
+        :param limit: The maximum number of filtering policies
+        :param after: The (position, id) key of the filtering policy preceding
+            the page, None to start from the first filtering policy
+
+        :return: The filtering policies, without their firewall
+        """
+        async with async_transaction(read_only=True) as session:
+            return list(
+                await session.scalars(
+                    page_by_firewall_id_statement(firewall_id, limit, after)
+                )
+            )
+
+    @staticmethod
+    async def find_following_filtering_policy(
+        firewall_id: int, previous_filtering_policy: Optional[FilteringPolicy]
+    ) -> Optional[FilteringPolicy]:
+        """
+        Find the filtering policy following another one in a firewall.
+
+        :param firewall_id: The firewall's id
+        :param previous_filtering_policy: The preceding filtering policy, None to
+            get the first filtering policy
+
+        :return: The following filtering policy if there is one, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                following_filtering_policy_statement(
+                    firewall_id, previous_filtering_policy
+                )
+            )
+
+    @staticmethod
+    async def find_by_id(id: int) -> FilteringPolicy:
+        """
+        Find a filtering policy thanks to its id.
+
+        :param id: The filtering policy's id
+
+        :raise NoResultFound: if there is no filtering policy with this id
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.get_one(FilteringPolicy, id)
+
+    @staticmethod
+    async def delete(id: int) -> bool:
+        """
+        Delete a filtering policy based on its id.
+
+        :param id: The filtering policy's id
+
+        :return: True if the filtering policy was deleted, False if there was none
+        """
+        async with async_transaction() as session:
+            try:
+                filtering_policy = await session.get_one(FilteringPolicy, id)
+                await session.delete(filtering_policy)
+                await session.run_sync(bump_revision, filtering_policy.firewall_id)
+
+                return True
+            except NoResultFound:
+                return False
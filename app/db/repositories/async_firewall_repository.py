@@ -0,0 +1,223 @@
+from datetime import datetime
+from ipaddress import IPv4Address
+from typing import AsyncIterator, Optional, Union
+
+from sqlalchemy import Row, select
+from sqlalchemy.exc import NoResultFound
+
+from app.db.models import Firewall
+from app.db.unit_of_work import async_transaction
+
+from .firewall_repository import (
+    configuration_statement,
+    filtering_policy_rows_statement,
+    revision_by_filtering_policy_id_statement,
+    revision_by_rule_id_statement,
+    row_statement,
+    rule_rows_statement,
+    snapshot_revision_statement,
+    with_filtering_policies_statement,
+    with_rules_statement,
+)
+
+
+class AsyncFirewallRepository:
+    """Async variant of FirewallRepository, used when the app is served by ASGI"""
+
+    @staticmethod
+    async def add(firewall: Firewall) -> Firewall:
+        async with async_transaction() as session:
+            session.add(firewall)
+        return firewall
+
+    @staticmethod
+    async def find_by_ip_address_and_port(
+        ip_address: Union[IPv4Address, str], port: int
+    ) -> Optional[Firewall]:
+        """
+        Find a firewall thanks to its ip_address and port.
+
+        :param ip_address: The firewall's IP address
+        :param port: The firewall's port
+
+        :return: The firewall if it exists, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                select(Firewall).where(
+                    Firewall.ip_address == ip_address, Firewall.port == port
+                )
+            )
+
+    @staticmethod
+    async def find_by_id(id: int) -> Firewall:
+        """
+        Find a firewall thanks to its id.
+
+        :param id: The firewall's id
+
+        :raise NoResultFound: if there is no firewall with this id
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.get_one(Firewall, id)
+
+    @staticmethod
+    async def find_revision(id: int) -> Optional[int]:
+        """
+        Find the revision of a firewall's configuration.
+
+        :param id: The firewall's id
+
+        :return: The firewall's revision if it exists, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                select(Firewall.revision).where(Firewall.id == id)
+            )
+
+    @staticmethod
+    async def find_snapshot_revision(
+        id: int, at: Union[int, datetime]
+    ) -> Optional[int]:
+        """
+        Find the revision of a firewall's configuration at a revision or a time.
+
+        :param id: The firewall's id
+        :param at: The revision, or the time in UTC
+
+        :return: The revision if the firewall had it, or the last revision made
+            at or before the time, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(snapshot_revision_statement(id, at))
+
+    @staticmethod
+    async def find_revision_by_filtering_policy_id(
+        filtering_policy_id: int,
+    ) -> Optional[Row[tuple[int, int]]]:
+        """
+        Find the id and revision of the firewall owning a filtering policy.
+
+        :param filtering_policy_id: The filtering policy's id
+
+        :return: The firewall's id and revision if the filtering policy exists,
+            else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            result = await session.execute(
+                revision_by_filtering_policy_id_statement(filtering_policy_id)
+            )
+            return result.first()
+
+    @staticmethod
+    async def find_revision_by_rule_id(rule_id: int) -> Optional[Row[tuple[int, int]]]:
+        """
+        Find the id and revision of the firewall owning a rule.
+
+        :param rule_id: The rule's id
+
+        :return: The firewall's id and revision if the rule exists, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            result = await session.execute(revision_by_rule_id_statement(rule_id))
+            return result.first()
+
+    @staticmethod
+    async def find_by_id_with_filtering_policies(id: int) -> Optional[Firewall]:
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(with_filtering_policies_statement(id))
+
+    @staticmethod
+    async def find_by_id_with_rules(id: int) -> Optional[Firewall]:
+        """
+        Find a firewall with its filtering policies and their rules.
+
+        :param id: The firewall's id
+
+        :return: The firewall if it exists, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(with_rules_statement(id))
+
+    @staticmethod
+    async def find_row(id: int) -> Optional[Row]:
+        """
+        Find a firewall thanks to its id, as a row ready to be serialized.
+
+        :param id: The firewall's id
+
+        :return: The row of FIREWALL_ROW_COLUMNS if the firewall exists, else
+            return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return (await session.execute(row_statement(id))).first()
+
+    @staticmethod
+    async def find_filtering_policy_rows(
+        id: int, revision: Optional[int] = None
+    ) -> list[Row]:
+        """
+        Find the ordered filtering policies of a firewall as rows.
+
+        :param id: The firewall's id
+        :param revision: The revision of the firewall's configuration to read,
+            None for the current one
+
+        :return: The filtering policies' id and name
+        """
+        async with async_transaction(read_only=True) as session:
+            return list(
+                await session.execute(filtering_policy_rows_statement(id, revision))
+            )
+
+    @staticmethod
+    async def find_rule_rows(id: int, revision: Optional[int] = None) -> list[Row]:
+        """
+        Find the rules of a firewall as rows, in evaluation order.
+
+        :param id: The firewall's id
+        :param revision: The revision of the firewall's configuration to read,
+            None for the current one
+
+        :return: The rows of RULE_ROW_COLUMNS and the filtering policies' ids,
+            ordered by filtering policy then by rule
+        """
+        async with async_transaction(read_only=True) as session:
+            return list(await session.execute(rule_rows_statement(id, revision)))
+
+    @staticmethod
+    async def iter_configuration(id: int, batch_size: int = 1000) -> AsyncIterator[Row]:
+        """
+        Stream the ordered filtering policies and rules of a firewall.
+
+        See FirewallRepository.iter_configuration for the content of the rows.
+
+        :param id: The firewall's id
+        :param batch_size: The number of rows fetched at a time
+
+        :return: The rows, ordered by filtering policy then by rule
+        """
+        async with async_transaction(read_only=True) as session:
+            result = await session.stream(
+                configuration_statement(id).execution_options(yield_per=batch_size)
+            )
+            async for row in result:
+                yield row
+
+    @staticmethod
+    async def delete(id: int) -> bool:
+        """
+        Delete a firewall based on its id.
+
+        :param id: The firewall's id
+
+        :return: True if the firewall was deleted, False if there was none
+        """
+        async with async_transaction() as session:
+            try:
+                firewall = await session.get_one(Firewall, id)
+                await session.delete(firewall)
+
+                return True
+            except NoResultFound:
+                return False
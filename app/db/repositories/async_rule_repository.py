@@ -0,0 +1,259 @@
+from ipaddress import IPv4Address
+from typing import Optional
+
+from sqlalchemy import Row, select
+from sqlalchemy.exc import NoResultFound
+
+from ..models import FilteringPolicy, Protocol, Rule
+from ..unit_of_work import async_transaction
+from .positions import position_after
+from .revisions import bump_revision
+from .rule_repository import (
+    by_ranges_statement,
+    following_rule_statement,
+    insert_rules_after,
+    matching_statement,
+    page_by_filtering_policy_id_statement,
+    replace_rules,
+    row_by_id_statement,
+)
+
+
+class AsyncRuleRepository:
+    """Async variant of RuleRepository, used when the app is served by ASGI"""
+
+    @staticmethod
+    async def add_to_filtering_policy_as_first_rule(
+        filtering_policy_id: int, rule: Rule
+    ) -> Rule:
+        async with async_transaction() as session:
+            filtering_policy = await session.get_one(
+                FilteringPolicy, filtering_policy_id
+            )
+            rule.position = await session.run_sync(
+                position_after,
+                Rule,
+                Rule.filtering_policy_id,
+                filtering_policy_id,
+                None,
+            )
+            rule.filtering_policy = filtering_policy
+            session.add(rule)
+            await session.run_sync(bump_revision, rule.filtering_policy.firewall_id)
+
+        return rule
+
+    @staticmethod
+    async def add_after_rule(previous_rule_id: int, rule: Rule) -> Rule:
+        async with async_transaction() as session:
+            previous_rule = await session.get_one(Rule, previous_rule_id)
+            rule.position = await session.run_sync(
+                position_after,
+                Rule,
+                Rule.filtering_policy_id,
+                previous_rule.filtering_policy_id,
+                previous_rule,
+            )
+            rule.filtering_policy = previous_rule.filtering_policy
+            session.add(rule)
+            await session.run_sync(bump_revision, rule.filtering_policy.firewall_id)
+
+        return rule
+
+    @staticmethod
+    async def add_many_after_rule(
+        filtering_policy_id: int, previous_rule_id: Optional[int], rules: list[dict]
+    ) -> int:
+        """
+        Add rules in a single transaction, skipping the ones already in the policy.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param previous_rule_id: The id of the rule preceding the new ones, None
+            to add them first
+        :param rules: The rules' column values, in order
+
+        :raise NoResultFound: if there is no filtering policy or previous rule
+            with these ids
+        :raise ConflictingRulesError: if rules clash with rules of the policy
+
+        :return: The number of added rules
+        """
+        async with async_transaction() as session:
+            added_rules_count = await session.run_sync(
+                insert_rules_after, filtering_policy_id, previous_rule_id, rules
+            )
+
+        return added_rules_count
+
+    @staticmethod
+    async def replace_all(
+        filtering_policy_id: int, rules: list[dict]
+    ) -> dict[str, int]:
+        """
+        Replace the rules of a filtering policy in a single transaction.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param rules: The column values of every rule of the policy, in order
+
+        :raise NoResultFound: if there is no filtering policy with this id
+
+        :return: The number of added, moved, updated and deleted rules
+        """
+        async with async_transaction() as session:
+            counts = await session.run_sync(replace_rules, filtering_policy_id, rules)
+
+        return counts
+
+    @staticmethod
+    async def find_by_id(id: int) -> Rule:
+        async with async_transaction(read_only=True) as session:
+            return await session.get_one(Rule, id)
+
+    @staticmethod
+    async def find_by_filtering_policy_id_and_id(
+        filtering_policy_id: int, id: int
+    ) -> Optional[Rule]:
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                select(Rule).where(
+                    Rule.filtering_policy_id == filtering_policy_id, Rule.id == id
+                )
+            )
+
+    @staticmethod
+    async def find_page_by_filtering_policy_id(
+        filtering_policy_id: int,
+        limit: Optional[int],
+        after: Optional[tuple[int, int]] = None,
+        with_hits: bool = False,
+    ) -> list[Row]:
+        """
+        Find a page of the ordered rules of a filtering policy.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param limit: The maximum number of rules, None for all of them
+        :param after: The (position, id) key of the rule preceding the page,
+            None to start from the first rule
+        :param with_hits: Read the RULE_HITS_COLUMNS too
+
+        :return: The rules' rows, with their position
+        """
+        async with async_transaction(read_only=True) as session:
+            return list(
+                await session.execute(
+                    page_by_filtering_policy_id_statement(
+                        filtering_policy_id, limit, after, with_hits
+                    )
+                )
+            )
+
+    @staticmethod
+    async def find_row_by_id(id: int, with_hits: bool = False) -> Optional[Row]:
+        """
+        Find a rule thanks to its id, as a row ready to be serialized.
+
+        :param id: The rule's id
+        :param with_hits: Read the RULE_HITS_COLUMNS too
+
+        :return: The row of RULE_ROW_COLUMNS and the filtering policy's id if
+            the rule exists, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return (await session.execute(row_by_id_statement(id, with_hits))).first()
+
+    @staticmethod
+    async def find_following_rule(
+        filtering_policy_id: int, previous_rule: Optional[Rule]
+    ) -> Optional[Rule]:
+        """
+        Find the rule following another one in a filtering policy.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param previous_rule: The preceding rule, None to get the first rule
+
+        :return: The following rule if there is one, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                following_rule_statement(filtering_policy_id, previous_rule)
+            )
+
+    @staticmethod
+    async def find_by_filtering_policy_id_source_destination_and_protocol(
+        filtering_policy_id: int,
+        source_ip: IPv4Address,
+        destination_ip: IPv4Address,
+        destination_port: int,
+        protocol: Protocol,
+        source_ip_end: Optional[IPv4Address] = None,
+        destination_ip_end: Optional[IPv4Address] = None,
+        destination_port_end: Optional[int] = None,
+    ) -> Optional[Rule]:
+        """
+        Find the rule of a filtering policy with given address and port ranges.
+
+        See RuleRepository for the meaning of the parameters.
+
+        :return: The rule if it exists, else return None
+        """
+        async with async_transaction(read_only=True) as session:
+            return await session.scalar(
+                by_ranges_statement(
+                    filtering_policy_id,
+                    source_ip,
+                    destination_ip,
+                    destination_port,
+                    protocol,
+                    source_ip_end,
+                    destination_ip_end,
+                    destination_port_end,
+                )
+            )
+
+    @staticmethod
+    async def find_matching(
+        filtering_policy_id: int,
+        source_ip: Optional[IPv4Address] = None,
+        destination_ip: Optional[IPv4Address] = None,
+        destination_port: Optional[int] = None,
+        protocol: Optional[Protocol] = None,
+    ) -> list[Rule]:
+        """
+        Find the rules of a filtering policy matching flow values.
+
+        See RuleRepository.find_matching for the meaning of the parameters.
+
+        :return: The matching rules in evaluation order, without their
+            filtering policy
+        """
+        async with async_transaction(read_only=True) as session:
+            return list(
+                await session.scalars(
+                    matching_statement(
+                        filtering_policy_id,
+                        source_ip,
+                        destination_ip,
+                        destination_port,
+                        protocol,
+                    )
+                )
+            )
+
+    @staticmethod
+    async def delete(id: int) -> bool:
+        """
+        Delete a rule based on its id.
+
+        :param id: The rule id
+
+        :return: True if the rule was deleted, False if there was none
+        """
+        async with async_transaction() as session:
+            try:
+                rule = await session.get_one(Rule, id)
+                await session.delete(rule)
+                await session.run_sync(bump_revision, rule.filtering_policy.firewall_id)
+
+                return True
+            except NoResultFound:
+                return False
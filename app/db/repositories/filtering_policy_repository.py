@@ -1,11 +1,13 @@
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import Select, select, tuple_
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, raiseload
 
 from ..models import FilteringPolicy, Firewall
-from ..session import Session
+from ..unit_of_work import transaction
+from .positions import position_after
+from .revisions import bump_revision
 
 
 class FilteringPolicyRepository:
@@ -13,24 +15,14 @@ class FilteringPolicyRepository:
     def add_to_firewall_as_first_policy(
         firewall_id: int, filtering_policy: FilteringPolicy
     ) -> FilteringPolicy:
-        with Session() as session:
-            firewall = session.scalar(
-                select(Firewall)
-                .outerjoin(Firewall._filtering_policies)
-                .where(Firewall.id == firewall_id)
+        with transaction() as session:
+            firewall = session.get_one(Firewall, firewall_id)
+            filtering_policy.position = position_after(
+                session, FilteringPolicy, FilteringPolicy.firewall_id, firewall_id, None
             )
-
-            try:
-                former_first_filtering_policy = firewall.filtering_policies[0]
-            except IndexError:
-                former_first_filtering_policy = None
-
-            firewall.filtering_policies = [
-                filtering_policy
-            ] + firewall.filtering_policies
-            filtering_policy.next_policy_id = former_first_filtering_policy
-
-            session.commit()
+            filtering_policy.firewall = firewall
+            session.add(filtering_policy)
+            bump_revision(session, firewall_id)
 
         return filtering_policy
 
@@ -38,21 +30,20 @@ class FilteringPolicyRepository:
     def add_after_filtering_policy(
         previous_filtering_policy_id: int, filtering_policy: FilteringPolicy
     ) -> FilteringPolicy:
-        with Session() as session:
-            previous_filtering_policy = session.scalar(
-                select(FilteringPolicy)
-                .join(FilteringPolicy.firewall)
-                .where(FilteringPolicy.id == previous_filtering_policy_id)
+        with transaction() as session:
+            previous_filtering_policy = session.get_one(
+                FilteringPolicy, previous_filtering_policy_id
             )
-            previous_filtering_policy.firewall._filtering_policies.append(
-                filtering_policy
+            filtering_policy.position = position_after(
+                session,
+                FilteringPolicy,
+                FilteringPolicy.firewall_id,
+                previous_filtering_policy.firewall_id,
+                previous_filtering_policy,
             )
-            session.commit()  # To generate the new filtering policy ID
-            (
-                previous_filtering_policy.next_policy_id,
-                filtering_policy.next_policy_id,
-            ) = (filtering_policy.id, previous_filtering_policy.next_policy_id)
-            session.commit()
+            filtering_policy.firewall = previous_filtering_policy.firewall
+            session.add(filtering_policy)
+            bump_revision(session, previous_filtering_policy.firewall_id)
 
         return filtering_policy
 
@@ -60,7 +51,7 @@ class FilteringPolicyRepository:
     def find_by_firewall_id_and_name(
         firewall_id: int, name: str
     ) -> Optional[FilteringPolicy]:
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.scalar(
                 select(FilteringPolicy).where(
                     FilteringPolicy.firewall_id == firewall_id,
@@ -72,13 +63,57 @@ class FilteringPolicyRepository:
     def find_by_firewall_id_and_id(
         firewall_id: int, id: int
     ) -> Optional[FilteringPolicy]:
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.scalar(
                 select(FilteringPolicy).where(
                     FilteringPolicy.id == id, FilteringPolicy.firewall_id == firewall_id
                 )
             )
 
+    @staticmethod
+    def find_page_by_firewall_id(
+        firewall_id: int, limit: int, after: Optional[tuple[int, int]] = None
+    ) -> list[FilteringPolicy]:
+        """
+        Find a page of the ordered filtering policies of a firewall.
+
+        The page starts right after a (position, id) key, so it is read with an
+        index range scan whatever its rank in the list.
+
+        :param firewall_id: The firewall's id
+        :param limit: The maximum number of filtering policies
+        :param after: The (position, id) key of the filtering policy preceding
+            the page, None to start from the first filtering policy
+
+        :return: The filtering policies, without their firewall
+        """
+        with transaction(read_only=True) as session:
+            return list(
+                session.scalars(
+                    page_by_firewall_id_statement(firewall_id, limit, after)
+                )
+            )
+
+    @staticmethod
+    def find_following_filtering_policy(
+        firewall_id: int, previous_filtering_policy: Optional[FilteringPolicy]
+    ) -> Optional[FilteringPolicy]:
+        """
+        Find the filtering policy following another one in a firewall.
+
+        :param firewall_id: The firewall's id
+        :param previous_filtering_policy: The preceding filtering policy, None to
+            get the first filtering policy
+
+        :return: The following filtering policy if there is one, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.scalar(
+                following_filtering_policy_statement(
+                    firewall_id, previous_filtering_policy
+                )
+            )
+
     @staticmethod
     def find_by_id(id: int) -> FilteringPolicy:
         """
@@ -88,16 +123,16 @@ class FilteringPolicyRepository:
 
         :raise NoResultFound: if there is no filtering policy with this id
         """
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.get_one(FilteringPolicy, id)
 
     @staticmethod
     def find_by_id_with_rules(id: int) -> Optional[FilteringPolicy]:
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.scalar(
                 select(FilteringPolicy)
                 .where(FilteringPolicy.id == id)
-                .options(joinedload(FilteringPolicy._rules))
+                .options(joinedload(FilteringPolicy.rules))
             )
 
     @staticmethod
@@ -109,22 +144,47 @@ class FilteringPolicyRepository:
 
         :return: True if the filtering policy was deleted, False if there was none
         """
-        with Session() as session:
+        with transaction() as session:
             try:
-                previous_filtering_policy = session.scalar(
-                    select(FilteringPolicy).where(FilteringPolicy.next_policy_id == id)
-                )
                 filtering_policy = session.get_one(FilteringPolicy, id)
-
-                if previous_filtering_policy is not None:
-                    previous_filtering_policy.next_policy_id = (
-                        filtering_policy.next_policy_id
-                    )
-
                 session.delete(filtering_policy)
-                session.commit()
+                bump_revision(session, filtering_policy.firewall_id)
 
                 return True
             except NoResultFound:
                 return False
 
+
+def page_by_firewall_id_statement(
+    firewall_id: int, limit: int, after: Optional[tuple[int, int]]
+) -> Select:
+    """Select a page of the ordered filtering policies of a firewall."""
+    statement = select(FilteringPolicy).where(
+        FilteringPolicy.firewall_id == firewall_id
+    )
+    if after is not None:
+        statement = statement.where(
+            tuple_(FilteringPolicy.position, FilteringPolicy.id) > after
+        )
+
+    return (
+        statement.order_by(FilteringPolicy.position, FilteringPolicy.id)
+        .limit(limit)
+        .options(raiseload(FilteringPolicy.firewall))
+    )
+
+
+def following_filtering_policy_statement(
+    firewall_id: int, previous_filtering_policy: Optional[FilteringPolicy]
+) -> Select:
+    """Select the filtering policy following another one in a firewall."""
+    statement = select(FilteringPolicy).where(
+        FilteringPolicy.firewall_id == firewall_id
+    )
+    if previous_filtering_policy is not None:
+        statement = statement.where(
+            tuple_(FilteringPolicy.position, FilteringPolicy.id)
+            > (previous_filtering_policy.position, previous_filtering_policy.id)
+        )
+
+    return statement.order_by(FilteringPolicy.position, FilteringPolicy.id).limit(1)
@@ -1,20 +1,82 @@
+from datetime import datetime
 from ipaddress import IPv4Address
-from typing import Optional, Union
+from typing import Iterable, Iterator, Optional, Union
 
-from sqlalchemy import select
+from sqlalchemy import (
+    ColumnElement,
+    Insert,
+    Integer,
+    Row,
+    Select,
+    func,
+    insert,
+    or_,
+    orm,
+    select,
+    type_coerce,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
-from app.db.models import Firewall
-from app.db.session import Session
+from app.db.models import (
+    FilteringPolicy,
+    FilteringPolicyVersion,
+    Firewall,
+    FirewallRevision,
+    Rule,
+    RuleVersion,
+)
+from app.db.unit_of_work import transaction
+
+from .positions import POSITION_GAP
+from .revisions import bump_revision
+from .rule_repository import RULE_ROW_COLUMNS
+
+# Number of rules inserted by a statement of an import
+IMPORT_BATCH_SIZE = 5000
+
+
+# Columns of the firewall rows serialized without loading Firewall objects,
+# the address is read as an integer
+FIREWALL_ROW_COLUMNS = (
+    Firewall.id,
+    Firewall.name,
+    type_coerce(Firewall.ip_address, Integer).label("ip_address"),
+    Firewall.port,
+)
+
+# Columns of the rule versions matching RULE_ROW_COLUMNS
+RULE_VERSION_ROW_COLUMNS = (
+    RuleVersion.rule_id.label("id"),
+    RuleVersion.name,
+    type_coerce(RuleVersion.source_ip, Integer).label("source_ip"),
+    type_coerce(RuleVersion.source_ip_end, Integer).label("source_ip_end"),
+    type_coerce(RuleVersion.destination_ip, Integer).label("destination_ip"),
+    type_coerce(RuleVersion.destination_ip_end, Integer).label("destination_ip_end"),
+    RuleVersion.destination_port,
+    RuleVersion.destination_port_end,
+    RuleVersion.protocol,
+    RuleVersion.action,
+)
+
+
+class FilteringPolicyExistsError(Exception):
+    """
+    Raised when an imported filtering policy has the name of one of the
+    firewall's filtering policies.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.name = name
 
 
 class FirewallRepository:
     @staticmethod
     def add(firewall: Firewall) -> Firewall:
-        with Session() as session:
+        with transaction() as session:
             session.add(firewall)
-            session.commit()
         return firewall
 
     @staticmethod
@@ -29,7 +91,7 @@ class FirewallRepository:
 
         :return: The firewall if it exists, else return None
         """
-        with Session() as session:
+        with transaction(read_only=True) as session:
             statement = select(Firewall).where(
                 Firewall.ip_address == ip_address, Firewall.port == port
             )
@@ -45,20 +107,167 @@ class FirewallRepository:
 
         :raise NoResultFound: if there is no firewall with this id
         """
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.get_one(Firewall, id)
 
+    @staticmethod
+    def find_revision(id: int) -> Optional[int]:
+        """
+        Find the revision of a firewall's configuration.
+
+        :param id: The firewall's id
+
+        :return: The firewall's revision if it exists, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.scalar(select(Firewall.revision).where(Firewall.id == id))
+
+    @staticmethod
+    def find_snapshot_revision(id: int, at: Union[int, datetime]) -> Optional[int]:
+        """
+        Find the revision of a firewall's configuration at a revision or a time.
+
+        :param id: The firewall's id
+        :param at: The revision, or the time in UTC
+
+        :return: The revision if the firewall had it, or the last revision made
+            at or before the time, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.scalar(snapshot_revision_statement(id, at))
+
+    @staticmethod
+    def find_revision_by_filtering_policy_id(
+        filtering_policy_id: int,
+    ) -> Optional[Row[tuple[int, int]]]:
+        """
+        Find the id and revision of the firewall owning a filtering policy.
+
+        :param filtering_policy_id: The filtering policy's id
+
+        :return: The firewall's id and revision if the filtering policy exists,
+            else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.execute(
+                revision_by_filtering_policy_id_statement(filtering_policy_id)
+            ).first()
+
+    @staticmethod
+    def find_revision_by_rule_id(rule_id: int) -> Optional[Row[tuple[int, int]]]:
+        """
+        Find the id and revision of the firewall owning a rule.
+
+        :param rule_id: The rule's id
+
+        :return: The firewall's id and revision if the rule exists, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.execute(revision_by_rule_id_statement(rule_id)).first()
+
     @staticmethod
     def find_by_id_with_filtering_policies(id: int) -> Optional[Firewall]:
-        with Session() as session:
-            return session.scalar(
-                select(Firewall)
-                .where(Firewall.id == id)
-                .options(
-                    joinedload((Firewall._filtering_policies)),
-                )
+        with transaction(read_only=True) as session:
+            return session.scalar(with_filtering_policies_statement(id))
+
+    @staticmethod
+    def find_by_id_with_rules(id: int) -> Optional[Firewall]:
+        """
+        Find a firewall with its filtering policies and their rules.
+
+        :param id: The firewall's id
+
+        :return: The firewall if it exists, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.scalar(with_rules_statement(id))
+
+    @staticmethod
+    def find_row(id: int) -> Optional[Row]:
+        """
+        Find a firewall thanks to its id, as a row ready to be serialized.
+
+        :param id: The firewall's id
+
+        :return: The row of FIREWALL_ROW_COLUMNS if the firewall exists, else
+            return None
+        """
+        with transaction(read_only=True) as session:
+            return session.execute(row_statement(id)).first()
+
+    @staticmethod
+    def find_filtering_policy_rows(
+        id: int, revision: Optional[int] = None
+    ) -> list[Row]:
+        """
+        Find the ordered filtering policies of a firewall as rows.
+
+        :param id: The firewall's id
+        :param revision: The revision of the firewall's configuration to read,
+            None for the current one
+
+        :return: The filtering policies' id and name
+        """
+        with transaction(read_only=True) as session:
+            return list(session.execute(filtering_policy_rows_statement(id, revision)))
+
+    @staticmethod
+    def find_rule_rows(id: int, revision: Optional[int] = None) -> list[Row]:
+        """
+        Find the rules of a firewall as rows, in evaluation order.
+
+        :param id: The firewall's id
+        :param revision: The revision of the firewall's configuration to read,
+            None for the current one
+
+        :return: The rows of RULE_ROW_COLUMNS and the filtering policies' ids,
+            ordered by filtering policy then by rule
+        """
+        with transaction(read_only=True) as session:
+            return list(session.execute(rule_rows_statement(id, revision)))
+
+    @staticmethod
+    def iter_configuration(id: int, batch_size: int = 1000) -> Iterator[Row]:
+        """
+        Stream the ordered filtering policies and rules of a firewall.
+
+        Every row holds a rule and its filtering policy's id and name, a
+        filtering policy without rules gives a single row with null rule
+        columns. Rows are fetched batch_size at a time without going through
+        the ORM, so memory use does not depend on the number of rules.
+
+        :param id: The firewall's id
+        :param batch_size: The number of rows fetched at a time
+
+        :return: The rows, ordered by filtering policy then by rule
+        """
+        with transaction(read_only=True) as session:
+            yield from session.execute(
+                configuration_statement(id).execution_options(yield_per=batch_size)
             )
 
+    @staticmethod
+    def import_configuration(
+        id: int, entries: Iterable[tuple[str, Optional[dict]]]
+    ) -> dict[str, int]:
+        """
+        Add filtering policies and rules to a firewall in a single transaction.
+
+        :param id: The firewall's id
+        :param entries: The (filtering policy name, rule columns) entries, see
+            insert_configuration
+
+        :raise NoResultFound: if there is no firewall with this id
+        :raise FilteringPolicyExistsError: if a filtering policy has the name of
+            one of the firewall's filtering policies
+
+        :return: The number of added filtering policies and rules
+        """
+        with transaction() as session:
+            counts = insert_configuration(session, id, entries)
+
+        return counts
+
     @staticmethod
     def delete(id: int) -> bool:
         """
@@ -68,12 +277,278 @@ class FirewallRepository:
 
         :return: True if the firewall was deleted, False if there was none
         """
-        with Session() as session:
+        with transaction() as session:
             try:
                 firewall = session.get_one(Firewall, id)
                 session.delete(firewall)
-                session.commit()
 
                 return True
             except NoResultFound:
                 return False
+
+
+def insert_configuration(
+    session: orm.Session,
+    firewall_id: int,
+    entries: Iterable[tuple[str, Optional[dict]]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict[str, int]:
+    """
+    Add filtering policies and rules to a firewall in a session.
+
+    Entries are read once, in order: a filtering policy is added after the
+    firewall's ones the first time its name is met, and its rules are added
+    in order, batch_size at a time, so memory use does not depend on the
+    number of entries. A rule with the same source, destination, port and
+    protocol as a previous rule of its filtering policy can never match, it
+    is skipped.
+
+    :param session: The session of the transaction adding the configuration
+    :param firewall_id: The firewall's id
+    :param entries: (filtering policy name, None) entries adding a filtering
+        policy and (filtering policy name, rule columns) entries adding a rule,
+        the columns lacking the filtering policy and the position
+    :param batch_size: The number of rules inserted by a statement
+
+    :raise NoResultFound: if there is no firewall with this id
+    :raise FilteringPolicyExistsError: if a filtering policy has the name of
+        one of the firewall's filtering policies
+    :raise NotImplementedError: if the database is neither SQLite nor PostgreSQL
+
+    :return: The number of added filtering policies and rules
+    """
+    session.get_one(Firewall, firewall_id)
+    existing_names = set(
+        session.scalars(
+            select(FilteringPolicy.name).where(
+                FilteringPolicy.firewall_id == firewall_id
+            )
+        )
+    )
+    last_position = (
+        session.scalar(
+            select(func.max(FilteringPolicy.position)).where(
+                FilteringPolicy.firewall_id == firewall_id
+            )
+        )
+        or 0
+    )
+    insert_rules = _insert_ignoring_duplicates(session)
+
+    filtering_policy_ids: dict[str, int] = {}
+    rule_counts: dict[int, int] = {}
+    rules = []
+    for name, rule in entries:
+        filtering_policy_id = filtering_policy_ids.get(name)
+        if filtering_policy_id is None:
+            if name in existing_names:
+                raise FilteringPolicyExistsError(name)
+
+            last_position += POSITION_GAP
+            filtering_policy_id = session.scalar(
+                insert(FilteringPolicy).returning(FilteringPolicy.id),
+                {"firewall_id": firewall_id, "name": name, "position": last_position},
+            )
+            filtering_policy_ids[name] = filtering_policy_id
+            rule_counts[filtering_policy_id] = 0
+
+        if rule is None:
+            continue
+
+        rule_counts[filtering_policy_id] += 1
+        rules.append(
+            {
+                **rule,
+                "filtering_policy_id": filtering_policy_id,
+                "position": rule_counts[filtering_policy_id] * POSITION_GAP,
+            }
+        )
+        if len(rules) >= batch_size:
+            session.execute(insert_rules, rules)
+            rules = []
+
+    if rules:
+        session.execute(insert_rules, rules)
+    if not filtering_policy_ids:
+        return {"filtering_policies": 0, "rules": 0}
+
+    bump_revision(session, firewall_id)
+    return {
+        "filtering_policies": len(filtering_policy_ids),
+        "rules": session.scalar(
+            select(func.count(Rule.id)).where(
+                Rule.filtering_policy_id.in_(filtering_policy_ids.values())
+            )
+        ),
+    }
+
+
+def _insert_ignoring_duplicates(session: orm.Session) -> Insert:
+    """
+    Build an insert of rules skipping the ones breaking the unique constraint.
+
+    :raise NotImplementedError: if the database is neither SQLite nor PostgreSQL
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(Rule.__table__).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(Rule.__table__).on_conflict_do_nothing()
+
+    raise NotImplementedError(f"Importing rules isn't supported on {dialect}")
+
+
+def row_statement(id: int) -> Select:
+    """Select the row of a firewall."""
+    return select(*FIREWALL_ROW_COLUMNS).where(Firewall.id == id)
+
+
+def filtering_policy_rows_statement(id: int, revision: Optional[int] = None) -> Select:
+    """
+    Select the rows of the ordered filtering policies of a firewall, at a
+    revision of its configuration if one is given.
+    """
+    if revision is not None:
+        return (
+            select(
+                FilteringPolicyVersion.filtering_policy_id.label("id"),
+                FilteringPolicyVersion.name,
+            )
+            .where(
+                FilteringPolicyVersion.firewall_id == id,
+                *_valid_at(FilteringPolicyVersion, revision),
+            )
+            .order_by(
+                FilteringPolicyVersion.position,
+                FilteringPolicyVersion.filtering_policy_id,
+            )
+        )
+
+    return (
+        select(FilteringPolicy.id, FilteringPolicy.name)
+        .where(FilteringPolicy.firewall_id == id)
+        .order_by(FilteringPolicy.position, FilteringPolicy.id)
+    )
+
+
+def rule_rows_statement(id: int, revision: Optional[int] = None) -> Select:
+    """
+    Select the rows of the rules of a firewall, in evaluation order, at a
+    revision of its configuration if one is given.
+    """
+    if revision is not None:
+        return (
+            select(RuleVersion.filtering_policy_id, *RULE_VERSION_ROW_COLUMNS)
+            .join(
+                FilteringPolicyVersion,
+                FilteringPolicyVersion.filtering_policy_id
+                == RuleVersion.filtering_policy_id,
+            )
+            .where(
+                RuleVersion.firewall_id == id,
+                *_valid_at(RuleVersion, revision),
+                FilteringPolicyVersion.firewall_id == id,
+                *_valid_at(FilteringPolicyVersion, revision),
+            )
+            .order_by(
+                FilteringPolicyVersion.position,
+                FilteringPolicyVersion.filtering_policy_id,
+                RuleVersion.position,
+                RuleVersion.rule_id,
+            )
+        )
+
+    return (
+        select(Rule.filtering_policy_id, *RULE_ROW_COLUMNS)
+        .join(Rule.filtering_policy)
+        .where(FilteringPolicy.firewall_id == id)
+        .order_by(FilteringPolicy.position, FilteringPolicy.id, Rule.position, Rule.id)
+    )
+
+
+def _valid_at(
+    model: type[Union[FilteringPolicyVersion, RuleVersion]], revision: int
+) -> tuple[ColumnElement[bool], ...]:
+    """Build the conditions of the versions valid at a revision."""
+    return (
+        model.valid_from <= revision,
+        or_(model.valid_to.is_(None), model.valid_to > revision),
+    )
+
+
+def snapshot_revision_statement(id: int, at: Union[int, datetime]) -> Select:
+    """
+    Select a revision of a firewall, or the last one made at or before a time.
+    """
+    if isinstance(at, datetime):
+        return select(func.max(FirewallRevision.revision)).where(
+            FirewallRevision.firewall_id == id, FirewallRevision.changed_at <= at
+        )
+
+    return select(FirewallRevision.revision).where(
+        FirewallRevision.firewall_id == id, FirewallRevision.revision == at
+    )
+
+
+def revision_by_filtering_policy_id_statement(filtering_policy_id: int) -> Select:
+    """Select the id and revision of the firewall owning a filtering policy."""
+    return (
+        select(Firewall.id, Firewall.revision)
+        .join(Firewall.filtering_policies)
+        .where(FilteringPolicy.id == filtering_policy_id)
+    )
+
+
+def revision_by_rule_id_statement(rule_id: int) -> Select:
+    """Select the id and revision of the firewall owning a rule."""
+    return (
+        select(Firewall.id, Firewall.revision)
+        .join(Firewall.filtering_policies)
+        .join(FilteringPolicy.rules)
+        .where(Rule.id == rule_id)
+    )
+
+
+def with_filtering_policies_statement(id: int) -> Select:
+    """Select a firewall with its filtering policies."""
+    return (
+        select(Firewall)
+        .where(Firewall.id == id)
+        .options(joinedload(Firewall.filtering_policies))
+    )
+
+
+def with_rules_statement(id: int) -> Select:
+    """Select a firewall with its filtering policies and their rules."""
+    return (
+        select(Firewall)
+        .where(Firewall.id == id)
+        .options(
+            selectinload(Firewall.filtering_policies).selectinload(
+                FilteringPolicy.rules
+            )
+        )
+    )
+
+
+def configuration_statement(id: int) -> Select:
+    """Select the ordered filtering policies and rules of a firewall."""
+    return (
+        select(
+            FilteringPolicy.id.label("filtering_policy_id"),
+            FilteringPolicy.name.label("filtering_policy_name"),
+            Rule.id,
+            Rule.name,
+            Rule.source_ip,
+            Rule.source_ip_end,
+            Rule.destination_ip,
+            Rule.destination_ip_end,
+            Rule.destination_port,
+            Rule.destination_port_end,
+            Rule.protocol,
+            Rule.action,
+        )
+        .outerjoin(FilteringPolicy.rules)
+        .where(FilteringPolicy.firewall_id == id)
+        .order_by(FilteringPolicy.position, FilteringPolicy.id, Rule.position, Rule.id)
+    )
@@ -0,0 +1,246 @@
+"""
+Helpers to keep rows of an ordered list sorted by an integer position.
+
+Siblings are spread POSITION_GAP apart, so inserting a row between two others
+only writes the new row. When two neighbours have no room left between them,
+the fewest siblings around them are renumbered to restore the gaps: every
+renumbered row gets a new version in the configuration history.
+"""
+
+from bisect import bisect_left
+from typing import Optional, Union
+
+from sqlalchemy import ColumnElement, func, select, update
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+from ..models import FilteringPolicy, Rule
+
+POSITION_GAP = 1 << 16
+
+# Smallest gap left between the rows renumbered by a rebalance
+_REBALANCED_GAP = POSITION_GAP // 4
+
+OrderedModel = Union[type[FilteringPolicy], type[Rule]]
+
+
+def position_after(
+    session: Session,
+    model: OrderedModel,
+    parent_column: InstrumentedAttribute,
+    parent_id: int,
+    previous: Optional[Union[FilteringPolicy, Rule]],
+) -> int:
+    """
+    Compute the position of a row inserted right after another one.
+
+    :param session: The session used to query the siblings
+    :param model: The model of the ordered rows
+    :param parent_column: The column holding the id of the list owner
+    :param parent_id: The id of the list owner
+    :param previous: The row preceding the new one, None to insert it first
+
+    :return: The position of the new row
+    """
+    return positions_after(session, model, parent_column, parent_id, previous, 1)[0]
+
+
+def positions_after(
+    session: Session,
+    model: OrderedModel,
+    parent_column: InstrumentedAttribute,
+    parent_id: int,
+    previous: Optional[Union[FilteringPolicy, Rule]],
+    count: int,
+) -> list[int]:
+    """
+    Compute the positions of consecutive rows inserted right after another one.
+
+    :param session: The session used to query the siblings
+    :param model: The model of the ordered rows
+    :param parent_column: The column holding the id of the list owner
+    :param parent_id: The id of the list owner
+    :param previous: The row preceding the new ones, None to insert them first
+    :param count: The number of rows to insert
+
+    :return: The positions of the new rows, in order
+    """
+    siblings = parent_column == parent_id
+
+    if previous is None:
+        first_position = session.scalar(
+            select(func.min(model.position)).where(siblings)
+        )
+        if first_position is None:
+            return [POSITION_GAP * (rank + 1) for rank in range(count)]
+        return [first_position - POSITION_GAP * (count - rank) for rank in range(count)]
+
+    previous_position = previous.position
+    next_position = _next_position(session, model, siblings, previous_position)
+    if next_position is None:
+        return [previous_position + POSITION_GAP * (rank + 1) for rank in range(count)]
+
+    if next_position - previous_position <= count:
+        return rebalance(session, model, parent_column, parent_id, previous.id, count)
+
+    step = (next_position - previous_position) // (count + 1)
+    return [previous_position + step * (rank + 1) for rank in range(count)]
+
+
+def reorder_positions(keys: list[Optional[tuple[int, int]]]) -> list[int]:
+    """
+    Compute the positions of a list of rows put in a new order.
+
+    The longest run of rows already in order keeps its positions, the other
+    rows are spread between them, so reordering a few rows of a long list
+    only moves these rows. When rows have no room left between their new
+    neighbours, the whole list is numbered POSITION_GAP apart.
+
+    :param keys: The current (position, id) key of the rows in their new
+        order, None for the rows added to the list
+
+    :return: The positions of the rows, in their new order
+    """
+    positions: list[Optional[int]] = [None] * len(keys)
+    anchors = _longest_increasing_subsequence(keys)
+    for index in anchors:
+        positions[index] = keys[index][0]
+
+    start = 0
+    previous_position = None
+    while start < len(keys):
+        if start in anchors:
+            previous_position = positions[start]
+            start += 1
+            continue
+
+        end = start
+        while end < len(keys) and end not in anchors:
+            end += 1
+        next_position = positions[end] if end < len(keys) else None
+
+        run = _positions_between(previous_position, next_position, end - start)
+        if run is None:
+            return [POSITION_GAP * (rank + 1) for rank in range(len(keys))]
+        positions[start:end] = run
+        start = end
+
+    return positions
+
+
+def rebalance(
+    session: Session,
+    model: OrderedModel,
+    parent_column: InstrumentedAttribute,
+    parent_id: int,
+    previous_id: int,
+    count: int,
+) -> list[int]:
+    """
+    Renumber the siblings around a row to make room for rows right after it.
+
+    The window of renumbered siblings doubles around the row until its
+    bounds leave a quarter of POSITION_GAP between its rows, or until it
+    reaches an end of the list, where the rows are spread POSITION_GAP apart.
+
+    :param session: The session used to update the siblings
+    :param model: The model of the ordered rows
+    :param parent_column: The column holding the id of the list owner
+    :param parent_id: The id of the list owner
+    :param previous_id: The id of the row preceding the new ones
+    :param count: The number of rows to insert
+
+    :return: The positions of the new rows, in order
+    """
+    siblings = session.execute(
+        select(model.id, model.position)
+        .where(parent_column == parent_id)
+        .order_by(model.position, model.id)
+    ).all()
+    index = next(
+        index for index, sibling in enumerate(siblings) if sibling.id == previous_id
+    )
+
+    width = 1
+    while True:
+        start = max(index + 1 - width, 0)
+        end = min(index + 1 + width, len(siblings))
+        lower = siblings[start - 1].position if start > 0 else None
+        upper = siblings[end].position if end < len(siblings) else None
+        slot_count = end - start + count
+        if (
+            lower is None
+            or upper is None
+            or (upper - lower) // (slot_count + 1) >= _REBALANCED_GAP
+        ):
+            break
+        width *= 2
+
+    # The new rows take the slots right after the previous row
+    positions = _positions_between(lower, upper, slot_count)
+    first_slot = index + 1 - start
+    new_positions = positions[first_slot : first_slot + count]
+    del positions[first_slot : first_slot + count]
+
+    renumbered = [
+        {"id": sibling.id, "position": position}
+        for sibling, position in zip(siblings[start:end], positions)
+        if sibling.position != position
+    ]
+    if renumbered:
+        session.execute(update(model), renumbered)
+
+    return new_positions
+
+
+def _next_position(
+    session: Session,
+    model: OrderedModel,
+    siblings: ColumnElement[bool],
+    position: int,
+) -> Optional[int]:
+    return session.scalar(
+        select(func.min(model.position)).where(siblings, model.position > position)
+    )
+
+
+def _positions_between(
+    previous_position: Optional[int], next_position: Optional[int], count: int
+) -> Optional[list[int]]:
+    if previous_position is None and next_position is None:
+        return [POSITION_GAP * (rank + 1) for rank in range(count)]
+    if previous_position is None:
+        return [next_position - POSITION_GAP * (count - rank) for rank in range(count)]
+    if next_position is None:
+        return [previous_position + POSITION_GAP * (rank + 1) for rank in range(count)]
+    if next_position - previous_position <= count:
+        return None
+
+    step = (next_position - previous_position) // (count + 1)
+    return [previous_position + step * (rank + 1) for rank in range(count)]
+
+
+def _longest_increasing_subsequence(keys: list[Optional[tuple[int, int]]]) -> set[int]:
+    """Find the indexes of a longest increasing subsequence of the keys."""
+    tail_keys: list[tuple[int, int]] = []
+    tail_indexes: list[int] = []
+    predecessors: dict[int, Optional[int]] = {}
+    for index, key in enumerate(keys):
+        if key is None:
+            continue
+
+        length = bisect_left(tail_keys, key)
+        predecessors[index] = tail_indexes[length - 1] if length else None
+        if length == len(tail_keys):
+            tail_keys.append(key)
+            tail_indexes.append(index)
+        else:
+            tail_keys[length] = key
+            tail_indexes[length] = index
+
+    indexes = set()
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        indexes.add(index)
+        index = predecessors[index]
+
+    return indexes
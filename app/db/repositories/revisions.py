@@ -0,0 +1,38 @@
+"""
+Helpers to keep track of the changes made to a firewall's configuration.
+
+Every firewall has a revision which is incremented in the transaction of any
+change made to its filtering policies or rules, so readers can tell whether
+a configuration they loaded earlier is still current. Triggers of the
+database date the versions of the filtering policies and rules written by the
+transaction with the new revision and record the time of each revision (see
+app.db.models.history), so configurations can be read as they were at a
+revision or a time.
+"""
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..models import Firewall
+
+
+def bump_revision(session: Session, firewall_id: int) -> None:
+    """
+    Increment a firewall's revision.
+
+    It must be the last write of the transaction changing the configuration:
+    the triggers date the versions with the revision following the current
+    one, so a filtering policy or rule written after the bump would get the
+    revision after the bumped one and be missing from the bumped revision.
+
+    :param session: The session of the transaction changing the configuration,
+        its changes must be written or pending in the session
+    :param firewall_id: The firewall's id
+    """
+    # The ORM statement flushes the pending changes first, so the triggers
+    # date their versions with the revision given here
+    session.execute(
+        update(Firewall)
+        .where(Firewall.id == firewall_id)
+        .values(revision=Firewall.revision + 1)
+    )
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from sqlalchemy import Insert, case, orm, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..models import Rule, RuleHits
+from ..unit_of_work import transaction
+
+# Number of counters written by a statement
+HITS_BATCH_SIZE = 1000
+
+
+class RuleHitsRepository:
+    @staticmethod
+    def add_hits(hits: dict[int, tuple[int, datetime]]) -> int:
+        """
+        Add hits to the counters of rules, with batched upserts.
+
+        :param hits: The number of hits and the time of the last one, in UTC,
+            by rule id
+
+        :return: The number of counters written, hits of rules deleted since
+            they were counted are dropped
+        """
+        with transaction() as session:
+            return add_hits(session, hits)
+
+
+def add_hits(session: orm.Session, hits: dict[int, tuple[int, datetime]]) -> int:
+    """
+    Add hits to the counters of rules in a session.
+
+    Rules are checked to exist first, so an upsert never breaks the foreign key
+    of the counters.
+
+    :param session: The session
+    :param hits: The number of hits and the time of the last one, in UTC,
+        by rule id
+
+    :return: The number of counters written
+    """
+    rule_ids = list(hits)
+    written = 0
+    for start in range(0, len(rule_ids), HITS_BATCH_SIZE):
+        existing_rule_ids = session.scalars(
+            select(Rule.id).where(
+                Rule.id.in_(rule_ids[start : start + HITS_BATCH_SIZE])
+            )
+        ).all()
+        if not existing_rule_ids:
+            continue
+
+        session.execute(
+            _upsert_statement(session),
+            [
+                {
+                    "rule_id": rule_id,
+                    "hits": hits[rule_id][0],
+                    "last_hit_at": hits[rule_id][1],
+                }
+                for rule_id in existing_rule_ids
+            ],
+        )
+        written += len(existing_rule_ids)
+
+    return written
+
+
+def _upsert_statement(session: orm.Session) -> Insert:
+    """Build an insert of counters adding to the existing ones."""
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    table = RuleHits.__table__
+    statement = dialect.insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.rule_id],
+        set_={
+            "hits": table.c.hits + statement.excluded.hits,
+            # Flushes of several processes may be written out of order
+            "last_hit_at": case(
+                (
+                    statement.excluded.last_hit_at > table.c.last_hit_at,
+                    statement.excluded.last_hit_at,
+                ),
+                else_=table.c.last_hit_at,
+            ),
+        },
+    )
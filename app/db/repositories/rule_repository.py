@@ -1,69 +1,231 @@
 from ipaddress import IPv4Address
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import (
+    Integer,
+    Row,
+    Select,
+    bindparam,
+    delete,
+    func,
+    insert,
+    orm,
+    select,
+    tuple_,
+    type_coerce,
+    update,
+)
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import raiseload
 
-from ..models import FilteringPolicy, Protocol, Rule
-from ..session import Session
+from ..models import FilteringPolicy, Protocol, Rule, RuleHits
+from ..unit_of_work import transaction
+from .positions import position_after, positions_after, reorder_positions
+from .revisions import bump_revision
+
+# Columns identifying a rule in its filtering policy
+RULE_KEY_COLUMNS = (
+    "source_ip",
+    "source_ip_end",
+    "destination_ip",
+    "destination_ip_end",
+    "destination_port",
+    "destination_port_end",
+    "protocol",
+)
+
+
+# Columns of the rule rows serialized without loading Rule objects, the
+# addresses are read as integers
+RULE_ROW_COLUMNS = (
+    Rule.id,
+    Rule.name,
+    type_coerce(Rule.source_ip, Integer).label("source_ip"),
+    type_coerce(Rule.source_ip_end, Integer).label("source_ip_end"),
+    type_coerce(Rule.destination_ip, Integer).label("destination_ip"),
+    type_coerce(Rule.destination_ip_end, Integer).label("destination_ip_end"),
+    Rule.destination_port,
+    Rule.destination_port_end,
+    Rule.protocol,
+    Rule.action,
+)
+
+# Columns of the rules' hit counters, joined to RULE_ROW_COLUMNS, the hit
+# counters of rules never hit are 0 and None
+RULE_HITS_COLUMNS = (
+    func.coalesce(RuleHits.hits, 0).label("hits"),
+    RuleHits.last_hit_at,
+)
+
+
+class ConflictingRulesError(Exception):
+    """
+    Raised when rules have the same source, destination, port and protocol as
+    rules of the filtering policy but differ from them.
+    """
+
+    def __init__(self, rules: list[dict]) -> None:
+        super().__init__(rules)
+        self.rules = rules
 
 
 class RuleRepository:
     @staticmethod
     def add_to_filtering_policy_as_first_rule(filtering_policy_id: int, rule: Rule):
-        with Session() as session:
-            filtering_policy = session.scalar(
-                select(FilteringPolicy)
-                .outerjoin(FilteringPolicy._rules)
-                .where(FilteringPolicy.id == filtering_policy_id)
+        with transaction() as session:
+            filtering_policy = session.get_one(FilteringPolicy, filtering_policy_id)
+            rule.position = position_after(
+                session, Rule, Rule.filtering_policy_id, filtering_policy_id, None
             )
-
-            try:
-                former_first_rule = filtering_policy.rules[0]
-            except IndexError:
-                former_first_rule = None
-
-            filtering_policy.rules = [rule] + filtering_policy.rules
-            rule.next_rule_id = former_first_rule and former_first_rule.id
-
-            session.commit()
+            rule.filtering_policy = filtering_policy
+            session.add(rule)
+            bump_revision(session, rule.filtering_policy.firewall_id)
 
         return rule
 
     @staticmethod
     def add_after_rule(previous_rule_id: int, rule: Rule) -> Rule:
-        with Session() as session:
-            previous_rule = session.scalar(
-                select(Rule)
-                .join(Rule.filtering_policy)
-                .where(Rule.id == previous_rule_id)
-            )
-            previous_rule.filtering_policy._rules.append(rule)
-            session.commit()  # To generate the new rule ID
-            (previous_rule.next_rule_id, rule.next_rule_id) = (
-                rule.id,
-                previous_rule.next_rule_id,
+        with transaction() as session:
+            previous_rule = session.get_one(Rule, previous_rule_id)
+            rule.position = position_after(
+                session,
+                Rule,
+                Rule.filtering_policy_id,
+                previous_rule.filtering_policy_id,
+                previous_rule,
             )
-            session.commit()
+            rule.filtering_policy = previous_rule.filtering_policy
+            session.add(rule)
+            bump_revision(session, rule.filtering_policy.firewall_id)
 
         return rule
 
+    @staticmethod
+    def add_many_after_rule(
+        filtering_policy_id: int, previous_rule_id: Optional[int], rules: list[dict]
+    ) -> int:
+        """
+        Add rules in a single transaction, skipping the ones already in the policy.
+
+        The rules are compared to the existing ones with a single query and the
+        new ones are inserted in batches.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param previous_rule_id: The id of the rule preceding the new ones, None
+            to add them first
+        :param rules: The rules' column values, in order
+
+        :raise NoResultFound: if there is no filtering policy or previous rule
+            with these ids
+        :raise ConflictingRulesError: if rules clash with rules of the policy
+
+        :return: The number of added rules
+        """
+        with transaction() as session:
+            added_rules_count = insert_rules_after(
+                session, filtering_policy_id, previous_rule_id, rules
+            )
+
+        return added_rules_count
+
+    @staticmethod
+    def replace_all(filtering_policy_id: int, rules: list[dict]) -> dict[str, int]:
+        """
+        Replace the rules of a filtering policy in a single transaction.
+
+        Only the rules added, deleted, moved or changed are written, see
+        replace_rules.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param rules: The column values of every rule of the policy, in order
+
+        :raise NoResultFound: if there is no filtering policy with this id
+
+        :return: The number of added, moved, updated and deleted rules
+        """
+        with transaction() as session:
+            counts = replace_rules(session, filtering_policy_id, rules)
+
+        return counts
+
     @staticmethod
     def find_by_id(id: int):
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.get_one(Rule, id)
 
     @staticmethod
     def find_by_filtering_policy_id_and_id(
         filtering_policy_id: int, id: int
     ) -> Optional[Rule]:
-        with Session() as session:
+        with transaction(read_only=True) as session:
             return session.scalar(
                 select(Rule).where(
                     Rule.filtering_policy_id == filtering_policy_id, Rule.id == id
                 )
             )
 
+    @staticmethod
+    def find_page_by_filtering_policy_id(
+        filtering_policy_id: int,
+        limit: Optional[int],
+        after: Optional[tuple[int, int]] = None,
+        with_hits: bool = False,
+    ) -> list[Row]:
+        """
+        Find a page of the ordered rules of a filtering policy.
+
+        The page starts right after a (position, id) key, so it is read with an
+        index range scan whatever its rank in the list. The rules are read as
+        rows of RULE_ROW_COLUMNS, ready to be serialized.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param limit: The maximum number of rules, None for all of them
+        :param after: The (position, id) key of the rule preceding the page,
+            None to start from the first rule
+        :param with_hits: Read the RULE_HITS_COLUMNS too
+
+        :return: The rules' rows, with their position
+        """
+        with transaction(read_only=True) as session:
+            return list(
+                session.execute(
+                    page_by_filtering_policy_id_statement(
+                        filtering_policy_id, limit, after, with_hits
+                    )
+                )
+            )
+
+    @staticmethod
+    def find_row_by_id(id: int, with_hits: bool = False) -> Optional[Row]:
+        """
+        Find a rule thanks to its id, as a row ready to be serialized.
+
+        :param id: The rule's id
+        :param with_hits: Read the RULE_HITS_COLUMNS too
+
+        :return: The row of RULE_ROW_COLUMNS and the filtering policy's id if
+            the rule exists, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.execute(row_by_id_statement(id, with_hits)).first()
+
+    @staticmethod
+    def find_following_rule(
+        filtering_policy_id: int, previous_rule: Optional[Rule]
+    ) -> Optional[Rule]:
+        """
+        Find the rule following another one in a filtering policy.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param previous_rule: The preceding rule, None to get the first rule
+
+        :return: The following rule if there is one, else return None
+        """
+        with transaction(read_only=True) as session:
+            return session.scalar(
+                following_rule_statement(filtering_policy_id, previous_rule)
+            )
+
     @staticmethod
     def find_by_filtering_policy_id_source_destination_and_protocol(
         filtering_policy_id: int,
@@ -71,15 +233,77 @@ class RuleRepository:
         destination_ip: IPv4Address,
         destination_port: int,
         protocol: Protocol,
+        source_ip_end: Optional[IPv4Address] = None,
+        destination_ip_end: Optional[IPv4Address] = None,
+        destination_port_end: Optional[int] = None,
     ) -> Optional[Rule]:
-        with Session() as session:
+        """
+        Find the rule of a filtering policy with given address and port ranges.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param source_ip: The first address of the source range
+        :param destination_ip: The first address of the destination range
+        :param destination_port: The first port of the destination range
+        :param protocol: The rule's protocol
+        :param source_ip_end: The last address of the source range, defaults
+            to source_ip
+        :param destination_ip_end: The last address of the destination range,
+            defaults to destination_ip
+        :param destination_port_end: The last port of the destination range,
+            defaults to destination_port
+
+        :return: The rule if it exists, else return None
+        """
+        with transaction(read_only=True) as session:
             return session.scalar(
-                select(Rule).where(
-                    Rule.filtering_policy_id == filtering_policy_id,
-                    Rule.source_ip == source_ip,
-                    Rule.destination_ip == destination_ip,
-                    Rule.destination_port == destination_port,
-                    Rule.protocol == protocol,
+                by_ranges_statement(
+                    filtering_policy_id,
+                    source_ip,
+                    destination_ip,
+                    destination_port,
+                    protocol,
+                    source_ip_end,
+                    destination_ip_end,
+                    destination_port_end,
+                )
+            )
+
+    @staticmethod
+    def find_matching(
+        filtering_policy_id: int,
+        source_ip: Optional[IPv4Address] = None,
+        destination_ip: Optional[IPv4Address] = None,
+        destination_port: Optional[int] = None,
+        protocol: Optional[Protocol] = None,
+    ) -> list[Rule]:
+        """
+        Find the rules of a filtering policy matching flow values.
+
+        Address ranges are CIDR prefixes, so a prefix holding an address starts
+        at the address masked by the prefix length: the candidates are read by
+        33 index lookups on their start, whatever the size of the policy. Port
+        ranges are read by an index range scan on their start.
+
+        :param filtering_policy_id: The filtering policy's id
+        :param source_ip: The source address to match, None to match any
+        :param destination_ip: The destination address to match, None to match any
+        :param destination_port: The destination port to match, None to match any
+        :param protocol: The protocol to match, None to match any, rules on the
+            ANY protocol match every protocol
+
+        :return: The matching rules in evaluation order, without their
+            filtering policy
+        """
+        with transaction(read_only=True) as session:
+            return list(
+                session.scalars(
+                    matching_statement(
+                        filtering_policy_id,
+                        source_ip,
+                        destination_ip,
+                        destination_port,
+                        protocol,
+                    )
                 )
             )
 
@@ -92,19 +316,290 @@ class RuleRepository:
 
         :return: True if the rule was deleted, False if there was none
         """
-        with Session() as session:
+        with transaction() as session:
             try:
-                previous_rule = session.scalar(
-                    select(Rule).where(Rule.next_rule_id == id)
-                )
                 rule = session.get_one(Rule, id)
-
-                if previous_rule is not None:
-                    previous_rule.next_rule_id = rule.next_rule_id
-
                 session.delete(rule)
-                session.commit()
+                bump_revision(session, rule.filtering_policy.firewall_id)
 
                 return True
             except NoResultFound:
                 return False
+
+
+def insert_rules_after(
+    session: orm.Session,
+    filtering_policy_id: int,
+    previous_rule_id: Optional[int],
+    rules: list[dict],
+) -> int:
+    """
+    Insert rules in a session, skipping the ones already in the policy.
+
+    :param session: The session of the transaction adding the rules
+    :param filtering_policy_id: The filtering policy's id
+    :param previous_rule_id: The id of the rule preceding the new ones, None
+        to add them first
+    :param rules: The rules' column values, in order
+
+    :raise NoResultFound: if there is no filtering policy or previous rule
+        with these ids
+    :raise ConflictingRulesError: if rules clash with rules of the policy
+
+    :return: The number of inserted rules
+    """
+    filtering_policy = session.get_one(FilteringPolicy, filtering_policy_id)
+    previous_rule = None
+    if previous_rule_id is not None:
+        previous_rule = session.get_one(Rule, previous_rule_id)
+
+    existing_rules = {
+        tuple(row[: len(RULE_KEY_COLUMNS)]): row
+        for row in session.execute(
+            select(
+                *(getattr(Rule, column) for column in RULE_KEY_COLUMNS),
+                Rule.name,
+                Rule.action,
+            ).where(Rule.filtering_policy_id == filtering_policy_id)
+        )
+    }
+
+    new_rules = []
+    conflicting_rules = []
+    for rule in rules:
+        existing_rule = existing_rules.get(
+            tuple(rule[column] for column in RULE_KEY_COLUMNS)
+        )
+        if existing_rule is None:
+            new_rules.append(rule)
+        elif (existing_rule.name, existing_rule.action) != (
+            rule["name"],
+            rule["action"],
+        ):
+            conflicting_rules.append(rule)
+
+    if conflicting_rules:
+        raise ConflictingRulesError(conflicting_rules)
+    if not new_rules:
+        return 0
+
+    positions = positions_after(
+        session,
+        Rule,
+        Rule.filtering_policy_id,
+        filtering_policy_id,
+        previous_rule,
+        len(new_rules),
+    )
+    session.execute(
+        insert(Rule.__table__),
+        [
+            {
+                **rule,
+                "filtering_policy_id": filtering_policy_id,
+                "position": position,
+            }
+            for rule, position in zip(new_rules, positions)
+        ],
+    )
+    bump_revision(session, filtering_policy.firewall_id)
+
+    return len(new_rules)
+
+
+def replace_rules(
+    session: orm.Session, filtering_policy_id: int, rules: list[dict]
+) -> dict[str, int]:
+    """
+    Replace the rules of a filtering policy in a session by a new ordered list.
+
+    Rules are matched to the existing ones on their source, destination, port
+    and protocol. The longest run of matched rules already in order keeps its
+    positions, so only the added, deleted, moved and changed rules are written,
+    with a batched statement per kind of write.
+
+    :param session: The session of the transaction replacing the rules
+    :param filtering_policy_id: The filtering policy's id
+    :param rules: The column values of every rule of the policy, in order,
+        with distinct sources, destinations, ports and protocols
+
+    :raise NoResultFound: if there is no filtering policy with this id
+
+    :return: The number of added, moved, updated and deleted rules
+    """
+    filtering_policy = session.get_one(FilteringPolicy, filtering_policy_id)
+
+    existing_rules = {
+        tuple(row[: len(RULE_KEY_COLUMNS)]): row
+        for row in session.execute(
+            select(
+                *(getattr(Rule, column) for column in RULE_KEY_COLUMNS),
+                Rule.id,
+                Rule.position,
+                Rule.name,
+                Rule.action,
+            ).where(Rule.filtering_policy_id == filtering_policy_id)
+        )
+    }
+    matched_rules = [
+        existing_rules.pop(tuple(rule[column] for column in RULE_KEY_COLUMNS), None)
+        for rule in rules
+    ]
+    positions = reorder_positions(
+        [None if row is None else (row.position, row.id) for row in matched_rules]
+    )
+
+    new_rules = []
+    changed_rules = []
+    moved_rules_count = 0
+    updated_rules_count = 0
+    for rule, row, position in zip(rules, matched_rules, positions):
+        if row is None:
+            new_rules.append(
+                {
+                    **rule,
+                    "filtering_policy_id": filtering_policy_id,
+                    "position": position,
+                }
+            )
+            continue
+
+        moved = position != row.position
+        updated = (row.name, row.action) != (rule["name"], rule["action"])
+        if moved or updated:
+            changed_rules.append(
+                {
+                    "id": row.id,
+                    "position": position,
+                    "name": rule["name"],
+                    "action": rule["action"],
+                }
+            )
+        moved_rules_count += moved
+        updated_rules_count += updated
+
+    # The rules left were not matched by any of the new ones
+    deleted_rule_ids = [row.id for row in existing_rules.values()]
+
+    if deleted_rule_ids:
+        session.execute(
+            delete(Rule.__table__).where(Rule.__table__.c.id == bindparam("rule_id")),
+            [{"rule_id": id} for id in deleted_rule_ids],
+        )
+    if changed_rules:
+        session.execute(update(Rule), changed_rules)
+    if new_rules:
+        session.execute(insert(Rule.__table__), new_rules)
+    if deleted_rule_ids or changed_rules or new_rules:
+        bump_revision(session, filtering_policy.firewall_id)
+
+    return {
+        "added": len(new_rules),
+        "moved": moved_rules_count,
+        "updated": updated_rules_count,
+        "deleted": len(deleted_rule_ids),
+    }
+
+
+def page_by_filtering_policy_id_statement(
+    filtering_policy_id: int,
+    limit: Optional[int],
+    after: Optional[tuple[int, int]],
+    with_hits: bool = False,
+) -> Select:
+    """Select the rows of a page of the ordered rules of a filtering policy."""
+    statement = select(Rule.position, *RULE_ROW_COLUMNS).where(
+        Rule.filtering_policy_id == filtering_policy_id
+    )
+    if after is not None:
+        statement = statement.where(tuple_(Rule.position, Rule.id) > after)
+    if with_hits:
+        statement = _with_hits(statement)
+
+    return statement.order_by(Rule.position, Rule.id).limit(limit)
+
+
+def row_by_id_statement(id: int, with_hits: bool = False) -> Select:
+    """Select the row of a rule and its filtering policy's id."""
+    statement = select(Rule.filtering_policy_id, *RULE_ROW_COLUMNS).where(Rule.id == id)
+    return _with_hits(statement) if with_hits else statement
+
+
+def _with_hits(statement: Select) -> Select:
+    return statement.add_columns(*RULE_HITS_COLUMNS).outerjoin(
+        RuleHits, RuleHits.rule_id == Rule.id
+    )
+
+
+def following_rule_statement(
+    filtering_policy_id: int, previous_rule: Optional[Rule]
+) -> Select:
+    """Select the rule following another one in a filtering policy."""
+    statement = select(Rule).where(Rule.filtering_policy_id == filtering_policy_id)
+    if previous_rule is not None:
+        statement = statement.where(
+            tuple_(Rule.position, Rule.id) > (previous_rule.position, previous_rule.id)
+        )
+
+    return statement.order_by(Rule.position, Rule.id).limit(1)
+
+
+def by_ranges_statement(
+    filtering_policy_id: int,
+    source_ip: IPv4Address,
+    destination_ip: IPv4Address,
+    destination_port: int,
+    protocol: Protocol,
+    source_ip_end: Optional[IPv4Address],
+    destination_ip_end: Optional[IPv4Address],
+    destination_port_end: Optional[int],
+) -> Select:
+    """Select the rule of a filtering policy with given address and port ranges."""
+    return select(Rule).where(
+        Rule.filtering_policy_id == filtering_policy_id,
+        Rule.source_ip == source_ip,
+        Rule.source_ip_end == (source_ip_end or source_ip),
+        Rule.destination_ip == destination_ip,
+        Rule.destination_ip_end == (destination_ip_end or destination_ip),
+        Rule.destination_port == destination_port,
+        Rule.destination_port_end
+        == (destination_port if destination_port_end is None else destination_port_end),
+        Rule.protocol == protocol,
+    )
+
+
+def matching_statement(
+    filtering_policy_id: int,
+    source_ip: Optional[IPv4Address],
+    destination_ip: Optional[IPv4Address],
+    destination_port: Optional[int],
+    protocol: Optional[Protocol],
+) -> Select:
+    """Select the rules of a filtering policy matching flow values."""
+    statement = select(Rule).where(Rule.filtering_policy_id == filtering_policy_id)
+    if source_ip is not None:
+        statement = statement.where(
+            Rule.source_ip.in_(_prefix_starts(source_ip)),
+            Rule.source_ip_end >= source_ip,
+        )
+    if destination_ip is not None:
+        statement = statement.where(
+            Rule.destination_ip.in_(_prefix_starts(destination_ip)),
+            Rule.destination_ip_end >= destination_ip,
+        )
+    if destination_port is not None:
+        statement = statement.where(
+            Rule.destination_port <= destination_port,
+            Rule.destination_port_end >= destination_port,
+        )
+    if protocol is not None:
+        statement = statement.where(Rule.protocol.in_((protocol, Protocol.ANY)))
+
+    return statement.order_by(Rule.position, Rule.id).options(
+        raiseload(Rule.filtering_policy)
+    )
+
+
+def _prefix_starts(address: IPv4Address) -> list[int]:
+    """Compute the first address of every CIDR prefix holding an address."""
+    return [int(address) & (0xFFFFFFFF << (32 - length)) for length in range(33)]
@@ -1,5 +1,156 @@
-from sqlalchemy import create_engine
+"""
+Database engines and session factories.
+
+Writes go to the engine of DATABASE_URL. When DATABASE_READ_URL is set, read
+only units of work and repository reads made outside a unit of work go to
+its engine, a replica file or a read replica, so readers don't wait behind
+writers. Without it, both engines are the same.
+
+The async engines are only created when an async unit of work first needs
+them, so the Flask app and the commands don't need the async drivers.
+"""
+
+from functools import cache
+from typing import Callable
+
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from .settings import DatabaseSettings
+
+# Drivers used by the async engines, by backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+settings = DatabaseSettings.from_env()
+
+
+def create_configured_engine(url: str, read_only: bool = False) -> Engine:
+    """
+    Create an engine with the pool and SQLite settings.
+
+    :param url: The database URL
+    :param read_only: Forbid writes through the engine's SQLite connections
+
+    :return: The engine
+    """
+    engine = create_engine(url, **_pool_options(url, QueuePool))
+    _configure_sqlite(engine, url, read_only)
+    return engine
+
+
+def create_configured_async_engine(url: str, read_only: bool = False) -> AsyncEngine:
+    """
+    Create an async engine with the pool and SQLite settings.
+
+    :param url: The database URL, its async driver is picked from ASYNC_DRIVERS
+    :param read_only: Forbid writes through the engine's SQLite connections
+
+    :return: The engine
+    """
+    sqlalchemy_url = make_url(url)
+    backend = sqlalchemy_url.get_backend_name()
+    async_url = sqlalchemy_url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    engine = create_async_engine(async_url, **_pool_options(url, AsyncAdaptedQueuePool))
+    _configure_sqlite(engine.sync_engine, url, read_only)
+    return engine
+
+
+def _pool_options(url: str, pool_class: type[Pool]) -> dict:
+    sqlalchemy_url = make_url(url)
+    if sqlalchemy_url.get_backend_name() == "sqlite" and sqlalchemy_url.database in (
+        None,
+        "",
+        ":memory:",
+    ):
+        # In-memory databases live in a single connection
+        return {}
 
-engine = create_engine("sqlite:///db.sqlite3")
+    return {
+        "poolclass": pool_class,
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout,
+    }
+
+
+def _configure_sqlite(engine: Engine, url: str, read_only: bool) -> None:
+    if make_url(url).get_backend_name() != "sqlite":
+        return
+
+    pragmas = [
+        # SQLite ignores the foreign keys, and their ON DELETE CASCADE, without it
+        "foreign_keys=ON",
+        f"journal_mode={settings.sqlite_journal_mode}",
+        f"synchronous={settings.sqlite_synchronous}",
+        f"mmap_size={settings.sqlite_mmap_size}",
+        f"cache_size={settings.sqlite_cache_size}",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+engine = create_configured_engine(settings.url)
+read_engine = (
+    engine
+    if settings.read_url is None
+    else create_configured_engine(settings.read_url, read_only=True)
+)
 Session = sessionmaker(engine, expire_on_commit=False)
+ReadSession = sessionmaker(read_engine, expire_on_commit=False)
+
+# Used by the async repositories when the app is served by an ASGI server,
+# bound by async_engines
+AsyncSession = async_sessionmaker(expire_on_commit=False)
+AsyncReadSession = async_sessionmaker(expire_on_commit=False)
+
+# Called with the sync engine of each async engine once it is created
+async_engine_listeners: list[Callable[[Engine], None]] = []
+
+
+@cache
+def async_engines() -> tuple[AsyncEngine, AsyncEngine]:
+    """
+    Create the async engines and bind AsyncSession and AsyncReadSession to them.
+
+    :return: The async engines of DATABASE_URL and DATABASE_READ_URL
+    """
+    async_engine = create_configured_async_engine(settings.url)
+    async_read_engine = (
+        async_engine
+        if settings.read_url is None
+        else create_configured_async_engine(settings.read_url, read_only=True)
+    )
+    AsyncSession.configure(bind=async_engine)
+    AsyncReadSession.configure(bind=async_read_engine)
+
+    for listener in async_engine_listeners:
+        for created_engine in {async_engine, async_read_engine}:
+            listener(created_engine.sync_engine)
+
+    return async_engine, async_read_engine
+
+
+def async_session_factory(read_only: bool = False) -> async_sessionmaker:
+    """
+    Find the factory of async sessions, creating the async engines first.
+
+    :param read_only: Use the read engine
+
+    :return: AsyncReadSession or AsyncSession
+    """
+    async_engines()
+    return AsyncReadSession if read_only else AsyncSession
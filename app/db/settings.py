@@ -0,0 +1,79 @@
+"""Database settings, read from the environment or a .env file"""
+
+from __future__ import annotations
+
+import os
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+class DatabaseSettings(NamedTuple):
+    """
+    Settings of the database engines.
+
+    The SQLite settings are only used when the database is SQLite, the cache
+    size follows the cache_size pragma: negative values are in KiB.
+    """
+
+    url: str = "sqlite:///db.sqlite3"
+    read_url: Optional[str] = None
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64 * 1024
+
+    @classmethod
+    def from_env(cls) -> DatabaseSettings:
+        """
+        Read the settings from DATABASE_* and SQLITE_* environment variables.
+
+        Unset variables keep their default value.
+
+        :raise ValueError: if a variable has an invalid value
+
+        :return: The settings
+        """
+        defaults = cls()
+        settings = cls(
+            url=os.environ.get("DATABASE_URL", defaults.url),
+            read_url=os.environ.get("DATABASE_READ_URL") or None,
+            pool_size=int(os.environ.get("DATABASE_POOL_SIZE", defaults.pool_size)),
+            max_overflow=int(
+                os.environ.get("DATABASE_MAX_OVERFLOW", defaults.max_overflow)
+            ),
+            pool_timeout=float(
+                os.environ.get("DATABASE_POOL_TIMEOUT", defaults.pool_timeout)
+            ),
+            sqlite_journal_mode=os.environ.get(
+                "SQLITE_JOURNAL_MODE", defaults.sqlite_journal_mode
+            ).upper(),
+            sqlite_synchronous=os.environ.get(
+                "SQLITE_SYNCHRONOUS", defaults.sqlite_synchronous
+            ).upper(),
+            sqlite_mmap_size=int(
+                os.environ.get("SQLITE_MMAP_SIZE", defaults.sqlite_mmap_size)
+            ),
+            sqlite_cache_size=int(
+                os.environ.get("SQLITE_CACHE_SIZE", defaults.sqlite_cache_size)
+            ),
+        )
+
+        if settings.sqlite_journal_mode not in SQLITE_JOURNAL_MODES:
+            raise ValueError(
+                f"Invalid SQLITE_JOURNAL_MODE '{settings.sqlite_journal_mode}'"
+            )
+        if settings.sqlite_synchronous not in SQLITE_SYNCHRONOUS_MODES:
+            raise ValueError(
+                f"Invalid SQLITE_SYNCHRONOUS '{settings.sqlite_synchronous}'"
+            )
+
+        return settings
@@ -0,0 +1,112 @@
+"""
+Request-scoped units of work.
+
+Repository calls made in a unit of work share its session, so an endpoint
+runs in a single transaction and objects loaded by a repository call are
+found in the identity map by the next ones instead of being queried again.
+Outside a unit of work, every repository call has its own transaction.
+
+Read only units of work and read only repository calls made outside a unit of
+work use the read engine. Reads made in a writing unit of work use the write
+engine, so they see the changes of the unit of work.
+"""
+
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
+
+from sqlalchemy import orm
+from sqlalchemy.ext import asyncio
+
+from .session import ReadSession, Session, async_session_factory
+
+_session: ContextVar[Optional[orm.Session]] = ContextVar("session", default=None)
+_async_session: ContextVar[Optional[asyncio.AsyncSession]] = ContextVar(
+    "async_session", default=None
+)
+
+
+@contextmanager
+def unit_of_work(read_only: bool = False) -> Iterator[orm.Session]:
+    """
+    Run repository calls in a single transaction, committed at the end.
+
+    Can also decorate an endpoint: @unit_of_work()
+
+    :param read_only: Use the read engine, the repository calls must not write
+
+    :return: The shared session
+    """
+    with (ReadSession if read_only else Session).begin() as session:
+        token = _session.set(session)
+        try:
+            yield session
+        finally:
+            _session.reset(token)
+
+
+@contextmanager
+def transaction(read_only: bool = False) -> Iterator[orm.Session]:
+    """
+    Give a repository call the session of the current unit of work.
+
+    Outside a unit of work, a new session is used and committed at the end of
+    the block. In a unit of work, changes are only flushed, so new rows get
+    their ids, and the unit of work commits them.
+
+    :param read_only: The call doesn't write, it can use the read engine when
+        there is no unit of work
+
+    :return: The session
+    """
+    session = _session.get()
+    if session is None:
+        with (ReadSession if read_only else Session).begin() as session:
+            yield session
+    else:
+        yield session
+        session.flush()
+
+
+@asynccontextmanager
+async def async_unit_of_work(
+    read_only: bool = False,
+) -> AsyncIterator[asyncio.AsyncSession]:
+    """
+    Run async repository calls in a single transaction, committed at the end.
+
+    Can also decorate an async endpoint: @async_unit_of_work()
+
+    :param read_only: Use the read engine, the repository calls must not write
+
+    :return: The shared session
+    """
+    async with async_session_factory(read_only).begin() as session:
+        token = _async_session.set(session)
+        try:
+            yield session
+        finally:
+            _async_session.reset(token)
+
+
+@asynccontextmanager
+async def async_transaction(
+    read_only: bool = False,
+) -> AsyncIterator[asyncio.AsyncSession]:
+    """
+    Give an async repository call the session of the current unit of work.
+
+    See transaction.
+
+    :param read_only: The call doesn't write, it can use the read engine when
+        there is no unit of work
+
+    :return: The session
+    """
+    session = _async_session.get()
+    if session is None:
+        async with async_session_factory(read_only).begin() as session:
+            yield session
+    else:
+        yield session
+        await session.flush()
@@ -0,0 +1,113 @@
+from http import HTTPStatus
+from typing import Optional
+
+import anyio
+from connexion import request
+from starlette.responses import Response
+
+from app.cache import (
+    add_decision,
+    async_get_configuration,
+    async_get_snapshot,
+    cached_configuration,
+    find_decision,
+    snapshot_configuration,
+)
+from app.db.repositories import AsyncFirewallRepository
+from app.db.unit_of_work import async_unit_of_work
+from app.evaluation import InvalidFlowError, rule_hit_counters
+from app.validation.validators import NDJSON_MIMETYPE
+
+from .evaluation_endpoints import evaluate_batch, not_found_error, parse_flow
+from .firewall_endpoints import INVALID_SNAPSHOT_AT_ERROR
+from .utils import JSON_HEADERS, parse_snapshot_at
+
+
+@async_unit_of_work(read_only=True)
+async def evaluate_flows(id: int, body=None, at: Optional[str] = None):
+    if at is None:
+        configuration = await async_get_configuration(id, with_rules=True)
+    else:
+        try:
+            configuration = await async_get_snapshot(
+                id, parse_snapshot_at(at), with_rules=True
+            )
+        except ValueError:
+            return (
+                {"errors": [INVALID_SNAPSHOT_AT_ERROR]},
+                HTTPStatus.BAD_REQUEST,
+                JSON_HEADERS,
+            )
+    compiled_firewall = configuration.compiled if configuration else None
+    if compiled_firewall is None:
+        return (
+            {"errors": [not_found_error(id, at)]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    is_ndjson = request.mimetype == NDJSON_MIMETYPE
+    # Large batches take a while to decode, match and render, they are
+    # evaluated in the threadpool so they don't stall the event loop
+    try:
+        decisions = await anyio.to_thread.run_sync(
+            evaluate_batch, compiled_firewall, body, is_ndjson, at is None
+        )
+    except InvalidFlowError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST, JSON_HEADERS
+
+    return Response(
+        decisions,
+        status_code=HTTPStatus.OK,
+        media_type=NDJSON_MIMETYPE if is_ndjson else "application/json",
+    )
+
+
+@async_unit_of_work(read_only=True)
+async def get_decision(
+    id: int,
+    source_ip: str,
+    destination_ip: str,
+    destination_port: int,
+    protocol: str,
+    at: Optional[str] = None,
+):
+    try:
+        flow = parse_flow(source_ip, destination_ip, destination_port, protocol)
+    except InvalidFlowError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST, JSON_HEADERS
+
+    if at is None:
+        revision = await AsyncFirewallRepository.find_revision(id)
+        configuration_at = cached_configuration
+    else:
+        try:
+            revision = await AsyncFirewallRepository.find_snapshot_revision(
+                id, parse_snapshot_at(at)
+            )
+        except ValueError:
+            return (
+                {"errors": [INVALID_SNAPSHOT_AT_ERROR]},
+                HTTPStatus.BAD_REQUEST,
+                JSON_HEADERS,
+            )
+        configuration_at = snapshot_configuration
+    decision = None
+    if revision is not None:
+        decision = find_decision(id, revision, flow)
+        if decision is None:
+            configuration = await configuration_at(id, revision).load(with_rules=True)
+            decision = add_decision(configuration, flow)
+    if decision is None:
+        return (
+            {"errors": [not_found_error(id, at)]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    if decision.rule_id is not None and at is None:
+        rule_hit_counters.record_hit(decision.rule_id)
+
+    return Response(
+        decision.decision, status_code=HTTPStatus.OK, media_type="application/json"
+    )
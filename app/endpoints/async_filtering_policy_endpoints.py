@@ -0,0 +1,272 @@
+import json
+from http import HTTPStatus
+from typing import Optional
+
+from pydantic import ValidationError
+from sqlalchemy.exc import NoResultFound
+from starlette.responses import Response
+
+from app.cache import cached_configuration
+from app.db.models import FilteringPolicy
+from app.db.repositories import (
+    AsyncFilteringPolicyRepository,
+    AsyncFirewallRepository,
+    AsyncRuleRepository,
+)
+from app.db.unit_of_work import async_unit_of_work
+from app.serialization import (
+    add_members,
+    array_fragment,
+    rule_fragment,
+    rule_with_hits_fragment,
+)
+from app.validation.filtering_policy_models import PostFilteringPolicyModel
+from app.validation.utils import translate_errors
+
+from .async_utils import json_response, not_modified_response
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursorError,
+    decode_cursor,
+    split_page,
+)
+from .utils import configuration_etag, etag_headers
+
+
+@async_unit_of_work()
+async def add_filtering_policy(firewall_id, body):
+    try:
+        post_filtering_policy_model = PostFilteringPolicyModel(**body)
+    except ValidationError as err:
+        return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
+
+    try:
+        await AsyncFirewallRepository.find_by_id(firewall_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No firewall found with id '{firewall_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    previous_filtering_policy = None
+    if post_filtering_policy_model.previous_filtering_policy_id is not None:
+        previous_filtering_policy = (
+            await AsyncFilteringPolicyRepository.find_by_firewall_id_and_id(
+                firewall_id, post_filtering_policy_model.previous_filtering_policy_id
+            )
+        )
+
+        if previous_filtering_policy is None:
+            return {
+                "errors": [
+                    f"No filtering policy found with id '{post_filtering_policy_model.previous_filtering_policy_id}' on firewall with id '{firewall_id}'"
+                ]
+            }
+
+    similar_filtering_policy = (
+        await AsyncFilteringPolicyRepository.find_by_firewall_id_and_name(
+            firewall_id, post_filtering_policy_model.name
+        )
+    )
+
+    if similar_filtering_policy:
+        if await _policy_has_different_position(
+            firewall_id, previous_filtering_policy, similar_filtering_policy
+        ):
+            return {
+                "errors": [
+                    f"Filtering policy with name '{post_filtering_policy_model.name}' already exists on firewall with id '{firewall_id}'"
+                ]
+            }
+
+        return similar_filtering_policy.convert_to_json(), HTTPStatus.CREATED
+
+    filtering_policy = FilteringPolicy(
+        firewall_id=firewall_id, name=post_filtering_policy_model.name
+    )
+    if post_filtering_policy_model.previous_filtering_policy_id is None:
+        filtering_policy = (
+            await AsyncFilteringPolicyRepository.add_to_firewall_as_first_policy(
+                firewall_id, filtering_policy
+            )
+        )
+    else:
+        filtering_policy = (
+            await AsyncFilteringPolicyRepository.add_after_filtering_policy(
+                previous_filtering_policy.id, filtering_policy
+            )
+        )
+
+    return filtering_policy.convert_to_json(), HTTPStatus.CREATED
+
+
+async def _policy_has_different_position(
+    firewall_id: int,
+    previous_filtering_policy: Optional[FilteringPolicy],
+    filtering_policy: FilteringPolicy,
+):
+    following_filtering_policy = (
+        await AsyncFilteringPolicyRepository.find_following_filtering_policy(
+            firewall_id, previous_filtering_policy
+        )
+    )
+
+    return (
+        following_filtering_policy is None
+        or following_filtering_policy.id != filtering_policy.id
+    )
+
+
+@async_unit_of_work(read_only=True)
+async def get_filtering_policy(
+    id: int,
+    show_rules: bool = False,
+    show_hits: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    firewall = await AsyncFirewallRepository.find_revision_by_filtering_policy_id(id)
+    if firewall is None:
+        return {
+            "errors": [f"No filtering policy found with id '{id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    show_hits = show_hits and show_rules
+    # Hit counters change without the configuration, responses holding them
+    # have no ETag
+    etag = configuration_etag(firewall.id, firewall.revision) if not show_hits else None
+    if etag is not None and (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    paginate_rules = show_rules and (limit is not None or cursor is not None)
+
+    render_rules = show_rules and not paginate_rules and not show_hits
+    configuration = await cached_configuration(firewall.id, firewall.revision).load(
+        with_rules=render_rules
+    )
+    if render_rules:
+        filtering_policy = configuration.filtering_policies_with_rules_by_id.get(id)
+    else:
+        filtering_policy = configuration.filtering_policies_by_id.get(id)
+
+    if filtering_policy is None:
+        return {
+            "errors": [f"No filtering policy found with id '{id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    if paginate_rules:
+        return await _get_filtering_policy_rules_page(
+            id, filtering_policy, limit or DEFAULT_PAGE_SIZE, cursor, etag, show_hits
+        )
+    if show_hits:
+        rules = await AsyncRuleRepository.find_page_by_filtering_policy_id(
+            id, None, with_hits=True
+        )
+        return json_response(
+            add_members(
+                filtering_policy,
+                rules=array_fragment(rule_with_hits_fragment(rule) for rule in rules),
+            ),
+            etag,
+        )
+
+    return json_response(filtering_policy, etag)
+
+
+async def _get_filtering_policy_rules_page(
+    id: int,
+    filtering_policy: str,
+    limit: int,
+    cursor: Optional[str],
+    etag: Optional[str],
+    show_hits: bool,
+):
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except InvalidCursorError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+
+    rules, next_cursor = split_page(
+        await AsyncRuleRepository.find_page_by_filtering_policy_id(
+            id, limit + 1, after, with_hits=show_hits
+        ),
+        limit,
+    )
+
+    return json_response(
+        add_members(
+            filtering_policy,
+            rules=array_fragment(
+                (rule_with_hits_fragment if show_hits else rule_fragment)(rule)
+                for rule in rules
+            ),
+            next_cursor=json.dumps(next_cursor),
+        ),
+        etag,
+    )
+
+
+@async_unit_of_work(read_only=True)
+async def get_filtering_policies(
+    firewall_id: int, limit: Optional[int] = None, cursor: Optional[str] = None
+):
+    revision = await AsyncFirewallRepository.find_revision(firewall_id)
+    if revision is None:
+        return {
+            "errors": [f"No firewall found with id '{firewall_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    etag = configuration_etag(firewall_id, revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    if limit is not None or cursor is not None:
+        return await _get_filtering_policies_page(
+            firewall_id, limit or DEFAULT_PAGE_SIZE, cursor, etag
+        )
+
+    configuration = await cached_configuration(firewall_id, revision).load()
+    if configuration.filtering_policies is None:
+        return {
+            "errors": [f"No firewall found with id '{firewall_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    return json_response(configuration.filtering_policies, etag)
+
+
+async def _get_filtering_policies_page(
+    firewall_id: int, limit: int, cursor: Optional[str], etag: str
+):
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except InvalidCursorError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+
+    try:
+        firewall = await AsyncFirewallRepository.find_by_id(firewall_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No firewall found with id '{firewall_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    filtering_policies, next_cursor = split_page(
+        await AsyncFilteringPolicyRepository.find_page_by_firewall_id(
+            firewall_id, limit + 1, after
+        ),
+        limit,
+    )
+
+    result = firewall.convert_to_json()
+    result["filtering_policies"] = [
+        filtering_policy.convert_to_json(show_firewall=False)
+        for filtering_policy in filtering_policies
+    ]
+    result["next_cursor"] = next_cursor
+
+    return result, HTTPStatus.OK, etag_headers(etag)
+
+
+@async_unit_of_work()
+async def delete_filtering_policy(id: int):
+    await AsyncFilteringPolicyRepository.delete(id)
+
+    return Response(status_code=HTTPStatus.NO_CONTENT)
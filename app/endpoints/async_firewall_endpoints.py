@@ -0,0 +1,233 @@
+import io
+import zlib
+from http import HTTPStatus
+from ipaddress import IPv4Address
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import anyio
+from connexion import request
+from pydantic import ValidationError
+from sqlalchemy.exc import NoResultFound
+from starlette.responses import Response, StreamingResponse
+
+from app.cache import async_get_snapshot, cached_configuration
+from app.db.models import Firewall
+from app.db.repositories import AsyncFirewallRepository, FirewallRepository
+from app.db.repositories.firewall_repository import FilteringPolicyExistsError
+from app.db.unit_of_work import async_unit_of_work
+from app.importing import DumpReader, InvalidDumpError
+from app.validation.firewall_models import PostFirewallModel
+from app.validation.utils import translate_errors
+from app.validation.validators import NDJSON_MIMETYPE
+
+from .async_utils import json_response, not_modified_response
+from .firewall_endpoints import (
+    EXPORT_CHUNK_LINES,
+    GZIP_WBITS,
+    INVALID_SNAPSHOT_AT_ERROR,
+    filtering_policy_exists_error,
+    filtering_policy_export_line,
+    firewall_export_line,
+    import_result,
+    rule_export_line,
+    snapshot_not_found_error,
+)
+from .utils import (
+    JSON_HEADERS,
+    RULESET_MIMETYPE,
+    configuration_etag,
+    etag_headers,
+    parse_snapshot_at,
+)
+
+# Size of a received dump kept in memory, larger ones are written to a file
+IMPORT_SPOOL_SIZE = 1 << 20
+
+
+@async_unit_of_work()
+async def add_firewall(body: dict):
+    try:
+        PostFirewallModel(**body)
+    except ValidationError as err:
+        return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
+
+    same_id_and_port_firewall = (
+        await AsyncFirewallRepository.find_by_ip_address_and_port(
+            body["ip_address"], body["port"]
+        )
+    )
+
+    if same_id_and_port_firewall is None:
+        return (
+            (await AsyncFirewallRepository.add(Firewall(**body))).convert_to_json(),
+            HTTPStatus.CREATED,
+        )
+    elif not same_id_and_port_firewall.is_similar(
+        Firewall(
+            name=body["name"],
+            ip_address=IPv4Address(body["ip_address"]),
+            port=body["port"],
+        )
+    ):
+        return {
+            "errors": ["A firewall with this address and port already exists"]
+        }, HTTPStatus.BAD_REQUEST
+
+    return same_id_and_port_firewall.convert_to_json(), HTTPStatus.CREATED
+
+
+@async_unit_of_work(read_only=True)
+async def get_firewall(id: int, at: Optional[str] = None):
+    if at is not None:
+        return await get_firewall_snapshot(id, at)
+
+    revision = await AsyncFirewallRepository.find_revision(id)
+    if revision is None:
+        return {"errors": [f"No firewall found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    etag = configuration_etag(id, revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    configuration = await cached_configuration(id, revision).load()
+    if configuration.firewall is None:
+        return {"errors": [f"No firewall found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    return json_response(configuration.firewall, etag)
+
+
+async def get_firewall_snapshot(id: int, at: str):
+    try:
+        configuration = await async_get_snapshot(
+            id, parse_snapshot_at(at), with_rules=True
+        )
+    except ValueError:
+        return {"errors": [INVALID_SNAPSHOT_AT_ERROR]}, HTTPStatus.BAD_REQUEST
+    if configuration is None or configuration.configuration is None:
+        return {"errors": [snapshot_not_found_error(id, at)]}, HTTPStatus.NOT_FOUND
+
+    etag = configuration_etag(id, configuration.revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    return json_response(configuration.configuration, etag)
+
+
+@async_unit_of_work(read_only=True)
+async def render_firewall(id: int, format: str = "nftables"):
+    revision = await AsyncFirewallRepository.find_revision(id)
+    if revision is None:
+        return (
+            {"errors": [f"No firewall found with id '{id}'"]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    etag = configuration_etag(id, revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    configuration = await cached_configuration(id, revision).load(with_rules=True)
+    if configuration.firewall is None:
+        return (
+            {"errors": [f"No firewall found with id '{id}'"]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    # The first render of a ruleset runs in the threadpool while it is sent
+    return StreamingResponse(
+        configuration.ruleset(format),
+        status_code=HTTPStatus.OK,
+        media_type=RULESET_MIMETYPE,
+        headers=etag_headers(etag),
+    )
+
+
+async def export_firewall(id: int, compression: Optional[str] = None):
+    try:
+        firewall = await AsyncFirewallRepository.find_by_id(id)
+    except NoResultFound:
+        return (
+            {"errors": [f"No firewall found with id '{id}'"]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    chunks = _export_chunks(firewall)
+    headers = {}
+    if compression == "gzip":
+        chunks = _gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        chunks, status_code=HTTPStatus.OK, media_type=NDJSON_MIMETYPE, headers=headers
+    )
+
+
+async def _export_chunks(firewall: Firewall) -> AsyncIterator[bytes]:
+    lines = [firewall_export_line(firewall)]
+
+    filtering_policy_id = None
+    async for row in AsyncFirewallRepository.iter_configuration(firewall.id):
+        if row.filtering_policy_id != filtering_policy_id:
+            filtering_policy_id = row.filtering_policy_id
+            lines.append(filtering_policy_export_line(row))
+
+        if row.id is not None:
+            lines.append(rule_export_line(row))
+
+        if len(lines) >= EXPORT_CHUNK_LINES:
+            yield "".join(lines).encode()
+            lines = []
+
+    if lines:
+        yield "".join(lines).encode()
+
+
+async def _gzip_chunks(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=GZIP_WBITS)
+    async for chunk in chunks:
+        if compressed_chunk := compressor.compress(chunk):
+            yield compressed_chunk
+    yield compressor.flush()
+
+
+# Not in a unit of work, the import's transaction is rolled back when the dump
+# turns out to be invalid
+async def import_firewall(id: int, format: Optional[str] = None):
+    # The dump is received first, then read and inserted by the synchronous
+    # repository in a worker thread, parsing it on the event loop would block
+    # the other requests for the whole import
+    with SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE) as dump:
+        async for chunk in request.stream():
+            dump.write(chunk)
+        dump.seek(0)
+
+        reader = DumpReader(
+            io.TextIOWrapper(dump, encoding="utf-8", errors="replace"), format
+        )
+        try:
+            counts = await anyio.to_thread.run_sync(
+                FirewallRepository.import_configuration, id, reader
+            )
+        except NoResultFound:
+            return {
+                "errors": [f"No firewall found with id '{id}'"]
+            }, HTTPStatus.NOT_FOUND
+        except InvalidDumpError as err:
+            return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+        except FilteringPolicyExistsError as err:
+            return {
+                "errors": [filtering_policy_exists_error(id, err.name)]
+            }, HTTPStatus.BAD_REQUEST
+
+    return import_result(counts, reader), HTTPStatus.CREATED
+
+
+@async_unit_of_work()
+async def delete_firewall(id: int):
+    await AsyncFirewallRepository.delete(id)
+
+    return Response(status_code=HTTPStatus.NO_CONTENT)
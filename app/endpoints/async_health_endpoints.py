@@ -0,0 +1,7 @@
+from http import HTTPStatus
+
+from starlette.responses import Response
+
+
+async def get_health():
+    return Response(status_code=HTTPStatus.NO_CONTENT)
@@ -0,0 +1,11 @@
+from http import HTTPStatus
+
+from starlette.responses import Response
+
+from app.metrics import render_metrics
+
+
+async def get_metrics():
+    metrics, content_type = render_metrics()
+
+    return Response(metrics, status_code=HTTPStatus.OK, media_type=content_type)
@@ -0,0 +1,18 @@
+from connexion.resolver import Resolver
+
+
+class AsyncResolver(Resolver):
+    """
+    Resolve the operations of the spec to the async endpoints.
+
+    The spec names the sync handlers, app.endpoints.x.f is served by
+    app.endpoints.async_x.f, so both stay in sync with a single spec.
+    """
+
+    def resolve_operation_id(self, operation) -> str:
+        module_name, _, function_name = (
+            super().resolve_operation_id(operation).rpartition(".")
+        )
+        package_name, _, module = module_name.rpartition(".")
+
+        return f"{package_name}.async_{module}.{function_name}"
@@ -0,0 +1,264 @@
+from http import HTTPStatus
+from typing import Optional
+
+from connexion import request
+from pydantic import ValidationError
+from sqlalchemy.exc import NoResultFound
+from starlette.responses import Response
+
+from app.cache import cached_configuration
+from app.db.models import Rule
+from app.db.repositories import (
+    AsyncFilteringPolicyRepository,
+    AsyncFirewallRepository,
+    AsyncRuleRepository,
+)
+from app.db.repositories.rule_repository import (
+    RULE_KEY_COLUMNS,
+    ConflictingRulesError,
+)
+from app.db.unit_of_work import async_unit_of_work
+from app.serialization import add_members, rule_fragment, rule_with_hits_fragment
+from app.validation.rule_models import MatchRulesModel, PostRuleModel, RuleListModel
+from app.validation.utils import (
+    InvalidNDJSONError,
+    decode_ndjson,
+    translate_errors,
+    translate_list_errors,
+)
+from app.validation.validators import NDJSON_MIMETYPE
+
+from .async_utils import json_response, not_modified_response
+from .rule_endpoints import conflicting_rules_errors
+from .utils import configuration_etag
+
+
+@async_unit_of_work()
+async def add_rule(filtering_policy_id: int, body: dict):
+    try:
+        post_rule_model = PostRuleModel(**body)
+    except ValidationError as err:
+        return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
+
+    try:
+        await AsyncFilteringPolicyRepository.find_by_id(filtering_policy_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    previous_rule = None
+    if post_rule_model.previous_rule_id is not None:
+        previous_rule = await AsyncRuleRepository.find_by_filtering_policy_id_and_id(
+            filtering_policy_id, post_rule_model.previous_rule_id
+        )
+
+        if previous_rule is None:
+            return {
+                "errors": [
+                    f"No rule found with id '{post_rule_model.previous_rule_id}' on filtering policy with id '{filtering_policy_id}'"
+                ]
+            }
+
+    columns = post_rule_model.to_columns()
+    similar_rule = await AsyncRuleRepository.find_by_filtering_policy_id_source_destination_and_protocol(
+        filtering_policy_id,
+        columns["source_ip"],
+        columns["destination_ip"],
+        columns["destination_port"],
+        columns["protocol"],
+        source_ip_end=columns["source_ip_end"],
+        destination_ip_end=columns["destination_ip_end"],
+        destination_port_end=columns["destination_port_end"],
+    )
+
+    rule = Rule(filtering_policy_id=filtering_policy_id, **columns)
+    if similar_rule:
+        if similar_rule != rule or await _rule_has_different_location(
+            filtering_policy_id, previous_rule, similar_rule
+        ):
+            return {
+                "errors": [
+                    f"Rule with same source, destination and protocol already exists on filtering_policy with id '{filtering_policy_id}'"
+                ]
+            }
+        return (
+            similar_rule.convert_to_json(show_filtering_policy=True),
+            HTTPStatus.CREATED,
+        )
+
+    if post_rule_model.previous_rule_id is None:
+        rule = await AsyncRuleRepository.add_to_filtering_policy_as_first_rule(
+            filtering_policy_id, rule
+        )
+    else:
+        rule = await AsyncRuleRepository.add_after_rule(previous_rule.id, rule)
+
+    return rule.convert_to_json(show_filtering_policy=True), HTTPStatus.CREATED
+
+
+@async_unit_of_work()
+async def add_rules(
+    filtering_policy_id: int, body=None, previous_rule_id: Optional[int] = None
+):
+    try:
+        if request.mimetype == NDJSON_MIMETYPE:
+            body = list(decode_ndjson(body or b""))
+        rule_models = RuleListModel.validate_python(body)
+    except InvalidNDJSONError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+    except ValidationError as err:
+        return translate_list_errors(err.errors(), "Rule"), HTTPStatus.BAD_REQUEST
+
+    rules = [rule_model.to_columns() for rule_model in rule_models]
+    keys = {tuple(rule[column] for column in RULE_KEY_COLUMNS) for rule in rules}
+    if len(keys) != len(rules):
+        return {
+            "errors": [
+                "Several rules have the same source, destination, port and protocol"
+            ]
+        }, HTTPStatus.BAD_REQUEST
+
+    try:
+        await AsyncFilteringPolicyRepository.find_by_id(filtering_policy_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    if previous_rule_id is not None and (
+        await AsyncRuleRepository.find_by_filtering_policy_id_and_id(
+            filtering_policy_id, previous_rule_id
+        )
+        is None
+    ):
+        return {
+            "errors": [
+                f"No rule found with id '{previous_rule_id}' on filtering policy with id '{filtering_policy_id}'"
+            ]
+        }, HTTPStatus.NOT_FOUND
+
+    try:
+        added_rules_count = await AsyncRuleRepository.add_many_after_rule(
+            filtering_policy_id, previous_rule_id, rules
+        )
+    except ConflictingRulesError as err:
+        return {
+            "errors": conflicting_rules_errors(filtering_policy_id, err.rules)
+        }, HTTPStatus.BAD_REQUEST
+
+    return {
+        "added": added_rules_count,
+        "existing": len(rules) - added_rules_count,
+    }, HTTPStatus.CREATED
+
+
+@async_unit_of_work()
+async def replace_rules(filtering_policy_id: int, body=None):
+    try:
+        if request.mimetype == NDJSON_MIMETYPE:
+            body = list(decode_ndjson(body or b""))
+        rule_models = RuleListModel.validate_python(body)
+    except InvalidNDJSONError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+    except ValidationError as err:
+        return translate_list_errors(err.errors(), "Rule"), HTTPStatus.BAD_REQUEST
+
+    rules = [rule_model.to_columns() for rule_model in rule_models]
+    keys = {tuple(rule[column] for column in RULE_KEY_COLUMNS) for rule in rules}
+    if len(keys) != len(rules):
+        return {
+            "errors": [
+                "Several rules have the same source, destination, port and protocol"
+            ]
+        }, HTTPStatus.BAD_REQUEST
+
+    try:
+        counts = await AsyncRuleRepository.replace_all(filtering_policy_id, rules)
+    except NoResultFound:
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    return counts, HTTPStatus.OK
+
+
+async def _rule_has_different_location(
+    filtering_policy_id: int, previous_rule: Optional[Rule], rule: Rule
+) -> bool:
+    following_rule = await AsyncRuleRepository.find_following_rule(
+        filtering_policy_id, previous_rule
+    )
+
+    return following_rule is None or following_rule.id != rule.id
+
+
+@async_unit_of_work(read_only=True)
+async def get_rule(id: int, show_hits: bool = False):
+    firewall = await AsyncFirewallRepository.find_revision_by_rule_id(id)
+    if firewall is None:
+        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    # Hit counters change without the configuration, responses holding them
+    # have no ETag
+    etag = configuration_etag(firewall.id, firewall.revision) if not show_hits else None
+    if etag is not None and (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    rule = await AsyncRuleRepository.find_row_by_id(id, with_hits=show_hits)
+    if rule is None:
+        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    configuration = await cached_configuration(firewall.id, firewall.revision).load()
+    filtering_policy = configuration.filtering_policies_by_id.get(
+        rule.filtering_policy_id
+    )
+    if filtering_policy is None:
+        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    fragment = rule_with_hits_fragment(rule) if show_hits else rule_fragment(rule)
+    return json_response(add_members(fragment, filtering_policy=filtering_policy), etag)
+
+
+@async_unit_of_work(read_only=True)
+async def find_matching_rules(
+    filtering_policy_id: int,
+    source_ip: Optional[str] = None,
+    destination_ip: Optional[str] = None,
+    destination_port: Optional[int] = None,
+    protocol: Optional[str] = None,
+):
+    try:
+        match_model = MatchRulesModel(
+            source_ip=source_ip,
+            destination_ip=destination_ip,
+            destination_port=destination_port,
+            protocol=protocol,
+        )
+    except ValidationError as err:
+        return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
+
+    try:
+        await AsyncFilteringPolicyRepository.find_by_id(filtering_policy_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    return [
+        rule.convert_to_json()
+        for rule in await AsyncRuleRepository.find_matching(
+            filtering_policy_id,
+            match_model.source_ip,
+            match_model.destination_ip,
+            match_model.destination_port,
+            match_model.protocol,
+        )
+    ], HTTPStatus.OK
+
+
+@async_unit_of_work()
+async def delete_rule(id: int):
+    await AsyncRuleRepository.delete(id)
+
+    return Response(status_code=HTTPStatus.NO_CONTENT)
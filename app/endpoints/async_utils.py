@@ -0,0 +1,40 @@
+from http import HTTPStatus
+from typing import Optional
+
+from connexion import request
+from starlette.responses import Response
+from werkzeug.http import parse_etags
+
+from .utils import etag_headers
+
+
+def not_modified_response(etag: str) -> Optional[Response]:
+    """
+    Answer a conditional GET when the client already has the current resource.
+
+    :param etag: The unquoted ETag of the current resource
+
+    :return: A 304 response if the request's If-None-Match holds the ETag,
+        else return None
+    """
+    if not parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+        return None
+
+    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=etag_headers(etag))
+
+
+def json_response(body: str, etag: Optional[str]) -> Response:
+    """
+    Send an already serialized JSON document with its ETag.
+
+    :param body: The JSON document
+    :param etag: The unquoted ETag of the document, None if it has none
+
+    :return: The response
+    """
+    return Response(
+        body,
+        status_code=HTTPStatus.OK,
+        media_type="application/json",
+        headers=etag_headers(etag) if etag is not None else None,
+    )
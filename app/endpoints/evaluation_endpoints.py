@@ -0,0 +1,220 @@
+import json
+from http import HTTPStatus
+from ipaddress import AddressValueError, IPv4Address
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+import numpy as np
+from flask import Response, request
+
+from app.cache import (
+    add_decision,
+    cached_configuration,
+    find_decision,
+    get_configuration,
+    get_snapshot,
+    snapshot_configuration,
+)
+from app.db.models import Protocol
+from app.db.repositories import FirewallRepository
+from app.db.unit_of_work import unit_of_work
+from app.evaluation import (
+    CompiledFirewall,
+    Flow,
+    FlowBatch,
+    InvalidFlowError,
+    rule_hit_counters,
+)
+from app.evaluation.compiled_firewall import ACTIONS
+from app.validation.validators import NDJSON_MIMETYPE
+
+from .firewall_endpoints import INVALID_SNAPSHOT_AT_ERROR, snapshot_not_found_error
+from .utils import JSON_HEADERS, parse_snapshot_at
+
+# Rendered decisions are kept as long as their compiled firewall is cached
+_rendered_decisions: WeakKeyDictionary[CompiledFirewall, np.ndarray] = (
+    WeakKeyDictionary()
+)
+
+
+@unit_of_work(read_only=True)
+def evaluate_flows(id: int, body=None, at: Optional[str] = None):
+    if at is None:
+        configuration = get_configuration(id)
+    else:
+        try:
+            configuration = get_snapshot(id, parse_snapshot_at(at))
+        except ValueError:
+            return (
+                {"errors": [INVALID_SNAPSHOT_AT_ERROR]},
+                HTTPStatus.BAD_REQUEST,
+                JSON_HEADERS,
+            )
+    compiled_firewall = configuration.compiled if configuration else None
+    if compiled_firewall is None:
+        return (
+            {"errors": [not_found_error(id, at)]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    is_ndjson = request.mimetype == NDJSON_MIMETYPE
+    try:
+        decisions = evaluate_batch(
+            compiled_firewall,
+            request.get_data() if is_ndjson else body,
+            is_ndjson,
+            # Replays of past configurations don't count as hits of the rules
+            record_hits=at is None,
+        )
+    except InvalidFlowError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST, JSON_HEADERS
+
+    return Response(
+        decisions,
+        status=HTTPStatus.OK,
+        mimetype=NDJSON_MIMETYPE if is_ndjson else "application/json",
+    )
+
+
+def evaluate_batch(
+    compiled_firewall: CompiledFirewall, body, is_ndjson: bool, record_hits: bool
+) -> str:
+    """
+    Decode a batch of flows, evaluate it and render its decisions.
+
+    :param compiled_firewall: The compiled firewall evaluating the flows
+    :param body: The flows, NDJSON bytes or the decoded JSON array
+    :param is_ndjson: Whether the flows and decisions are NDJSON, else a JSON
+        array
+    :param record_hits: Count the matches as hits of their rules
+
+    :raise InvalidFlowError: if a flow is invalid
+
+    :return: The decisions, in the order of the flows
+    """
+    if is_ndjson:
+        flows = FlowBatch.from_ndjson(body or b"")
+    else:
+        flows = FlowBatch.from_records(body)
+
+    positions = compiled_firewall.match_batch(flows)
+    if record_hits:
+        rule_hit_counters.record(compiled_firewall, positions)
+    # Every decision is rendered once per rule, then picked by position
+    decisions = render_decisions(compiled_firewall)[positions + 1].tolist()
+
+    if is_ndjson:
+        return "".join(decision + "\n" for decision in decisions)
+
+    return "[" + ",".join(decisions) + "]"
+
+
+@unit_of_work(read_only=True)
+def get_decision(
+    id: int,
+    source_ip: str,
+    destination_ip: str,
+    destination_port: int,
+    protocol: str,
+    at: Optional[str] = None,
+):
+    try:
+        flow = parse_flow(source_ip, destination_ip, destination_port, protocol)
+    except InvalidFlowError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST, JSON_HEADERS
+
+    # Mutations bump the revision, so decisions of an older configuration
+    # are never found, while the ones of a past revision serve its snapshot
+    if at is None:
+        revision = FirewallRepository.find_revision(id)
+        configuration_at = cached_configuration
+    else:
+        try:
+            revision = FirewallRepository.find_snapshot_revision(
+                id, parse_snapshot_at(at)
+            )
+        except ValueError:
+            return (
+                {"errors": [INVALID_SNAPSHOT_AT_ERROR]},
+                HTTPStatus.BAD_REQUEST,
+                JSON_HEADERS,
+            )
+        configuration_at = snapshot_configuration
+    decision = None
+    if revision is not None:
+        decision = find_decision(id, revision, flow) or add_decision(
+            configuration_at(id, revision), flow
+        )
+    if decision is None:
+        return (
+            {"errors": [not_found_error(id, at)]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    if decision.rule_id is not None and at is None:
+        rule_hit_counters.record_hit(decision.rule_id)
+
+    return Response(
+        decision.decision, status=HTTPStatus.OK, mimetype="application/json"
+    )
+
+
+def not_found_error(firewall_id: int, at: Optional[str]) -> str:
+    if at is not None:
+        return snapshot_not_found_error(firewall_id, at)
+
+    return f"No firewall found with id '{firewall_id}'"
+
+
+def parse_flow(
+    source_ip: str, destination_ip: str, destination_port: int, protocol: str
+) -> Flow:
+    """
+    Decode a flow given as query parameters.
+
+    :param source_ip: The flow's source address
+    :param destination_ip: The flow's destination address
+    :param destination_port: The flow's destination port
+    :param protocol: The name of the flow's protocol
+
+    :raise InvalidFlowError: if an address is invalid
+
+    :return: The flow
+    """
+    try:
+        field = "source_ip"
+        source_address = IPv4Address(source_ip)
+        field = "destination_ip"
+        destination_address = IPv4Address(destination_ip)
+    except AddressValueError:
+        raise InvalidFlowError(f"Invalid {field}")
+
+    return Flow(
+        source_address, destination_address, destination_port, Protocol[protocol]
+    )
+
+
+def render_decisions(compiled_firewall: CompiledFirewall) -> np.ndarray:
+    decisions = _rendered_decisions.get(compiled_firewall)
+    if decisions is None:
+        decisions = _rendered_decisions[compiled_firewall] = _render_all_decisions(
+            compiled_firewall
+        )
+
+    return decisions
+
+
+def _render_all_decisions(compiled_firewall: CompiledFirewall) -> np.ndarray:
+    decisions = [
+        json.dumps({"action": compiled_firewall.default_action.name, "rule_id": None})
+    ]
+    decisions.extend(
+        json.dumps({"action": ACTIONS[action].name, "rule_id": rule_id})
+        for rule_id, action in zip(
+            compiled_firewall.rule_ids, compiled_firewall.actions
+        )
+    )
+
+    return np.array(decisions, dtype=object)
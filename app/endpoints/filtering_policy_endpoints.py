@@ -1,3 +1,4 @@
+import json
 from http import HTTPStatus
 from typing import Optional
 
@@ -5,20 +6,47 @@ from flask import Response
 from pydantic import ValidationError
 from sqlalchemy.exc import NoResultFound
 
-from app.db.models import FilteringPolicy, Firewall
-from app.db.repositories import FilteringPolicyRepository, FirewallRepository
+from app.cache import cached_configuration
+from app.db.models import FilteringPolicy
+from app.db.repositories import (
+    FilteringPolicyRepository,
+    FirewallRepository,
+    RuleRepository,
+)
+from app.db.unit_of_work import unit_of_work
+from app.serialization import (
+    add_members,
+    array_fragment,
+    rule_fragment,
+    rule_with_hits_fragment,
+)
 from app.validation.filtering_policy_models import PostFilteringPolicyModel
 from app.validation.utils import translate_errors
 
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursorError,
+    decode_cursor,
+    split_page,
+)
+from .utils import (
+    configuration_etag,
+    etag_headers,
+    json_response,
+    not_modified_response,
+)
 
+
+@unit_of_work()
 def add_filtering_policy(firewall_id, body):
     try:
         post_filtering_policy_model = PostFilteringPolicyModel(**body)
     except ValidationError as err:
         return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
 
-    firewall = FirewallRepository.find_by_id_with_filtering_policies(firewall_id)
-    if firewall is None:
+    try:
+        FirewallRepository.find_by_id(firewall_id)
+    except NoResultFound:
         return {
             "errors": [f"No firewall found with id '{firewall_id}'"]
         }, HTTPStatus.NOT_FOUND
@@ -44,7 +72,7 @@ def add_filtering_policy(firewall_id, body):
 
     if similar_filtering_policy:
         if _policy_has_different_position(
-            firewall, previous_filtering_policy, similar_filtering_policy
+            firewall_id, previous_filtering_policy, similar_filtering_policy
         ):
             return {
                 "errors": [
@@ -73,43 +101,169 @@ def add_filtering_policy(firewall_id, body):
 
 
 def _policy_has_different_position(
-    firewall: Firewall,
+    firewall_id: int,
     previous_filtering_policy: Optional[FilteringPolicy],
     filtering_policy: FilteringPolicy,
 ):
-    if previous_filtering_policy is None:
-        return firewall.filtering_policies[0] != filtering_policy
+    following_filtering_policy = (
+        FilteringPolicyRepository.find_following_filtering_policy(
+            firewall_id, previous_filtering_policy
+        )
+    )
+
+    return (
+        following_filtering_policy is None
+        or following_filtering_policy.id != filtering_policy.id
+    )
 
-    return previous_filtering_policy.next_policy_id != filtering_policy.id
 
+@unit_of_work(read_only=True)
+def get_filtering_policy(
+    id: int,
+    show_rules: bool = False,
+    show_hits: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    firewall = FirewallRepository.find_revision_by_filtering_policy_id(id)
+    if firewall is None:
+        return {
+            "errors": [f"No filtering policy found with id '{id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    show_hits = show_hits and show_rules
+    # Hit counters change without the configuration, responses holding them
+    # have no ETag
+    etag = configuration_etag(firewall.id, firewall.revision) if not show_hits else None
+    if etag is not None and (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
 
-def get_filtering_policy(id: int, show_rules: bool = False):
-    if show_rules:
-        filtering_policy = FilteringPolicyRepository.find_by_id_with_rules(id)
+    paginate_rules = show_rules and (limit is not None or cursor is not None)
 
-        if filtering_policy is not None:
-            return filtering_policy.convert_to_json(show_rules=True)
+    configuration = cached_configuration(firewall.id, firewall.revision)
+    if show_rules and not paginate_rules and not show_hits:
+        filtering_policy = configuration.filtering_policies_with_rules_by_id.get(id)
+    else:
+        filtering_policy = configuration.filtering_policies_by_id.get(id)
 
+    if filtering_policy is None:
+        return {
+            "errors": [f"No filtering policy found with id '{id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    if paginate_rules:
+        return _get_filtering_policy_rules_page(
+            id, filtering_policy, limit or DEFAULT_PAGE_SIZE, cursor, etag, show_hits
+        )
+    if show_hits:
+        rules = RuleRepository.find_page_by_filtering_policy_id(
+            id, None, with_hits=True
+        )
+        return json_response(
+            add_members(
+                filtering_policy,
+                rules=array_fragment(rule_with_hits_fragment(rule) for rule in rules),
+            ),
+            etag,
+        )
+
+    return json_response(filtering_policy, etag)
+
+
+def _get_filtering_policy_rules_page(
+    id: int,
+    filtering_policy: str,
+    limit: int,
+    cursor: Optional[str],
+    etag: Optional[str],
+    show_hits: bool,
+):
     try:
-        return FilteringPolicyRepository.find_by_id(id).convert_to_json(), HTTPStatus.OK
-    except NoResultFound:
-        pass
+        after = decode_cursor(cursor) if cursor is not None else None
+    except InvalidCursorError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+
+    rules, next_cursor = split_page(
+        RuleRepository.find_page_by_filtering_policy_id(
+            id, limit + 1, after, with_hits=show_hits
+        ),
+        limit,
+    )
 
-    return {"errors": [f"No filtering policy found with id '{id}'"]}
+    return json_response(
+        add_members(
+            filtering_policy,
+            rules=array_fragment(
+                (rule_with_hits_fragment if show_hits else rule_fragment)(rule)
+                for rule in rules
+            ),
+            next_cursor=json.dumps(next_cursor),
+        ),
+        etag,
+    )
 
 
-def get_filtering_policies(firewall_id: int):
-    firewall = FirewallRepository.find_by_id_with_filtering_policies(firewall_id)
-    if firewall is None:
+@unit_of_work(read_only=True)
+def get_filtering_policies(
+    firewall_id: int, limit: Optional[int] = None, cursor: Optional[str] = None
+):
+    revision = FirewallRepository.find_revision(firewall_id)
+    if revision is None:
+        return {
+            "errors": [f"No firewall found with id '{firewall_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    etag = configuration_etag(firewall_id, revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    if limit is not None or cursor is not None:
+        return _get_filtering_policies_page(
+            firewall_id, limit or DEFAULT_PAGE_SIZE, cursor, etag
+        )
+
+    configuration = cached_configuration(firewall_id, revision)
+    if configuration.filtering_policies is None:
         return {
-            "errors": [
-                f"No filtering policy found with id '{firewall_id}' on firewall '{firewall_id}"
-            ]
+            "errors": [f"No firewall found with id '{firewall_id}'"]
         }, HTTPStatus.NOT_FOUND
 
-    return firewall.convert_to_json(show_filtering_policies=True), HTTPStatus.OK
+    return json_response(configuration.filtering_policies, etag)
+
+
+def _get_filtering_policies_page(
+    firewall_id: int, limit: int, cursor: Optional[str], etag: str
+):
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except InvalidCursorError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+
+    try:
+        firewall = FirewallRepository.find_by_id(firewall_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No firewall found with id '{firewall_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    filtering_policies, next_cursor = split_page(
+        FilteringPolicyRepository.find_page_by_firewall_id(
+            firewall_id, limit + 1, after
+        ),
+        limit,
+    )
+
+    result = firewall.convert_to_json()
+    result["filtering_policies"] = [
+        filtering_policy.convert_to_json(show_firewall=False)
+        for filtering_policy in filtering_policies
+    ]
+    result["next_cursor"] = next_cursor
+
+    return result, HTTPStatus.OK, etag_headers(etag)
 
 
+@unit_of_work()
 def delete_filtering_policy(id: int):
     FilteringPolicyRepository.delete(id)
 
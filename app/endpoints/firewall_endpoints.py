@@ -1,16 +1,43 @@
+import io
+import json
+import zlib
 from http import HTTPStatus
 from ipaddress import IPv4Address
+from itertools import islice
+from typing import Iterable, Iterator, Optional
 
-from flask import Response
+from flask import Response, request
 from pydantic import ValidationError
+from sqlalchemy import Row
 from sqlalchemy.exc import NoResultFound
 
+from app.cache import cached_configuration, get_snapshot
 from app.db.models import Firewall
+from app.db.models.rule import format_address_range
 from app.db.repositories import FirewallRepository
+from app.db.repositories.firewall_repository import FilteringPolicyExistsError
+from app.db.unit_of_work import unit_of_work
+from app.importing import DumpReader, InvalidDumpError
 from app.validation.firewall_models import PostFirewallModel
 from app.validation.utils import translate_errors
+from app.validation.validators import NDJSON_MIMETYPE
 
+from .utils import (
+    JSON_HEADERS,
+    RULESET_MIMETYPE,
+    configuration_etag,
+    etag_headers,
+    json_response,
+    not_modified_response,
+    parse_snapshot_at,
+)
 
+EXPORT_CHUNK_LINES = 1000
+INVALID_SNAPSHOT_AT_ERROR = "Invalid at, expected a revision or an ISO 8601 time"
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+@unit_of_work()
 def add_firewall(body: dict):
     try:
         PostFirewallModel(**body)
@@ -40,13 +67,196 @@ def add_firewall(body: dict):
     return same_id_and_port_firewall.convert_to_json(), HTTPStatus.CREATED
 
 
-def get_firewall(id: int):
+@unit_of_work(read_only=True)
+def get_firewall(id: int, at: Optional[str] = None):
+    if at is not None:
+        return get_firewall_snapshot(id, at)
+
+    revision = FirewallRepository.find_revision(id)
+    if revision is None:
+        return {"errors": [f"No firewall found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    etag = configuration_etag(id, revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    firewall = cached_configuration(id, revision).firewall
+    if firewall is None:
+        return {"errors": [f"No firewall found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    return json_response(firewall, etag)
+
+
+def get_firewall_snapshot(id: int, at: str):
+    try:
+        configuration = get_snapshot(id, parse_snapshot_at(at))
+    except ValueError:
+        return {"errors": [INVALID_SNAPSHOT_AT_ERROR]}, HTTPStatus.BAD_REQUEST
+    if configuration is None or configuration.configuration is None:
+        return {"errors": [snapshot_not_found_error(id, at)]}, HTTPStatus.NOT_FOUND
+
+    # Past revisions never change
+    etag = configuration_etag(id, configuration.revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    return json_response(configuration.configuration, etag)
+
+
+def snapshot_not_found_error(firewall_id: int, at: str) -> str:
+    return f"No configuration found for firewall with id '{firewall_id}' at '{at}'"
+
+
+@unit_of_work(read_only=True)
+def render_firewall(id: int, format: str = "nftables"):
+    revision = FirewallRepository.find_revision(id)
+    if revision is None:
+        return (
+            {"errors": [f"No firewall found with id '{id}'"]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    etag = configuration_etag(id, revision)
+    if (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    configuration = cached_configuration(id, revision)
+    if configuration.firewall is None:
+        return (
+            {"errors": [f"No firewall found with id '{id}'"]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    return Response(
+        configuration.ruleset(format),
+        status=HTTPStatus.OK,
+        mimetype=RULESET_MIMETYPE,
+        headers=etag_headers(etag),
+    )
+
+
+def export_firewall(id: int, compression: Optional[str] = None):
+    try:
+        firewall = FirewallRepository.find_by_id(id)
+    except NoResultFound:
+        return (
+            {"errors": [f"No firewall found with id '{id}'"]},
+            HTTPStatus.NOT_FOUND,
+            JSON_HEADERS,
+        )
+
+    chunks = _export_chunks(firewall)
+    headers = {}
+    if compression == "gzip":
+        chunks = _gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(
+        chunks, status=HTTPStatus.OK, mimetype=NDJSON_MIMETYPE, headers=headers
+    )
+
+
+def _export_chunks(firewall: Firewall) -> Iterator[bytes]:
+    lines = _export_lines(firewall)
+    while chunk := "".join(islice(lines, EXPORT_CHUNK_LINES)):
+        yield chunk.encode()
+
+
+def _export_lines(firewall: Firewall) -> Iterator[str]:
+    yield firewall_export_line(firewall)
+
+    filtering_policy_id = None
+    for row in FirewallRepository.iter_configuration(firewall.id):
+        if row.filtering_policy_id != filtering_policy_id:
+            filtering_policy_id = row.filtering_policy_id
+            yield filtering_policy_export_line(row)
+
+        if row.id is not None:
+            yield rule_export_line(row)
+
+
+def firewall_export_line(firewall: Firewall) -> str:
+    return json.dumps({"type": "firewall", **firewall.convert_to_json()}) + "\n"
+
+
+def filtering_policy_export_line(row: Row) -> str:
+    return (
+        json.dumps(
+            {
+                "type": "filtering_policy",
+                "id": row.filtering_policy_id,
+                "name": row.filtering_policy_name,
+            }
+        )
+        + "\n"
+    )
+
+
+def rule_export_line(row: Row) -> str:
+    return (
+        json.dumps(
+            {
+                "type": "rule",
+                "filtering_policy_id": row.filtering_policy_id,
+                "id": row.id,
+                "name": row.name,
+                "source_ip": format_address_range(row.source_ip, row.source_ip_end),
+                "destination_ip": format_address_range(
+                    row.destination_ip, row.destination_ip_end
+                ),
+                "destination_port": row.destination_port,
+                "destination_port_end": row.destination_port_end,
+                "protocol": row.protocol.name,
+                "action": row.action.name,
+            }
+        )
+        + "\n"
+    )
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=GZIP_WBITS)
+    for chunk in chunks:
+        if compressed_chunk := compressor.compress(chunk):
+            yield compressed_chunk
+    yield compressor.flush()
+
+
+# Not in a unit of work, the import's transaction is rolled back when the dump
+# turns out to be invalid
+def import_firewall(id: int, format: Optional[str] = None):
+    reader = DumpReader(
+        io.TextIOWrapper(request.stream, encoding="utf-8", errors="replace"), format
+    )
     try:
-        return FirewallRepository.find_by_id(id).convert_to_json(), HTTPStatus.OK
+        counts = FirewallRepository.import_configuration(id, reader)
     except NoResultFound:
         return {"errors": [f"No firewall found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+    except InvalidDumpError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+    except FilteringPolicyExistsError as err:
+        return {
+            "errors": [filtering_policy_exists_error(id, err.name)]
+        }, HTTPStatus.BAD_REQUEST
+
+    return import_result(counts, reader), HTTPStatus.CREATED
+
+
+def import_result(counts: dict[str, int], reader: DumpReader) -> dict:
+    return {
+        **counts,
+        "skipped_rules": reader.skipped_rules,
+        "skipped_rule_lines": reader.skipped_rule_lines,
+    }
+
+
+def filtering_policy_exists_error(firewall_id: int, name: str) -> str:
+    return f"Filtering policy with name '{name}' already exists on firewall with id '{firewall_id}'"
 
 
+@unit_of_work()
 def delete_firewall(id: int):
     FirewallRepository.delete(id)
 
@@ -0,0 +1,11 @@
+from http import HTTPStatus
+
+from flask import Response
+
+from app.metrics import render_metrics
+
+
+def get_metrics():
+    metrics, content_type = render_metrics()
+
+    return Response(metrics, status=HTTPStatus.OK, content_type=content_type)
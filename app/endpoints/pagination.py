@@ -0,0 +1,67 @@
+"""Keyset pagination over lists ordered by (position, id)"""
+
+import base64
+import binascii
+import json
+from typing import Optional, Sequence, TypeVar, Union
+
+from app.db.models import FilteringPolicy, Rule
+
+DEFAULT_PAGE_SIZE = 100
+
+OrderedItem = TypeVar("OrderedItem", bound=Union[FilteringPolicy, Rule])
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a continuation token can't be decoded."""
+
+
+def encode_cursor(item: Union[FilteringPolicy, Rule]) -> str:
+    """
+    Build the opaque continuation token resuming a list after an item.
+
+    :param item: The last item of a page
+
+    :return: The continuation token
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps([item.position, item.id]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """
+    Decode a continuation token.
+
+    :param cursor: The continuation token
+
+    :raise InvalidCursorError: if the token is malformed
+
+    :return: The (position, id) key of the last item of the previous page
+    """
+    try:
+        position, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursorError(f"Invalid cursor '{cursor}'")
+
+    if not isinstance(position, int) or not isinstance(id, int):
+        raise InvalidCursorError(f"Invalid cursor '{cursor}'")
+
+    return position, id
+
+
+def split_page(
+    items: Sequence[OrderedItem], limit: int
+) -> tuple[Sequence[OrderedItem], Optional[str]]:
+    """
+    Split the items fetched for a page from the lookahead one.
+
+    :param items: Up to limit + 1 items, in order
+    :param limit: The page size
+
+    :return: The page's items and the token of the next page, None on the last page
+    """
+    if len(items) <= limit:
+        return items, None
+
+    return items[:limit], encode_cursor(items[limit - 1])
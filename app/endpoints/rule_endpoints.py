@@ -1,27 +1,48 @@
 from http import HTTPStatus
 from typing import Optional
 
-from flask import Response
+from flask import Response, request
 from pydantic import ValidationError
 from sqlalchemy.exc import NoResultFound
 
-from app.db.models import FilteringPolicy, Rule
-from app.db.repositories import FilteringPolicyRepository, RuleRepository
-from app.validation.rule_models import PostRuleModel
-from app.validation.utils import translate_errors
+from app.cache import cached_configuration
+from app.db.models import Rule
+from app.db.models.rule import format_address_range
+from app.db.repositories import (
+    FilteringPolicyRepository,
+    FirewallRepository,
+    RuleRepository,
+)
+from app.db.repositories.rule_repository import (
+    RULE_KEY_COLUMNS,
+    ConflictingRulesError,
+)
+from app.db.unit_of_work import unit_of_work
+from app.serialization import add_members, rule_fragment, rule_with_hits_fragment
+from app.validation.rule_models import MatchRulesModel, PostRuleModel, RuleListModel
+from app.validation.utils import (
+    InvalidNDJSONError,
+    decode_ndjson,
+    translate_errors,
+    translate_list_errors,
+)
+from app.validation.validators import NDJSON_MIMETYPE
 
+from .utils import configuration_etag, json_response, not_modified_response
 
+MAX_REPORTED_CONFLICTS = 10
+
+
+@unit_of_work()
 def add_rule(filtering_policy_id: int, body: dict):
     try:
         post_rule_model = PostRuleModel(**body)
     except ValidationError as err:
         return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
 
-    filtering_policy = FilteringPolicyRepository.find_by_id_with_rules(
-        filtering_policy_id
-    )
-
-    if filtering_policy is None:
+    try:
+        FilteringPolicyRepository.find_by_id(filtering_policy_id)
+    except NoResultFound:
         return {
             "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
         }, HTTPStatus.NOT_FOUND
@@ -39,28 +60,24 @@ def add_rule(filtering_policy_id: int, body: dict):
                 ]
             }
 
+    columns = post_rule_model.to_columns()
     similar_rule = (
         RuleRepository.find_by_filtering_policy_id_source_destination_and_protocol(
             filtering_policy_id,
-            post_rule_model.source_ip,
-            post_rule_model.destination_ip,
-            post_rule_model.destination_port,
-            post_rule_model.protocol,
+            columns["source_ip"],
+            columns["destination_ip"],
+            columns["destination_port"],
+            columns["protocol"],
+            source_ip_end=columns["source_ip_end"],
+            destination_ip_end=columns["destination_ip_end"],
+            destination_port_end=columns["destination_port_end"],
         )
     )
 
-    rule = Rule(
-        filtering_policy_id=filtering_policy_id,
-        name=post_rule_model.name,
-        source_ip=post_rule_model.source_ip,
-        destination_ip=post_rule_model.destination_ip,
-        destination_port=post_rule_model.destination_port,
-        protocol=post_rule_model.protocol,
-        action=post_rule_model.action,
-    )
+    rule = Rule(filtering_policy_id=filtering_policy_id, **columns)
     if similar_rule:
         if similar_rule != rule or _rule_has_different_location(
-            filtering_policy, previous_rule, similar_rule
+            filtering_policy_id, previous_rule, similar_rule
         ):
             return {
                 "errors": [
@@ -82,22 +99,181 @@ def add_rule(filtering_policy_id: int, body: dict):
     return rule.convert_to_json(show_filtering_policy=True), HTTPStatus.CREATED
 
 
+@unit_of_work()
+def add_rules(
+    filtering_policy_id: int, body=None, previous_rule_id: Optional[int] = None
+):
+    try:
+        if request.mimetype == NDJSON_MIMETYPE:
+            body = list(decode_ndjson(request.get_data()))
+        rule_models = RuleListModel.validate_python(body)
+    except InvalidNDJSONError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+    except ValidationError as err:
+        return translate_list_errors(err.errors(), "Rule"), HTTPStatus.BAD_REQUEST
+
+    rules = [rule_model.to_columns() for rule_model in rule_models]
+    keys = {tuple(rule[column] for column in RULE_KEY_COLUMNS) for rule in rules}
+    if len(keys) != len(rules):
+        return {
+            "errors": [
+                "Several rules have the same source, destination, port and protocol"
+            ]
+        }, HTTPStatus.BAD_REQUEST
+
+    try:
+        FilteringPolicyRepository.find_by_id(filtering_policy_id)
+    except NoResultFound:
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    if previous_rule_id is not None and (
+        RuleRepository.find_by_filtering_policy_id_and_id(
+            filtering_policy_id, previous_rule_id
+        )
+        is None
+    ):
+        return {
+            "errors": [
+                f"No rule found with id '{previous_rule_id}' on filtering policy with id '{filtering_policy_id}'"
+            ]
+        }, HTTPStatus.NOT_FOUND
+
+    try:
+        added_rules_count = RuleRepository.add_many_after_rule(
+            filtering_policy_id, previous_rule_id, rules
+        )
+    except ConflictingRulesError as err:
+        return {
+            "errors": conflicting_rules_errors(filtering_policy_id, err.rules)
+        }, HTTPStatus.BAD_REQUEST
+
+    return {
+        "added": added_rules_count,
+        "existing": len(rules) - added_rules_count,
+    }, HTTPStatus.CREATED
+
+
+@unit_of_work()
+def replace_rules(filtering_policy_id: int, body=None):
+    try:
+        if request.mimetype == NDJSON_MIMETYPE:
+            body = list(decode_ndjson(request.get_data()))
+        rule_models = RuleListModel.validate_python(body)
+    except InvalidNDJSONError as err:
+        return {"errors": [str(err)]}, HTTPStatus.BAD_REQUEST
+    except ValidationError as err:
+        return translate_list_errors(err.errors(), "Rule"), HTTPStatus.BAD_REQUEST
+
+    rules = [rule_model.to_columns() for rule_model in rule_models]
+    keys = {tuple(rule[column] for column in RULE_KEY_COLUMNS) for rule in rules}
+    if len(keys) != len(rules):
+        return {
+            "errors": [
+                "Several rules have the same source, destination, port and protocol"
+            ]
+        }, HTTPStatus.BAD_REQUEST
+
+    try:
+        counts = RuleRepository.replace_all(filtering_policy_id, rules)
+    except NoResultFound:
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    return counts, HTTPStatus.OK
+
+
+def conflicting_rules_errors(filtering_policy_id: int, rules: list[dict]) -> list[str]:
+    return [
+        f"Rule with source '{format_address_range(rule['source_ip'], rule['source_ip_end'])}', destination '{format_address_range(rule['destination_ip'], rule['destination_ip_end'])}', port '{_format_port_range(rule)}' and protocol '{rule['protocol'].name}' already exists on filtering_policy with id '{filtering_policy_id}'"
+        for rule in rules[:MAX_REPORTED_CONFLICTS]
+    ]
+
+
+def _format_port_range(rule: dict) -> str:
+    if rule["destination_port"] == rule["destination_port_end"]:
+        return str(rule["destination_port"])
+
+    return f"{rule['destination_port']}-{rule['destination_port_end']}"
+
+
 def _rule_has_different_location(
-    filtering_policy: FilteringPolicy, previous_rule: Optional[Rule], rule: Rule
+    filtering_policy_id: int, previous_rule: Optional[Rule], rule: Rule
 ) -> bool:
-    if previous_rule is None:
-        return filtering_policy.rules[0] != rule
+    following_rule = RuleRepository.find_following_rule(
+        filtering_policy_id, previous_rule
+    )
 
-    return previous_rule.next_rule_id != rule.id
+    return following_rule is None or following_rule.id != rule.id
 
 
-def get_rule(id: int):
+@unit_of_work(read_only=True)
+def get_rule(id: int, show_hits: bool = False):
+    firewall = FirewallRepository.find_revision_by_rule_id(id)
+    if firewall is None:
+        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    # Hit counters change without the configuration, responses holding them
+    # have no ETag
+    etag = configuration_etag(firewall.id, firewall.revision) if not show_hits else None
+    if etag is not None and (not_modified := not_modified_response(etag)) is not None:
+        return not_modified
+
+    rule = RuleRepository.find_row_by_id(id, with_hits=show_hits)
+    if rule is None:
+        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    configuration = cached_configuration(firewall.id, firewall.revision)
+    filtering_policy = configuration.filtering_policies_by_id.get(
+        rule.filtering_policy_id
+    )
+    if filtering_policy is None:
+        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+
+    fragment = rule_with_hits_fragment(rule) if show_hits else rule_fragment(rule)
+    return json_response(add_members(fragment, filtering_policy=filtering_policy), etag)
+
+
+@unit_of_work(read_only=True)
+def find_matching_rules(
+    filtering_policy_id: int,
+    source_ip: Optional[str] = None,
+    destination_ip: Optional[str] = None,
+    destination_port: Optional[int] = None,
+    protocol: Optional[str] = None,
+):
     try:
-        return RuleRepository.find_by_id(id).convert_to_json(show_filtering_policy=True)
+        match_model = MatchRulesModel(
+            source_ip=source_ip,
+            destination_ip=destination_ip,
+            destination_port=destination_port,
+            protocol=protocol,
+        )
+    except ValidationError as err:
+        return translate_errors(err.errors()), HTTPStatus.BAD_REQUEST
+
+    try:
+        FilteringPolicyRepository.find_by_id(filtering_policy_id)
     except NoResultFound:
-        return {"errors": [f"No rule found with id '{id}'"]}, HTTPStatus.NOT_FOUND
+        return {
+            "errors": [f"No filtering policy found with id '{filtering_policy_id}'"]
+        }, HTTPStatus.NOT_FOUND
+
+    return [
+        rule.convert_to_json()
+        for rule in RuleRepository.find_matching(
+            filtering_policy_id,
+            match_model.source_ip,
+            match_model.destination_ip,
+            match_model.destination_port,
+            match_model.protocol,
+        )
+    ], HTTPStatus.OK
 
 
+@unit_of_work()
 def delete_rule(id: int):
     RuleRepository.delete(id)
 
@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Optional, Union
+
+from flask import Response, request
+from werkzeug.http import quote_etag
+
+# Operations able to answer something else than JSON need error responses to
+# name their content type, connexion can't guess it otherwise
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+RULESET_MIMETYPE = "text/plain"
+
+
+def configuration_etag(firewall_id: int, revision: int) -> str:
+    """
+    Build the ETag of a resource belonging to a firewall's configuration.
+
+    The firewall's revision changes with any change of its configuration and
+    firewall ids are never reused, so the tag is strong without hashing the
+    rendered resource.
+
+    :param firewall_id: The id of the firewall owning the resource
+    :param revision: The firewall's revision
+
+    :return: The unquoted ETag
+    """
+    return f"{firewall_id}-{revision}"
+
+
+def etag_headers(etag: str) -> dict:
+    """
+    Build the headers sending an ETag.
+
+    :param etag: The unquoted ETag
+
+    :return: The headers
+    """
+    return {"ETag": quote_etag(etag)}
+
+
+def not_modified_response(etag: str) -> Optional[Response]:
+    """
+    Answer a conditional GET when the client already has the current resource.
+
+    :param etag: The unquoted ETag of the current resource
+
+    :return: A 304 response if the request's If-None-Match holds the ETag,
+        else return None
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+
+    return Response(status=HTTPStatus.NOT_MODIFIED, headers=etag_headers(etag))
+
+
+def json_response(body: str, etag: Optional[str]) -> Response:
+    """
+    Send an already serialized JSON document with its ETag.
+
+    :param body: The JSON document
+    :param etag: The unquoted ETag of the document, None if it has none
+
+    :return: The response
+    """
+    return Response(
+        body,
+        status=HTTPStatus.OK,
+        mimetype="application/json",
+        headers=etag_headers(etag) if etag is not None else None,
+    )
+
+
+def parse_snapshot_at(at: str) -> Union[int, datetime]:
+    """
+    Decode the revision or time of a snapshot given as a query parameter.
+
+    :param at: A revision, or an ISO 8601 time, in UTC unless it has an offset
+
+    :raise ValueError: if it is neither
+
+    :return: The revision, or the time as a naive datetime in UTC
+    """
+    if at.isdigit():
+        return int(at)
+
+    time = datetime.fromisoformat(at)
+    if time.tzinfo is not None:
+        time = time.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return time
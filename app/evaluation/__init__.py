@@ -0,0 +1,23 @@
+"""Classes used to evaluate network flows against a firewall configuration"""
+
+from .compiled_firewall import CompiledFirewall, Decision, Flow, compile_firewall
+from .flow_batch import FlowBatch, InvalidFlowError
+from .replay import FLOW_LOG_FORMATS, ReplayReport, replay_flow_log
+from .rule_hits import RuleHitCounters, rule_hit_counters
+from .shared_tables import attach_compiled_firewall, publish_compiled_firewall
+
+__all__ = [
+    "FLOW_LOG_FORMATS",
+    "CompiledFirewall",
+    "Decision",
+    "Flow",
+    "FlowBatch",
+    "InvalidFlowError",
+    "ReplayReport",
+    "RuleHitCounters",
+    "attach_compiled_firewall",
+    "compile_firewall",
+    "publish_compiled_firewall",
+    "replay_flow_log",
+    "rule_hit_counters",
+]
@@ -0,0 +1,633 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import cached_property
+from ipaddress import IPv4Address
+from typing import TYPE_CHECKING, Iterable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from app.db.models import Firewall, Protocol, Rule, RuleAction
+from app.db.repositories import FirewallRepository
+
+if TYPE_CHECKING:
+    from .flow_batch import FlowBatch
+
+PROTOCOLS = list(Protocol)
+PROTOCOL_CODES = {protocol: code for code, protocol in enumerate(PROTOCOLS)}
+ANY_PROTOCOL_CODE = PROTOCOL_CODES[Protocol.ANY]
+ICMP_PROTOCOL_CODE = PROTOCOL_CODES[Protocol.ICMP]
+
+ACTIONS = list(RuleAction)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+NO_MATCH = -1
+
+# Columns are arrays, or memoryviews cast to the same type codes
+Table = Union[array, memoryview]
+
+# Type codes of the rules' columns, in the constructor's order
+RULE_COLUMNS = {
+    "rule_ids": "q",
+    "source_ips": "I",
+    "source_ip_ends": "I",
+    "destination_ips": "I",
+    "destination_ip_ends": "I",
+    "destination_ports": "H",
+    "destination_port_ends": "H",
+    "protocols": "B",
+    "actions": "B",
+}
+# Type codes of the columns of the single address and port rules' index
+INDEX_COLUMNS = {
+    "index_address_pairs": "Q",
+    "index_keys": "q",
+    "index_positions": "q",
+}
+
+_PORT_COUNT = 1 << 16
+_MAX_PORT = _PORT_COUNT - 1
+
+# Words of the range rules' bitsets, bit i of word w is the rule 64 * w + i
+_WORD = np.dtype("<u8")
+# Number of bitset words gathered at once when matching a batch on range rules
+_BATCH_WORDS = 1 << 20
+
+
+class _Index(NamedTuple):
+    address_pairs: np.ndarray
+    keys: np.ndarray
+    positions: np.ndarray
+
+
+class _RangeIndex(NamedTuple):
+    positions: np.ndarray
+    source_boundaries: np.ndarray
+    source_bitsets: np.ndarray
+    destination_boundaries: np.ndarray
+    destination_bitsets: np.ndarray
+    port_boundaries: np.ndarray
+    port_bitsets: np.ndarray
+    protocol_bitsets: np.ndarray
+
+
+class Flow(NamedTuple):
+    source_ip: IPv4Address
+    destination_ip: IPv4Address
+    destination_port: int
+    protocol: Protocol
+
+
+class Decision(NamedTuple):
+    action: RuleAction
+    rule_id: Optional[int]
+
+
+class CompiledFirewall:
+    """
+    Flat first-match table built from a firewall's ordered policies and rules.
+
+    The rules of every filtering policy are laid out in evaluation order in
+    parallel arrays (IP addresses as uint32, protocols and actions as small
+    ints), so evaluating a flow never touches ORM objects.
+    A flow matches a rule when its source, destination and port are in the
+    rule's ranges and its protocol is the rule's one or the rule's protocol
+    is ANY. Like on devices, ports only apply to TCP and UDP: ICMP rules are
+    compiled on every port and ICMP flows only match rules on every port.
+    Flows matching no rule are denied.
+
+    Rules on single addresses and ports are found by binary search in a
+    sorted index. Rules on prefixes or port ranges are found with bitsets:
+    source addresses, destination addresses and ports are cut into the
+    intervals between the bounds of these rules, every interval has the
+    bitset of the rules covering it, and the lowest bit of the intersection
+    of a flow's bitsets is its first matching rule. The bitsets take about
+    R²/4 bytes by dimension for R range rules (25 MB for 10,000) and are
+    built by each process on its first evaluation. The arrays and the index
+    can be memoryviews of a segment shared by the processes (see
+    shared_tables), as the compiled firewall holds no other per rule object.
+    """
+
+    default_action = RuleAction.DENY
+
+    def __init__(
+        self,
+        firewall_id: int,
+        rule_ids: Table,
+        source_ips: Table,
+        source_ip_ends: Table,
+        destination_ips: Table,
+        destination_ip_ends: Table,
+        destination_ports: Table,
+        destination_port_ends: Table,
+        protocols: Table,
+        actions: Table,
+    ) -> None:
+        self.firewall_id = firewall_id
+        self.rule_ids = rule_ids
+        self.source_ips = source_ips
+        self.source_ip_ends = source_ip_ends
+        self.destination_ips = destination_ips
+        self.destination_ip_ends = destination_ip_ends
+        self.destination_ports = destination_ports
+        self.destination_port_ends = destination_port_ends
+        self.protocols = protocols
+        self.actions = actions
+
+    @classmethod
+    def compile(cls, firewall: Firewall) -> CompiledFirewall:
+        """
+        Compile a firewall loaded with its filtering policies and their rules.
+
+        :param firewall: The firewall, its policies and rules must be loaded
+
+        :return: The compiled firewall
+        """
+        return cls.from_rules(
+            firewall.id,
+            (
+                rule
+                for filtering_policy in firewall.filtering_policies
+                for rule in filtering_policy.rules
+            ),
+        )
+
+    @classmethod
+    def from_rules(cls, firewall_id: int, rules: Iterable[Rule]) -> CompiledFirewall:
+        """
+        Compile rules given in evaluation order.
+
+        :param firewall_id: The id of the firewall owning the rules
+        :param rules: The rules, ordered by policy then by position in the policy
+
+        :return: The compiled firewall
+        """
+        rule_ids = array("q")
+        source_ips = array("I")
+        source_ip_ends = array("I")
+        destination_ips = array("I")
+        destination_ip_ends = array("I")
+        destination_ports = array("H")
+        destination_port_ends = array("H")
+        protocols = array("B")
+        actions = array("B")
+
+        for rule in rules:
+            rule_ids.append(rule.id)
+            source_ips.append(int(rule.source_ip))
+            source_ip_ends.append(int(rule.source_ip_end))
+            destination_ips.append(int(rule.destination_ip))
+            destination_ip_ends.append(int(rule.destination_ip_end))
+            if rule.protocol == Protocol.ICMP:
+                destination_ports.append(0)
+                destination_port_ends.append(_MAX_PORT)
+            else:
+                destination_ports.append(rule.destination_port)
+                destination_port_ends.append(rule.destination_port_end)
+            protocols.append(PROTOCOL_CODES[rule.protocol])
+            actions.append(ACTION_CODES[rule.action])
+
+        return cls(
+            firewall_id,
+            rule_ids,
+            source_ips,
+            source_ip_ends,
+            destination_ips,
+            destination_ip_ends,
+            destination_ports,
+            destination_port_ends,
+            protocols,
+            actions,
+        )
+
+    @classmethod
+    def from_tables(
+        cls, firewall_id: int, tables: dict[str, Table]
+    ) -> CompiledFirewall:
+        """
+        Build a compiled firewall on existing columns, without copying them.
+
+        :param firewall_id: The id of the firewall owning the rules
+        :param tables: The columns of RULE_COLUMNS and INDEX_COLUMNS, as
+            returned by the tables property
+
+        :return: The compiled firewall
+        """
+        compiled_firewall = cls(firewall_id, *(tables[name] for name in RULE_COLUMNS))
+        compiled_firewall._index = _Index(
+            np.frombuffer(tables["index_address_pairs"], dtype=np.uint64),
+            np.frombuffer(tables["index_keys"], dtype=np.int64),
+            np.frombuffer(tables["index_positions"], dtype=np.int64),
+        )
+
+        return compiled_firewall
+
+    @property
+    def tables(self) -> dict[str, memoryview]:
+        """The columns of the rules and of their index, by name"""
+        tables = {name: memoryview(getattr(self, name)) for name in RULE_COLUMNS}
+        tables.update(
+            (name, memoryview(column))
+            for name, column in zip(INDEX_COLUMNS, self._index)
+        )
+
+        return tables
+
+    def __len__(self) -> int:
+        return len(self.rule_ids)
+
+    def __reduce__(self) -> tuple:
+        # Columns mapped from a shared segment are memoryviews, which can't be
+        # pickled, they are sent as arrays
+        return (
+            self.__class__,
+            (
+                self.firewall_id,
+                *(
+                    array(typecode, memoryview(getattr(self, name)).tobytes())
+                    for name, typecode in RULE_COLUMNS.items()
+                ),
+            ),
+        )
+
+    def match(
+        self,
+        source_ip: int,
+        destination_ip: int,
+        destination_port: int,
+        protocol_code: int,
+    ) -> int:
+        """
+        Find the first rule matching an already encoded flow.
+
+        :param source_ip: The flow's source address as an integer
+        :param destination_ip: The flow's destination address as an integer
+        :param destination_port: The flow's destination port
+        :param protocol_code: The flow's protocol code (see PROTOCOL_CODES)
+
+        :return: The position of the matching rule, NO_MATCH if there is none
+        """
+        position = NO_MATCH
+        # ICMP flows have no port, they can't match the index's single ports
+        address_pairs, keys, positions = self._index_views
+        address_pair = source_ip << 32 | destination_ip
+        pair_id = bisect_left(address_pairs, address_pair)
+        if (
+            protocol_code != ICMP_PROTOCOL_CODE
+            and pair_id < len(address_pairs)
+            and address_pairs[pair_id] == address_pair
+        ):
+            # The keys of the flow's protocol and of ANY only differ by their
+            # protocol code, they are next to each other
+            first_key = (pair_id * _PORT_COUNT + destination_port) * len(PROTOCOLS)
+            key_id = bisect_left(keys, first_key)
+            while key_id < len(keys) and keys[key_id] < first_key + len(PROTOCOLS):
+                if keys[key_id] - first_key in (protocol_code, ANY_PROTOCOL_CODE):
+                    if position == NO_MATCH or positions[key_id] < position:
+                        position = positions[key_id]
+                key_id += 1
+
+        range_positions = self._range_positions
+        if range_positions and (position == NO_MATCH or range_positions[0] < position):
+            range_position = self._match_ranges(
+                source_ip, destination_ip, destination_port, protocol_code
+            )
+            if range_position != NO_MATCH and (
+                position == NO_MATCH or range_position < position
+            ):
+                position = range_position
+
+        return position
+
+    def _match_ranges(
+        self,
+        source_ip: int,
+        destination_ip: int,
+        destination_port: int,
+        protocol_code: int,
+    ) -> int:
+        (
+            row_size,
+            source_boundaries,
+            source_bitsets,
+            destination_boundaries,
+            destination_bitsets,
+            port_boundaries,
+            port_bitsets,
+            protocol_bitsets,
+        ) = self._range_views
+        # ICMP flows have no port, the row after the ports' intervals holds
+        # the rules on every port
+        port_row = (
+            len(port_boundaries)
+            if protocol_code == ICMP_PROTOCOL_CODE
+            else bisect_right(port_boundaries, destination_port) - 1
+        )
+        bits = (
+            protocol_bitsets[protocol_code]
+            & _bitset_row(
+                source_bitsets,
+                row_size,
+                bisect_right(source_boundaries, source_ip) - 1,
+            )
+            & _bitset_row(
+                destination_bitsets,
+                row_size,
+                bisect_right(destination_boundaries, destination_ip) - 1,
+            )
+            & _bitset_row(port_bitsets, row_size, port_row)
+        )
+        if not bits:
+            return NO_MATCH
+
+        return self._range_positions[(bits & -bits).bit_length() - 1]
+
+    def match_batch(self, flows: FlowBatch) -> np.ndarray:
+        """
+        Find the first rule matching each flow of a batch.
+
+        The batch is joined against the rules on their match key with sorted
+        array searches, so the cost does not depend on the product of the
+        flow and rule counts.
+
+        :param flows: The flows to match
+
+        :return: The positions of the matching rules, NO_MATCH where there is none
+        """
+        positions = self._match_batch_protocol(flows, flows.protocol_codes)
+        any_protocol_positions = self._match_batch_protocol(
+            flows, np.full_like(flows.protocol_codes, ANY_PROTOCOL_CODE)
+        )
+
+        positions = _first_positions(positions, any_protocol_positions)
+        positions[flows.protocol_codes == ICMP_PROTOCOL_CODE] = NO_MATCH
+        if len(self._range_positions):
+            self._match_batch_ranges(flows, positions)
+
+        return positions
+
+    def _match_batch_ranges(self, flows: FlowBatch, positions: np.ndarray) -> None:
+        index = self._range_index
+        source_rows = (
+            np.searchsorted(index.source_boundaries, flows.source_ips, side="right") - 1
+        )
+        destination_rows = (
+            np.searchsorted(
+                index.destination_boundaries, flows.destination_ips, side="right"
+            )
+            - 1
+        )
+        port_rows = np.where(
+            flows.protocol_codes == ICMP_PROTOCOL_CODE,
+            len(index.port_boundaries),
+            np.searchsorted(
+                index.port_boundaries, flows.destination_ports, side="right"
+            )
+            - 1,
+        )
+
+        # Flows are matched by chunks, so their gathered bitsets stay small
+        chunk_size = max(1, _BATCH_WORDS // index.protocol_bitsets.shape[1])
+        for start in range(0, len(flows), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            ordinals = _lowest_bits(
+                index.source_bitsets[source_rows[chunk]]
+                & index.destination_bitsets[destination_rows[chunk]]
+                & index.port_bitsets[port_rows[chunk]]
+                & index.protocol_bitsets[flows.protocol_codes[chunk]]
+            )
+            positions[chunk] = _first_positions(
+                positions[chunk],
+                np.where(ordinals == NO_MATCH, NO_MATCH, index.positions[ordinals]),
+            )
+
+    @cached_property
+    def _range_positions(self) -> array:
+        is_range = np.zeros(len(self), dtype=bool)
+        for starts, ends, dtype in (
+            (self.source_ips, self.source_ip_ends, np.uint32),
+            (self.destination_ips, self.destination_ip_ends, np.uint32),
+            (self.destination_ports, self.destination_port_ends, np.uint16),
+        ):
+            is_range |= np.frombuffer(starts, dtype=dtype) != np.frombuffer(
+                ends, dtype=dtype
+            )
+
+        return array("q", np.flatnonzero(is_range).astype(np.int64).tobytes())
+
+    @cached_property
+    def _range_index(self) -> _RangeIndex:
+        # Bit i of the bitsets stands for the i-th range rule in evaluation
+        # order, so the lowest bit set is the first matching rule
+        positions = np.frombuffer(self._range_positions, dtype=np.int64)
+        word_count = -(-len(positions) // 64)
+
+        def column(name: str, dtype: type) -> np.ndarray:
+            return np.frombuffer(getattr(self, name), dtype=dtype)[positions].astype(
+                np.int64
+            )
+
+        port_starts = column("destination_ports", np.uint16)
+        port_ends = column("destination_port_ends", np.uint16)
+        port_boundaries, port_bitsets = _interval_bitsets(
+            port_starts, port_ends, word_count
+        )
+        protocols = column("protocols", np.uint8)
+
+        return _RangeIndex(
+            positions,
+            *_interval_bitsets(
+                column("source_ips", np.uint32),
+                column("source_ip_ends", np.uint32),
+                word_count,
+            ),
+            *_interval_bitsets(
+                column("destination_ips", np.uint32),
+                column("destination_ip_ends", np.uint32),
+                word_count,
+            ),
+            port_boundaries,
+            # The last row is the one of ICMP flows, which have no port
+            np.vstack(
+                (
+                    port_bitsets,
+                    _bitset((port_starts == 0) & (port_ends == _MAX_PORT), word_count),
+                )
+            ),
+            np.stack(
+                [
+                    _bitset(
+                        (protocols == code) | (protocols == ANY_PROTOCOL_CODE),
+                        word_count,
+                    )
+                    for code in range(len(PROTOCOLS))
+                ]
+            ),
+        )
+
+    @cached_property
+    def _range_views(self) -> tuple:
+        # Bisecting memoryviews and reading their rows as Python ints is
+        # cheaper than numpy calls for a single flow
+        index = self._range_index
+        return (
+            index.protocol_bitsets.shape[1] * _WORD.itemsize,
+            memoryview(index.source_boundaries),
+            memoryview(index.source_bitsets.reshape(-1).view(np.uint8)),
+            memoryview(index.destination_boundaries),
+            memoryview(index.destination_bitsets.reshape(-1).view(np.uint8)),
+            memoryview(index.port_boundaries),
+            memoryview(index.port_bitsets.reshape(-1).view(np.uint8)),
+            [
+                int.from_bytes(bitset.tobytes(), "little")
+                for bitset in index.protocol_bitsets
+            ],
+        )
+
+    def _match_batch_protocol(
+        self, flows: FlowBatch, protocol_codes: np.ndarray
+    ) -> np.ndarray:
+        index = self._index
+        if not len(index.keys):
+            return np.full(len(flows), NO_MATCH, dtype=np.int64)
+
+        address_pairs = _address_pairs(flows.source_ips, flows.destination_ips)
+        pair_ids = np.searchsorted(index.address_pairs, address_pairs)
+        pair_ids = np.minimum(pair_ids, len(index.address_pairs) - 1)
+        found = index.address_pairs[pair_ids] == address_pairs
+
+        keys = _match_keys(pair_ids, flows.destination_ports, protocol_codes)
+        key_ids = np.minimum(np.searchsorted(index.keys, keys), len(index.keys) - 1)
+        found &= index.keys[key_ids] == keys
+
+        return np.where(found, index.positions[key_ids], NO_MATCH)
+
+    @cached_property
+    def _index(self) -> _Index:
+        # Only single address and port rules are indexed, the others are scanned
+        exact_positions = np.ones(len(self), dtype=bool)
+        exact_positions[np.frombuffer(self._range_positions, dtype=np.int64)] = False
+        exact_positions = np.flatnonzero(exact_positions)
+
+        address_pairs = _address_pairs(
+            np.frombuffer(self.source_ips, dtype=np.uint32)[exact_positions],
+            np.frombuffer(self.destination_ips, dtype=np.uint32)[exact_positions],
+        )
+        unique_address_pairs, pair_ids = np.unique(address_pairs, return_inverse=True)
+        keys = _match_keys(
+            pair_ids,
+            np.frombuffer(self.destination_ports, dtype=np.uint16)[exact_positions],
+            np.frombuffer(self.protocols, dtype=np.uint8)[exact_positions],
+        )
+
+        # A stable sort keeps the first rule of every key in front of the others
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        is_first = np.ones(len(sorted_keys), dtype=bool)
+        is_first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+
+        return _Index(
+            unique_address_pairs,
+            sorted_keys[is_first],
+            exact_positions[order[is_first]],
+        )
+
+    @cached_property
+    def _index_views(self) -> tuple[memoryview, memoryview, memoryview]:
+        # Bisecting memoryviews compares Python ints, cheaper than numpy calls
+        return tuple(memoryview(column) for column in self._index)
+
+    def evaluate(self, flow: Flow) -> Decision:
+        """
+        Evaluate a flow against the firewall.
+
+        :param flow: The flow to evaluate
+
+        :return: The action to apply and the id of the matching rule, if any
+        """
+        position = self.match(
+            int(flow.source_ip),
+            int(flow.destination_ip),
+            flow.destination_port,
+            PROTOCOL_CODES[flow.protocol],
+        )
+
+        if position == NO_MATCH:
+            return Decision(self.default_action, None)
+
+        return Decision(ACTIONS[self.actions[position]], self.rule_ids[position])
+
+
+def _address_pairs(source_ips: np.ndarray, destination_ips: np.ndarray) -> np.ndarray:
+    return (source_ips.astype(np.uint64) << np.uint64(32)) | destination_ips
+
+
+def _first_positions(positions: np.ndarray, other_positions: np.ndarray) -> np.ndarray:
+    return np.where(
+        (other_positions != NO_MATCH)
+        & ((positions == NO_MATCH) | (other_positions < positions)),
+        other_positions,
+        positions,
+    )
+
+
+def _interval_bitsets(
+    starts: np.ndarray, ends: np.ndarray, word_count: int
+) -> tuple[np.ndarray, np.ndarray]:
+    # A value's interval is the last boundary not greater than it. Bits are
+    # toggled where their rule's range starts and ends, the running xor of the
+    # toggles is then the bitset of the rules covering each interval.
+    boundaries = np.unique(np.concatenate(([0], starts, ends + 1)))
+    ordinals = np.arange(len(starts))
+    words = ordinals // 64
+    bits = np.left_shift(np.uint64(1), (ordinals % 64).astype(np.uint64))
+    toggles = np.zeros((len(boundaries), word_count), dtype=_WORD)
+    np.bitwise_xor.at(toggles, (np.searchsorted(boundaries, starts), words), bits)
+    np.bitwise_xor.at(toggles, (np.searchsorted(boundaries, ends + 1), words), bits)
+
+    return boundaries, np.bitwise_xor.accumulate(toggles, axis=0)
+
+
+def _bitset(is_set: np.ndarray, word_count: int) -> np.ndarray:
+    packed = np.packbits(is_set, bitorder="little")
+    return np.pad(packed, (0, word_count * 8 - len(packed))).view(_WORD)
+
+
+def _bitset_row(bitsets: memoryview, row_size: int, row: int) -> int:
+    return int.from_bytes(bitsets[row * row_size : (row + 1) * row_size], "little")
+
+
+def _lowest_bits(bitsets: np.ndarray) -> np.ndarray:
+    # The lowest bit of a row is the one of its first non-zero word, isolated
+    # by the two's complement
+    is_set = bitsets != 0
+    word_ids = is_set.argmax(axis=1)
+    words = bitsets[np.arange(len(bitsets)), word_ids]
+    lowest_bits = words & (~words + np.uint64(1))
+    ordinals = word_ids * 64 + np.log2(np.maximum(lowest_bits, 1)).astype(np.int64)
+
+    return np.where(is_set.any(axis=1), ordinals, NO_MATCH)
+
+
+def _match_keys(
+    pair_ids: np.ndarray, destination_ports: np.ndarray, protocol_codes: np.ndarray
+) -> np.ndarray:
+    return (pair_ids.astype(np.int64) * _PORT_COUNT + destination_ports) * len(
+        PROTOCOLS
+    ) + protocol_codes
+
+
+def compile_firewall(firewall_id: int) -> Optional[CompiledFirewall]:
+    """
+    Load a firewall's configuration and compile it.
+
+    :param firewall_id: The firewall's id
+
+    :return: The compiled firewall, None if there is no firewall with this id
+    """
+    firewall = FirewallRepository.find_by_id_with_rules(firewall_id)
+    if firewall is None:
+        return None
+
+    return CompiledFirewall.compile(firewall)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from array import array
+from socket import AF_INET, inet_pton
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from app.validation.utils import InvalidNDJSONError, decode_ndjson
+
+from .compiled_firewall import PROTOCOL_CODES
+
+_PROTOCOL_CODES_BY_NAME = {
+    protocol.name: code for protocol, code in PROTOCOL_CODES.items()
+}
+
+
+class InvalidFlowError(ValueError):
+    """Raised when a flow of a batch can't be decoded."""
+
+
+class FlowBatch(NamedTuple):
+    """Flows stored as columns, ready for vectorized evaluation."""
+
+    source_ips: np.ndarray
+    destination_ips: np.ndarray
+    destination_ports: np.ndarray
+    protocol_codes: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.source_ips)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> FlowBatch:
+        """
+        Decode flows given as dicts.
+
+        Each record needs a source_ip, a destination_ip, a destination_port and
+        a protocol, other keys are ignored.
+
+        :param records: The flows to decode
+
+        :raise InvalidFlowError: if a flow is invalid
+
+        :return: The decoded flows
+        """
+        source_ips = bytearray()
+        destination_ips = bytearray()
+        destination_ports = array("q")
+        protocol_codes = array("B")
+
+        for index, record in enumerate(records):
+            try:
+                field = "source_ip"
+                source_ips += inet_pton(AF_INET, record[field])
+                field = "destination_ip"
+                destination_ips += inet_pton(AF_INET, record[field])
+                field = "destination_port"
+                destination_ports.append(record[field])
+                field = "protocol"
+                protocol_codes.append(_PROTOCOL_CODES_BY_NAME[record[field]])
+            except (KeyError, TypeError, OSError, OverflowError):
+                raise InvalidFlowError(f"Flow {index}: invalid or missing {field}")
+
+        ports = np.frombuffer(destination_ports, dtype=np.int64)
+        invalid_ports = np.flatnonzero((ports < 0) | (ports > 65_535))
+        if len(invalid_ports):
+            raise InvalidFlowError(
+                f"Flow {invalid_ports[0]}: invalid or missing destination_port"
+            )
+
+        return cls(
+            np.frombuffer(source_ips, dtype=">u4").astype(np.uint32),
+            np.frombuffer(destination_ips, dtype=">u4").astype(np.uint32),
+            ports.astype(np.uint16),
+            np.frombuffer(protocol_codes, dtype=np.uint8),
+        )
+
+    @classmethod
+    def from_ndjson(cls, data: bytes) -> FlowBatch:
+        """
+        Decode flows given as newline delimited JSON objects.
+
+        :param data: The flows, one JSON object per line
+
+        :raise InvalidFlowError: if a line or a flow is invalid
+
+        :return: The decoded flows
+        """
+        try:
+            return cls.from_records(decode_ndjson(data))
+        except InvalidNDJSONError as err:
+            raise InvalidFlowError(str(err))
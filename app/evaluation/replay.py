@@ -0,0 +1,331 @@
+"""
+Offline replay of captured flow logs against a compiled firewall.
+
+Flow logs are CSV files, whose header names the columns, or NDJSON files
+holding a JSON object per line. Flows have the source_ip, destination_ip,
+destination_port and protocol of the evaluation endpoints, other columns like
+the source port are ignored. Protocols are the API's names or IANA numbers,
+flows of other protocols than TCP, UDP and ICMP only match rules on ANY.
+
+The log is memory mapped and split into chunks of whole lines. Worker
+processes map the log again, then decode and match their chunks with the
+vectorized evaluation. They only send back the flow counts of the matched
+rules and a few samples, so memory stays bounded whatever the log's size and
+the replay scales with the number of cores.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from array import array
+from ipaddress import IPv4Address
+from multiprocessing import Pool
+from socket import AF_INET, inet_pton
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from app.db.models import Protocol
+
+from .compiled_firewall import (
+    ACTIONS,
+    ANY_PROTOCOL_CODE,
+    NO_MATCH,
+    PROTOCOL_CODES,
+    PROTOCOLS,
+    CompiledFirewall,
+)
+from .flow_batch import FlowBatch, InvalidFlowError
+
+CSV = "csv"
+NDJSON = "ndjson"
+FLOW_LOG_FORMATS = (CSV, NDJSON)
+
+FLOW_COLUMNS = ("source_ip", "destination_ip", "destination_port", "protocol")
+
+# Size of the chunks read by the workers, rounded up to a whole line
+CHUNK_SIZE = 16 << 20
+
+# Number of unmatched flows and invalid lines reported
+MAX_SAMPLES = 20
+
+_PROTOCOL_CODES_BY_NAME = {
+    protocol.name: code for protocol, code in PROTOCOL_CODES.items()
+}
+_PROTOCOL_CODES_BY_NUMBER = {
+    "1": PROTOCOL_CODES[Protocol.ICMP],
+    "6": PROTOCOL_CODES[Protocol.TCP],
+    "17": PROTOCOL_CODES[Protocol.UDP],
+}
+
+
+class _ChunkResult(NamedTuple):
+    flows: int
+    positions: np.ndarray
+    flow_counts: np.ndarray
+    unmatched_samples: list[dict]
+    invalid_lines: int
+    invalid_line_samples: list[str]
+
+
+class _Worker(NamedTuple):
+    log: mmap.mmap
+    format: str
+    columns: Optional[tuple[int, int, int, int]]
+    compiled_firewall: CompiledFirewall
+
+
+_worker: Optional[_Worker] = None
+
+
+class ReplayReport:
+    """
+    Aggregates of a flow log replayed against a firewall.
+
+    :ivar flows: The number of flows replayed
+    :ivar flows_by_position: The number of flows decided by each rule, by
+        position in the compiled firewall, shifted by one so the flows
+        matching no rule come first
+    :ivar unmatched_samples: The first flows matching no rule
+    :ivar invalid_lines: The number of lines which are not a valid flow
+    :ivar invalid_line_samples: The first invalid lines
+    """
+
+    def __init__(self, compiled_firewall: CompiledFirewall) -> None:
+        self.compiled_firewall = compiled_firewall
+        self.flows = 0
+        self.flows_by_position = np.zeros(len(compiled_firewall) + 1, dtype=np.int64)
+        self.unmatched_samples: list[dict] = []
+        self.invalid_lines = 0
+        self.invalid_line_samples: list[str] = []
+
+    def add(self, result: _ChunkResult) -> None:
+        """
+        Add the aggregates of a chunk, chunks must be added in order.
+
+        :param result: The chunk's aggregates
+        """
+        self.flows += result.flows
+        self.flows_by_position[result.positions + 1] += result.flow_counts
+        self.invalid_lines += result.invalid_lines
+        for samples, chunk_samples in (
+            (self.unmatched_samples, result.unmatched_samples),
+            (self.invalid_line_samples, result.invalid_line_samples),
+        ):
+            samples.extend(chunk_samples[: MAX_SAMPLES - len(samples)])
+
+    def to_dict(self) -> dict:
+        """
+        Convert the report to a JSON serializable dict.
+
+        :return: The counts of flows by action and by rule, in evaluation
+            order, rules matching no flow included, and the samples
+        """
+        compiled_firewall = self.compiled_firewall
+        flows_by_rule = self.flows_by_position[1:]
+        unmatched_flows = int(self.flows_by_position[0])
+
+        flows_by_action = np.zeros(len(ACTIONS), dtype=np.int64)
+        np.add.at(
+            flows_by_action,
+            np.frombuffer(compiled_firewall.actions, dtype=np.uint8),
+            flows_by_rule,
+        )
+        flows_by_action[
+            ACTIONS.index(compiled_firewall.default_action)
+        ] += unmatched_flows
+
+        return {
+            "firewall_id": compiled_firewall.firewall_id,
+            "flows": self.flows,
+            "flows_by_action": {
+                action.name: int(flows)
+                for action, flows in zip(ACTIONS, flows_by_action)
+            },
+            "rules": [
+                {"rule_id": rule_id, "action": ACTIONS[action].name, "flows": flows}
+                for rule_id, action, flows in zip(
+                    compiled_firewall.rule_ids,
+                    compiled_firewall.actions,
+                    flows_by_rule.tolist(),
+                )
+            ],
+            "unmatched_flows": unmatched_flows,
+            "unmatched_flow_samples": self.unmatched_samples,
+            "invalid_lines": self.invalid_lines,
+            "invalid_line_samples": self.invalid_line_samples,
+        }
+
+
+def replay_flow_log(
+    path: str,
+    compiled_firewall: CompiledFirewall,
+    format: Optional[str] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> ReplayReport:
+    """
+    Replay a flow log against a firewall.
+
+    :param path: The path of the flow log
+    :param compiled_firewall: The firewall
+    :param format: The log's format, one of FLOW_LOG_FORMATS, guessed from
+        its first byte when None
+    :param workers: The number of worker processes, the number of CPUs when None
+    :param chunk_size: The size of the chunks evaluated by the workers
+
+    :raise InvalidFlowError: if the CSV header lacks a flow column
+
+    :return: The replay's aggregates
+    """
+    report = ReplayReport(compiled_firewall)
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return report
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            if format is None:
+                format = NDJSON if log[:1] == b"{" else CSV
+            start, columns = (0, None) if format == NDJSON else _read_header(log)
+            chunks = _chunks(log, start, chunk_size)
+
+    with Pool(
+        workers,
+        initializer=_start_worker,
+        initargs=(path, format, columns, compiled_firewall),
+    ) as pool:
+        for result in pool.imap(_replay_chunk, chunks):
+            report.add(result)
+
+    return report
+
+
+def _read_header(log: mmap.mmap) -> tuple[int, tuple[int, int, int, int]]:
+    """Find the flow columns of a CSV log and where its flows start."""
+    end = log.find(b"\n")
+    end = len(log) if end == -1 else end + 1
+    names = [
+        name.strip().strip('"').lower()
+        for name in log[:end].decode("utf-8", errors="replace").split(",")
+    ]
+    for column in FLOW_COLUMNS:
+        if column not in names:
+            raise InvalidFlowError(f"The CSV header lacks the {column} column")
+
+    return end, tuple(names.index(column) for column in FLOW_COLUMNS)
+
+
+def _chunks(log: mmap.mmap, start: int, chunk_size: int) -> list[tuple[int, int]]:
+    chunks = []
+    while start < len(log):
+        end = log.find(b"\n", min(start + chunk_size, len(log)) - 1)
+        end = len(log) if end == -1 else end + 1
+        chunks.append((start, end))
+        start = end
+
+    return chunks
+
+
+def _start_worker(
+    path: str,
+    format: str,
+    columns: Optional[tuple[int, int, int, int]],
+    compiled_firewall: CompiledFirewall,
+) -> None:
+    global _worker
+
+    with open(path, "rb") as file:
+        log = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    _worker = _Worker(log, format, columns, compiled_firewall)
+
+
+def _replay_chunk(chunk: tuple[int, int]) -> _ChunkResult:
+    start, end = chunk
+    lines = _worker.log[start:end].decode("utf-8", errors="replace").splitlines()
+
+    source_ips = bytearray()
+    destination_ips = bytearray()
+    destination_ports = array("H")
+    protocol_codes = array("B")
+    invalid_lines = 0
+    invalid_line_samples = []
+    for line in lines:
+        if not line or line.isspace():
+            continue
+        try:
+            if _worker.format == NDJSON:
+                source_ip, destination_ip, port, protocol = _ndjson_flow(line)
+            else:
+                source_ip, destination_ip, port, protocol = _csv_flow(
+                    line, _worker.columns
+                )
+            source_ip = inet_pton(AF_INET, source_ip)
+            destination_ip = inet_pton(AF_INET, destination_ip)
+            protocol_code = _protocol_code(protocol)
+            # array("H") rejects ports out of range
+            destination_ports.append(int(port))
+        except (ValueError, LookupError, TypeError, OverflowError, OSError):
+            invalid_lines += 1
+            if len(invalid_line_samples) < MAX_SAMPLES:
+                invalid_line_samples.append(line)
+            continue
+
+        source_ips += source_ip
+        destination_ips += destination_ip
+        protocol_codes.append(protocol_code)
+
+    flows = FlowBatch(
+        np.frombuffer(source_ips, dtype=">u4").astype(np.uint32),
+        np.frombuffer(destination_ips, dtype=">u4").astype(np.uint32),
+        np.frombuffer(destination_ports, dtype=np.uint16),
+        np.frombuffer(protocol_codes, dtype=np.uint8),
+    )
+    if len(flows):
+        matched_positions = _worker.compiled_firewall.match_batch(flows)
+    else:
+        matched_positions = np.empty(0, dtype=np.int64)
+    positions, flow_counts = np.unique(matched_positions, return_counts=True)
+
+    return _ChunkResult(
+        len(flows),
+        positions,
+        flow_counts,
+        [
+            _flow_record(flows, index)
+            for index in np.flatnonzero(matched_positions == NO_MATCH)[:MAX_SAMPLES]
+        ],
+        invalid_lines,
+        invalid_line_samples,
+    )
+
+
+def _csv_flow(line: str, columns: tuple[int, int, int, int]) -> tuple:
+    fields = line.split(",")
+    return tuple(fields[column].strip().strip('"') for column in columns)
+
+
+def _ndjson_flow(line: str) -> tuple:
+    record = json.loads(line)
+    return tuple(record[column] for column in FLOW_COLUMNS)
+
+
+def _protocol_code(protocol) -> int:
+    protocol = str(protocol)
+    code = _PROTOCOL_CODES_BY_NAME.get(protocol.upper())
+    if code is None:
+        if not protocol.isdigit():
+            raise ValueError(protocol)
+        code = _PROTOCOL_CODES_BY_NUMBER.get(protocol, ANY_PROTOCOL_CODE)
+
+    return code
+
+
+def _flow_record(flows: FlowBatch, index: int) -> dict:
+    return {
+        "source_ip": str(IPv4Address(int(flows.source_ips[index]))),
+        "destination_ip": str(IPv4Address(int(flows.destination_ips[index]))),
+        "destination_port": int(flows.destination_ports[index]),
+        "protocol": PROTOCOLS[flows.protocol_codes[index]].name,
+    }
@@ -0,0 +1,190 @@
+"""
+In-memory hit counters of the rules deciding evaluated flows.
+
+Evaluations add to counters of their own thread, whose lock is only taken by
+the flush otherwise, so threads don't contend on a shared lock and the
+evaluation never waits for the database. A background thread merges the
+threads' counters and writes them every RULE_HITS_FLUSH_INTERVAL seconds, in
+batched upserts of RuleHitsRepository.add_hits. Counters not flushed yet are
+lost if the process is killed, they are flushed when it exits normally.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.db.repositories import RuleHitsRepository
+
+from .compiled_firewall import NO_MATCH, CompiledFirewall
+from .settings import RuleHitsSettings
+
+logger = logging.getLogger(__name__)
+
+settings = RuleHitsSettings.from_env()
+
+
+class _ThreadHits:
+    """Hit counters of a thread, [hits, last hit time] by rule id."""
+
+    __slots__ = ("thread", "lock", "hits")
+
+    def __init__(self) -> None:
+        self.thread = threading.current_thread()
+        self.lock = threading.Lock()
+        self.hits: dict[int, list] = {}
+
+
+class RuleHitCounters:
+    """Hit counters of the rules, flushed periodically to the database."""
+
+    def __init__(self, flush_interval: float) -> None:
+        """
+        :param flush_interval: The number of seconds between two flushes
+        """
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_hits: list[_ThreadHits] = []
+        self._flusher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def record(
+        self, compiled_firewall: CompiledFirewall, positions: np.ndarray
+    ) -> None:
+        """
+        Count the flows decided by each rule of an evaluated batch.
+
+        :param compiled_firewall: The firewall the flows were evaluated against
+        :param positions: The positions of the flows' matching rules, as
+            returned by CompiledFirewall.match_batch
+        """
+        matched_positions, hits = np.unique(
+            positions[positions != NO_MATCH], return_counts=True
+        )
+        if not len(matched_positions):
+            return
+
+        rule_ids = np.frombuffer(compiled_firewall.rule_ids, dtype=np.int64)[
+            matched_positions
+        ]
+        self._add(zip(rule_ids.tolist(), hits.tolist()))
+
+    def record_hit(self, rule_id: int) -> None:
+        """
+        Count a flow decided by a rule.
+
+        :param rule_id: The id of the flow's matching rule
+        """
+        self._add(((rule_id, 1),))
+
+    def flush(self) -> int:
+        """
+        Write the counters to the database and reset them.
+
+        Counters are put back when the write fails, so the next flush retries.
+
+        :return: The number of rules whose counters were written
+        """
+        pending = self._collect()
+        if not pending:
+            return 0
+
+        try:
+            return RuleHitsRepository.add_hits(pending)
+        except Exception:
+            self._put_back(pending)
+            raise
+
+    def stop(self) -> None:
+        """Stop the background flushes, then flush the remaining counters."""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _add(self, hits: Iterable[tuple[int, int]]) -> None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        thread_hits = self._current_thread_hits()
+        with thread_hits.lock:
+            counters = thread_hits.hits
+            for rule_id, rule_hits in hits:
+                counter = counters.get(rule_id)
+                if counter is None:
+                    counters[rule_id] = [rule_hits, now]
+                else:
+                    counter[0] += rule_hits
+                    counter[1] = now
+
+    def _current_thread_hits(self) -> _ThreadHits:
+        thread_hits = getattr(self._local, "hits", None)
+        if thread_hits is None:
+            thread_hits = self._local.hits = _ThreadHits()
+            with self._lock:
+                self._thread_hits.append(thread_hits)
+                if self._flusher is None:
+                    self._start_flusher()
+
+        return thread_hits
+
+    def _start_flusher(self) -> None:
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, name="rule-hits-flusher", daemon=True
+        )
+        self._flusher.start()
+        atexit.register(self.stop)
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush the rule hit counters")
+
+    def _collect(self) -> dict[int, tuple[int, datetime]]:
+        with self._lock:
+            thread_hits_list = list(self._thread_hits)
+            # Threads of served requests come and go, their counters are
+            # dropped once collected for the last time
+            self._thread_hits = [
+                thread_hits
+                for thread_hits in thread_hits_list
+                if thread_hits.thread.is_alive()
+            ]
+
+        pending: dict[int, tuple[int, datetime]] = {}
+        for thread_hits in thread_hits_list:
+            with thread_hits.lock:
+                counters, thread_hits.hits = thread_hits.hits, {}
+            _merge(pending, counters.items())
+
+        return pending
+
+    def _put_back(self, pending: dict[int, tuple[int, datetime]]) -> None:
+        thread_hits = self._current_thread_hits()
+        with thread_hits.lock:
+            merged: dict[int, tuple[int, datetime]] = {}
+            _merge(merged, thread_hits.hits.items())
+            _merge(merged, pending.items())
+            thread_hits.hits = {
+                rule_id: [hits, last_hit_at]
+                for rule_id, (hits, last_hit_at) in merged.items()
+            }
+
+
+def _merge(pending: dict[int, tuple[int, datetime]], counters) -> None:
+    for rule_id, (hits, last_hit_at) in counters:
+        previous = pending.get(rule_id)
+        if previous is not None:
+            hits += previous[0]
+            last_hit_at = max(last_hit_at, previous[1])
+        pending[rule_id] = (hits, last_hit_at)
+
+
+rule_hit_counters = RuleHitCounters(settings.flush_interval)
@@ -0,0 +1,62 @@
+"""Evaluation settings, read from the environment or a .env file"""
+
+from __future__ import annotations
+
+import os
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class RuleHitsSettings(NamedTuple):
+    """Settings of the rules' hit counters."""
+
+    flush_interval: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> RuleHitsSettings:
+        """
+        Read the settings from environment variables.
+
+        RULE_HITS_FLUSH_INTERVAL is the number of seconds between two writes
+        of the counters to the database.
+
+        :raise ValueError: if a variable has an invalid value
+
+        :return: The settings
+        """
+        defaults = cls()
+        settings = cls(
+            flush_interval=float(
+                os.environ.get("RULE_HITS_FLUSH_INTERVAL", defaults.flush_interval)
+            ),
+        )
+
+        if settings.flush_interval <= 0:
+            raise ValueError(
+                "Invalid RULE_HITS_FLUSH_INTERVAL "
+                f"'{settings.flush_interval}', it must be positive"
+            )
+
+        return settings
+
+
+class SharedTablesSettings(NamedTuple):
+    """Settings of the compiled firewalls shared by the processes."""
+
+    directory: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> SharedTablesSettings:
+        """
+        Read the settings from environment variables.
+
+        COMPILED_TABLES_DIR is the directory of the shared segments, a memory
+        backed file system like /dev/shm. Compiled firewalls aren't shared
+        when it isn't set.
+
+        :return: The settings
+        """
+        return cls(directory=os.environ.get("COMPILED_TABLES_DIR") or None)
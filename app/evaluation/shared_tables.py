@@ -0,0 +1,165 @@
+"""
+Compiled firewalls shared by the processes serving the API.
+
+The first process compiling a firewall at a revision publishes its columns
+and index as a segment file of COMPILED_TABLES_DIR. Every process, the
+publisher included, maps the segment and builds its compiled firewall on
+memoryviews of the mapping, so the rules are in memory once whatever the
+number of workers, and workers only read the database for segments not
+published yet.
+
+Segments are immutable and named after the firewall's id and revision, which
+is their generation number. A change of the configuration bumps the revision,
+each worker reads it on its next request and maps the new generation. A
+segment is written to a temporary file, then renamed, so it is swapped in
+atomically and never mapped while partially written. Older generations are
+removed once a new one is published, workers still using them keep their
+mapping until they drop it.
+"""
+
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from array import array
+from contextlib import suppress
+from glob import escape, glob
+from typing import BinaryIO, Optional
+
+from .compiled_firewall import INDEX_COLUMNS, RULE_COLUMNS, CompiledFirewall
+from .settings import SharedTablesSettings
+
+logger = logging.getLogger(__name__)
+
+settings = SharedTablesSettings.from_env()
+
+SEGMENT_MAGIC = b"JFTABLE1"
+
+_COLUMNS = {**RULE_COLUMNS, **INDEX_COLUMNS}
+# The magic, the firewall's id and revision, then the length of each column
+_HEADER = struct.Struct(f"<8s{2 + len(_COLUMNS)}q")
+# Columns start on 8 bytes boundaries, so their items are aligned
+_ALIGNMENT = 8
+
+
+def attach_compiled_firewall(
+    firewall_id: int, revision: int
+) -> Optional[CompiledFirewall]:
+    """
+    Map the published segment of a firewall's revision.
+
+    :param firewall_id: The firewall's id
+    :param revision: The firewall's revision
+
+    :return: The compiled firewall, whose columns are views of the segment,
+        None if sharing is disabled or the segment isn't published
+    """
+    if settings.directory is None:
+        return None
+
+    path = _segment_path(settings.directory, firewall_id, revision)
+    try:
+        with open(path, "rb") as file:
+            segment = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return _read_segment(segment, firewall_id, revision)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as err:
+        logger.warning("Ignoring the compiled firewall segment %s: %s", path, err)
+        return None
+
+
+def publish_compiled_firewall(
+    compiled_firewall: CompiledFirewall, revision: int
+) -> CompiledFirewall:
+    """
+    Publish a compiled firewall to the other processes, then map it.
+
+    :param compiled_firewall: The compiled firewall
+    :param revision: The revision of the firewall it was compiled from
+
+    :return: The compiled firewall mapped from its segment, the given one if
+        sharing is disabled or the segment couldn't be written
+    """
+    if settings.directory is None:
+        return compiled_firewall
+
+    firewall_id = compiled_firewall.firewall_id
+    path = _segment_path(settings.directory, firewall_id, revision)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(settings.directory, exist_ok=True)
+        with open(temporary_path, "wb") as file:
+            _write_segment(file, compiled_firewall, revision)
+        # Workers publishing the same revision at once write the same segment
+        os.replace(temporary_path, path)
+    except OSError as err:
+        logger.warning("Failed to publish the compiled firewall %s: %s", path, err)
+        with suppress(OSError):
+            os.remove(temporary_path)
+        return compiled_firewall
+
+    _remove_previous_generations(settings.directory, firewall_id, revision)
+
+    return attach_compiled_firewall(firewall_id, revision) or compiled_firewall
+
+
+def _segment_path(directory: str, firewall_id: int, revision: int) -> str:
+    return os.path.join(directory, f"firewall-{firewall_id}.{revision}.tables")
+
+
+def _write_segment(
+    file: BinaryIO, compiled_firewall: CompiledFirewall, revision: int
+) -> None:
+    tables = compiled_firewall.tables
+    file.write(
+        _HEADER.pack(
+            SEGMENT_MAGIC,
+            compiled_firewall.firewall_id,
+            revision,
+            *(len(tables[name]) for name in _COLUMNS),
+        )
+    )
+    for name in _COLUMNS:
+        file.write(tables[name])
+        file.write(bytes(-tables[name].nbytes % _ALIGNMENT))
+
+
+def _read_segment(
+    segment: mmap.mmap, firewall_id: int, revision: int
+) -> CompiledFirewall:
+    magic, segment_firewall_id, segment_revision, *lengths = _HEADER.unpack_from(
+        segment
+    )
+    if magic != SEGMENT_MAGIC or (segment_firewall_id, segment_revision) != (
+        firewall_id,
+        revision,
+    ):
+        raise ValueError("it isn't a segment of this revision")
+
+    view = memoryview(segment)
+    tables = {}
+    offset = _HEADER.size
+    for (name, typecode), length in zip(_COLUMNS.items(), lengths):
+        size = length * array(typecode).itemsize
+        if offset + size > len(view):
+            raise ValueError("it is truncated")
+        tables[name] = view[offset : offset + size].cast(typecode)
+        offset += size + -size % _ALIGNMENT
+
+    return CompiledFirewall.from_tables(firewall_id, tables)
+
+
+def _remove_previous_generations(
+    directory: str, firewall_id: int, revision: int
+) -> None:
+    for path in glob(
+        os.path.join(escape(directory), f"firewall-{firewall_id}.*.tables")
+    ):
+        generation = path.rsplit(".", 2)[-2]
+        if generation.isdigit() and int(generation) < revision:
+            with suppress(OSError):
+                os.remove(path)
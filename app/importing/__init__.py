@@ -0,0 +1,5 @@
+"""Import of configurations exported by other firewalls"""
+
+from .dumps import DUMP_FORMATS, DumpReader, InvalidDumpError
+
+__all__ = ["DUMP_FORMATS", "DumpReader", "InvalidDumpError"]
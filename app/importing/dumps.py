@@ -0,0 +1,494 @@
+"""
+Streaming readers of iptables-save and `nft list ruleset` dumps.
+
+Readers go through a dump line by line and yield its chains and rules in
+order, as (chain name, rule columns) entries, so a dump of any size is read
+in constant memory. Only the filter table of iptables and the filter chains of
+the ip and inet nftables tables are read. Chains become filtering policies
+named after them, so nftables dumps with filter chains of the same name in
+two tables are rejected.
+
+Rules the API can't express (interface, state or set matches, negations,
+jumps to other chains, logging...) are skipped and counted, the readers don't
+approximate them with broader or narrower rules.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from itertools import chain
+from socket import inet_aton
+from typing import Iterable, Iterator, Optional
+
+from app.db.models import Protocol, RuleAction
+
+IPTABLES_SAVE = "iptables-save"
+NFTABLES = "nftables"
+DUMP_FORMATS = (IPTABLES_SAVE, NFTABLES)
+
+MAX_ADDRESS = 0xFFFFFFFF
+MAX_PORT = 0xFFFF
+MAX_NAME_LENGTH = 50
+
+# Number of skipped rules whose line number is reported
+MAX_SKIPPED_RULE_SAMPLES = 10
+
+IPTABLES_PROTOCOLS = {
+    "tcp": Protocol.TCP,
+    "udp": Protocol.UDP,
+    "icmp": Protocol.ICMP,
+    "all": Protocol.ANY,
+}
+IPTABLES_ACTIONS = {
+    "ACCEPT": RuleAction.ALLOW,
+    "DROP": RuleAction.DENY,
+    "REJECT": RuleAction.DENY,
+}
+NFTABLES_PROTOCOLS = {
+    "tcp": Protocol.TCP,
+    "udp": Protocol.UDP,
+    "icmp": Protocol.ICMP,
+}
+NFTABLES_ACTIONS = {
+    "accept": RuleAction.ALLOW,
+    "drop": RuleAction.DENY,
+    "reject": RuleAction.DENY,
+}
+NFTABLES_FAMILIES = ("ip", "inet")
+
+# Options of the supported iptables matches and targets, all taking a value
+IPTABLES_OPTIONS = {
+    "-s": "source",
+    "--source": "source",
+    "-d": "destination",
+    "--destination": "destination",
+    "-p": "protocol",
+    "--protocol": "protocol",
+    "-m": "match",
+    "--match": "match",
+    "--dport": "ports",
+    "--destination-port": "ports",
+    "--comment": "comment",
+    "-j": "target",
+    "--jump": "target",
+    "--reject-with": "reject type",
+}
+IPTABLES_MATCHES = ("tcp", "udp", "icmp", "comment")
+
+# Addresses and ports parsed once, rulesets repeat the same few
+PARSED_VALUES_CACHE_SIZE = 4096
+
+DumpEntry = tuple[str, Optional[dict]]
+
+_WORD = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+_ESCAPED_CHARACTER = re.compile(r"\\(.)")
+
+
+class InvalidDumpError(ValueError):
+    """Raised when a dump is not a valid iptables-save or nftables dump."""
+
+
+class _UnsupportedRuleError(Exception):
+    """Raised when a rule of a dump can't be expressed by the API."""
+
+
+class DumpReader:
+    """
+    Reader of the chains and rules of a dump.
+
+    :ivar skipped_rules: The number of rules skipped so far because the API
+        can't express them
+    :ivar skipped_rule_lines: The line numbers of the first skipped rules
+    """
+
+    def __init__(self, lines: Iterable[str], format: Optional[str] = None) -> None:
+        """
+        :param lines: The lines of the dump
+        :param format: The dump's format, one of DUMP_FORMATS, guessed from
+            its first statement when None
+        """
+        self.lines = lines
+        self.format = format
+        self.skipped_rules = 0
+        self.skipped_rule_lines: list[int] = []
+
+    def __iter__(self) -> Iterator[DumpEntry]:
+        """
+        Read the dump.
+
+        :raise InvalidDumpError: if the dump is malformed
+
+        :return: The entries in order, a (chain name, None) entry for every
+            chain then a (chain name, rule columns) entry for every rule, the
+            columns lacking the filtering policy and the position
+        """
+        lines = enumerate(self.lines, start=1)
+        if self.format is None:
+            read_lines = self._guess_format(lines)
+            lines = chain(read_lines, lines)
+
+        if self.format == IPTABLES_SAVE:
+            return self._read_iptables_save(lines)
+        if self.format == NFTABLES:
+            return self._read_nftables(lines)
+        raise InvalidDumpError(f"Unknown dump format '{self.format}'")
+
+    def _guess_format(self, lines: Iterator[tuple[int, str]]) -> list[tuple[int, str]]:
+        """Read the lines up to the first statement, which tells the format."""
+        read_lines = []
+        for line_number, line in lines:
+            read_lines.append((line_number, line))
+            statement = line.strip()
+            if not statement or statement.startswith("#"):
+                continue
+
+            if statement.startswith(("*", ":", "-A ")):
+                self.format = IPTABLES_SAVE
+            elif statement.startswith(("table ", "flush ", "delete ")):
+                self.format = NFTABLES
+            else:
+                raise InvalidDumpError(
+                    f"Line {line_number}: not an iptables-save or nftables dump"
+                )
+            return read_lines
+
+        raise InvalidDumpError("The dump is empty")
+
+    def _read_iptables_save(
+        self, lines: Iterable[tuple[int, str]]
+    ) -> Iterator[DumpEntry]:
+        in_filter_table = False
+        for line_number, line in lines:
+            if not line or line.isspace() or line.startswith("#"):
+                continue
+
+            if line.startswith("*"):
+                in_filter_table = line.strip() == "*filter"
+            elif not in_filter_table or line.startswith("COMMIT"):
+                continue
+            elif line.startswith(":"):
+                yield _policy_name(line[1:].split(maxsplit=1)[0], line_number), None
+            elif line.startswith("-A "):
+                tokens = _split(line)
+                chain_name = _policy_name(tokens[1], line_number)
+                try:
+                    columns = _iptables_rule(tokens, 2)
+                except _UnsupportedRuleError:
+                    self._skip_rule(line_number)
+                    continue
+                except InvalidDumpError as err:
+                    raise InvalidDumpError(f"Line {line_number}: {err}") from None
+                yield chain_name, columns
+            else:
+                raise InvalidDumpError(
+                    f"Line {line_number}: unexpected iptables-save statement"
+                )
+
+    def _read_nftables(self, lines: Iterable[tuple[int, str]]) -> Iterator[DumpEntry]:
+        table_family = None
+        table = None
+        chain_name = None
+        chain_type = None
+        chain_declared = False
+        chain_line_number = None
+        # The table of every read chain, by name
+        chain_tables: dict[str, str] = {}
+        skipped_depth = 0
+        for line_number, line in lines:
+            statement = line.strip()
+            if not statement or statement.startswith("#"):
+                continue
+
+            if skipped_depth:
+                skipped_depth += statement.count("{") - statement.count("}")
+            elif chain_name is not None:
+                if statement == "}":
+                    if not chain_declared and chain_type in (None, "filter"):
+                        _check_chain_table(
+                            chain_tables, chain_name, table, chain_line_number
+                        )
+                        yield chain_name, None
+                    chain_name = None
+                elif statement.startswith("type "):
+                    chain_type = statement.split()[1]
+                elif statement.startswith(("policy ", "comment ", "devices ")):
+                    continue
+                elif chain_type in (None, "filter"):
+                    if not chain_declared:
+                        _check_chain_table(
+                            chain_tables, chain_name, table, chain_line_number
+                        )
+                        yield chain_name, None
+                        chain_declared = True
+                    try:
+                        columns = _nftables_rule(_split(statement))
+                    except _UnsupportedRuleError:
+                        self._skip_rule(line_number)
+                        continue
+                    except InvalidDumpError as err:
+                        raise InvalidDumpError(f"Line {line_number}: {err}") from None
+                    yield chain_name, columns
+            elif table_family is not None:
+                if statement == "}":
+                    table_family = None
+                elif statement.startswith("chain ") and statement.endswith("{"):
+                    name = statement.split()[1]
+                    if table_family in NFTABLES_FAMILIES:
+                        chain_name = _policy_name(name, line_number)
+                        chain_type = None
+                        chain_declared = False
+                        chain_line_number = line_number
+                    else:
+                        skipped_depth = 1
+                elif statement.endswith("{"):
+                    # Sets, maps, flowtables...
+                    skipped_depth = 1
+                elif statement.startswith("flags "):
+                    continue
+                else:
+                    raise InvalidDumpError(
+                        f"Line {line_number}: unexpected nftables table statement"
+                    )
+            elif statement.startswith("table ") and statement.endswith("{"):
+                table_family = statement.split()[1]
+                table = " ".join(statement.split()[1:3])
+            elif statement.startswith(("table ", "flush ", "delete ")):
+                continue
+            else:
+                raise InvalidDumpError(
+                    f"Line {line_number}: unexpected nftables statement"
+                )
+
+        if chain_name is not None or table_family is not None or skipped_depth:
+            raise InvalidDumpError("The nftables dump ends inside a block")
+
+    def _skip_rule(self, line_number: int) -> None:
+        self.skipped_rules += 1
+        if len(self.skipped_rule_lines) < MAX_SKIPPED_RULE_SAMPLES:
+            self.skipped_rule_lines.append(line_number)
+
+
+def _split(line: str) -> list[str]:
+    """Split a statement into words, quoted strings being a single word."""
+    if '"' not in line:
+        return line.split()
+
+    return [
+        word or (_ESCAPED_CHARACTER.sub(r"\1", quoted) if "\\" in quoted else quoted)
+        for quoted, word in _WORD.findall(line)
+    ]
+
+
+def _policy_name(chain: str, line_number: int) -> str:
+    if len(chain) > MAX_NAME_LENGTH:
+        raise InvalidDumpError(
+            f"Line {line_number}: chain names are limited to {MAX_NAME_LENGTH} characters"
+        )
+
+    return chain
+
+
+def _check_chain_table(
+    chain_tables: dict[str, str], chain: str, table: str, line_number: int
+) -> None:
+    other_table = chain_tables.setdefault(chain, table)
+    if other_table != table:
+        raise InvalidDumpError(
+            f"Line {line_number}: chain '{chain}' of table '{table}' has the name "
+            f"of a chain of table '{other_table}'"
+        )
+
+
+def _rule_columns(
+    name: Optional[str],
+    source: tuple[int, int],
+    destination: tuple[int, int],
+    ports: tuple[int, int],
+    protocol: Protocol,
+    action: RuleAction,
+) -> dict:
+    return {
+        "name": name[:MAX_NAME_LENGTH] if name is not None else None,
+        "source_ip": source[0],
+        "source_ip_end": source[1],
+        "destination_ip": destination[0],
+        "destination_ip_end": destination[1],
+        "destination_port": ports[0],
+        "destination_port_end": ports[1],
+        "protocol": protocol,
+        "action": action,
+    }
+
+
+def _iptables_rule(tokens: list[str], start: int) -> dict:
+    """Read the options of an -A statement, from its token of index start."""
+    name = None
+    source = destination = (0, MAX_ADDRESS)
+    ports = (0, MAX_PORT)
+    protocol = Protocol.ANY
+    action = None
+
+    # Options and their values alternate, the options being read by index
+    # rather than through an iterator as rulesets have millions of them
+    for index in range(start, len(tokens), 2):
+        option = IPTABLES_OPTIONS.get(tokens[index])
+        if option is None:
+            raise _UnsupportedRuleError()
+        if index + 1 == len(tokens):
+            raise InvalidDumpError(f"option '{tokens[index]}' lacks its value")
+        value = tokens[index + 1]
+
+        if option == "source":
+            source = _parse_prefix(value)
+        elif option == "destination":
+            destination = _parse_prefix(value)
+        elif option == "protocol":
+            protocol = IPTABLES_PROTOCOLS.get(value)
+            if protocol is None:
+                raise _UnsupportedRuleError()
+        elif option == "match":
+            if value not in IPTABLES_MATCHES:
+                raise _UnsupportedRuleError()
+        elif option == "ports":
+            ports = _parse_ports(value, ":")
+        elif option == "comment":
+            name = value
+        elif option == "target":
+            action = IPTABLES_ACTIONS.get(value)
+            if action is None:
+                raise _UnsupportedRuleError()
+
+    if action is None:
+        raise _UnsupportedRuleError()
+    if protocol == Protocol.ICMP:
+        ports = (0, MAX_PORT)
+
+    return _rule_columns(name, source, destination, ports, protocol, action)
+
+
+def _nftables_rule(tokens: list[str]) -> dict:
+    name = None
+    source = destination = (0, MAX_ADDRESS)
+    ports = (0, MAX_PORT)
+    protocol = Protocol.ANY
+    action = None
+
+    verdict = None
+    words = iter(tokens)
+    for word in words:
+        if verdict is not None and word != "comment":
+            # Only the type of a reject, "with icmp type ...", follows a verdict
+            if not (verdict == "reject with" or (verdict, word) == ("reject", "with")):
+                raise _UnsupportedRuleError()
+            verdict = "reject with"
+            continue
+
+        if word == "counter":
+            continue
+        if word in ("packets", "bytes"):
+            _value(words)
+        elif word == "ip":
+            field = _value(words)
+            value = _value(words)
+            if field == "saddr":
+                source = _parse_prefix(value)
+            elif field == "daddr":
+                destination = _parse_prefix(value)
+            elif field == "protocol":
+                protocol = _nftables_protocol(value)
+            else:
+                raise _UnsupportedRuleError()
+        elif word == "meta":
+            if _value(words) != "l4proto":
+                raise _UnsupportedRuleError()
+            value = _value(words)
+            if value == "{":
+                protocol = _nftables_protocol_set(words)
+            else:
+                protocol = _nftables_protocol(value)
+        elif word in ("tcp", "udp", "th"):
+            if _value(words) != "dport":
+                raise _UnsupportedRuleError()
+            if word != "th":
+                protocol = NFTABLES_PROTOCOLS[word]
+            ports = _parse_ports(_value(words), "-")
+        elif word == "comment":
+            name = _value(words)
+        elif word in NFTABLES_ACTIONS:
+            verdict = word
+            action = NFTABLES_ACTIONS[word]
+        else:
+            raise _UnsupportedRuleError()
+
+    if action is None:
+        raise _UnsupportedRuleError()
+    if protocol == Protocol.ICMP:
+        ports = (0, MAX_PORT)
+
+    return _rule_columns(name, source, destination, ports, protocol, action)
+
+
+def _nftables_protocol(value: str) -> Protocol:
+    protocol = NFTABLES_PROTOCOLS.get(value)
+    if protocol is None:
+        raise _UnsupportedRuleError()
+
+    return protocol
+
+
+def _nftables_protocol_set(words: Iterator[str]) -> Protocol:
+    """Read a protocol set, only { tcp, udp } can be expressed, by ANY with ports."""
+    elements = set()
+    for word in words:
+        if word == "}":
+            break
+        elements.update(element for element in word.split(",") if element)
+
+    if elements != {"tcp", "udp"}:
+        raise _UnsupportedRuleError()
+
+    return Protocol.ANY
+
+
+def _value(words: Iterator[str]) -> str:
+    value = next(words, None)
+    if value is None:
+        raise InvalidDumpError("an option lacks its value")
+    if value == "!=":
+        raise _UnsupportedRuleError()
+
+    return value
+
+
+@lru_cache(maxsize=PARSED_VALUES_CACHE_SIZE)
+def _parse_prefix(value: str) -> tuple[int, int]:
+    address, _, length = value.partition("/")
+    if address.count(".") != 3:
+        # Sets, ranges, IPv6 or host names
+        raise _UnsupportedRuleError()
+    try:
+        start = int.from_bytes(inet_aton(address), "big")
+        prefix_length = int(length) if length else 32
+    except (OSError, ValueError):
+        raise InvalidDumpError(f"invalid address '{value}'")
+    if not 0 <= prefix_length <= 32:
+        raise InvalidDumpError(f"invalid address '{value}'")
+
+    host_mask = MAX_ADDRESS >> prefix_length
+    start &= MAX_ADDRESS ^ host_mask
+    return start, start | host_mask
+
+
+@lru_cache(maxsize=PARSED_VALUES_CACHE_SIZE)
+def _parse_ports(value: str, separator: str) -> tuple[int, int]:
+    start, _, end = value.partition(separator)
+    try:
+        ports = (int(start), int(end) if end else int(start))
+    except ValueError:
+        # Named services or port sets
+        raise _UnsupportedRuleError()
+    if not 0 <= ports[0] <= ports[1] <= MAX_PORT:
+        raise InvalidDumpError(f"invalid port range '{value}'")
+
+    return ports
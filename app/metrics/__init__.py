@@ -0,0 +1,26 @@
+"""Performance metrics of the requests, exposed to Prometheus"""
+
+from .caches import CacheCollector
+from .database import instrument_engine
+from .middleware import MetricsMiddleware, registry, render_metrics
+from .query_log import (
+    QueryRecorder,
+    TooManyQueriesError,
+    assert_max_queries,
+    record_queries,
+)
+from .request_stats import RequestStats, current_request_stats
+
+__all__ = [
+    "CacheCollector",
+    "MetricsMiddleware",
+    "QueryRecorder",
+    "RequestStats",
+    "TooManyQueriesError",
+    "assert_max_queries",
+    "current_request_stats",
+    "instrument_engine",
+    "record_queries",
+    "registry",
+    "render_metrics",
+]
@@ -0,0 +1,74 @@
+"""
+Statistics of the in-process caches, in the Prometheus format.
+
+The caches keep their own counters, they are read when the metrics are
+scraped so lookups never update a Prometheus metric.
+"""
+
+from typing import Iterator
+
+from prometheus_client.metrics_core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    Metric,
+)
+from prometheus_client.registry import Collector
+
+from app.cache import LRUCache, configuration_cache, decision_cache, snapshot_cache
+
+from .middleware import registry
+
+
+class CacheCollector(Collector):
+    """Collect the statistics of LRU caches, labelled by cache name."""
+
+    def __init__(self, caches: dict[str, LRUCache]) -> None:
+        """
+        :param caches: The caches, by name
+        """
+        self.caches = caches
+
+    def collect(self) -> Iterator[Metric]:
+        hits = CounterMetricFamily(
+            "cache_hits", "Lookups finding their entry", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "cache_misses", "Lookups not finding their entry", labels=["cache"]
+        )
+        evictions = CounterMetricFamily(
+            "cache_evictions",
+            "Entries evicted to make room for new ones",
+            labels=["cache"],
+        )
+        hit_ratio = GaugeMetricFamily(
+            "cache_hit_ratio",
+            "Share of the lookups finding their entry",
+            labels=["cache"],
+        )
+        size = GaugeMetricFamily("cache_size", "Entries held", labels=["cache"])
+        maxsize = GaugeMetricFamily(
+            "cache_maxsize", "Entries held at most", labels=["cache"]
+        )
+
+        for name, cache in self.caches.items():
+            stats = cache.stats
+            lookups = stats.hits + stats.misses
+            hits.add_metric([name], stats.hits)
+            misses.add_metric([name], stats.misses)
+            evictions.add_metric([name], stats.evictions)
+            hit_ratio.add_metric([name], stats.hits / lookups if lookups else 0.0)
+            size.add_metric([name], stats.size)
+            maxsize.add_metric([name], stats.maxsize)
+
+        yield from (hits, misses, evictions, hit_ratio, size, maxsize)
+
+
+registry.register(
+    CacheCollector(
+        {
+            "configuration": configuration_cache,
+            "decision": decision_cache,
+            "snapshot": snapshot_cache,
+        }
+    )
+)
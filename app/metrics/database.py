@@ -0,0 +1,74 @@
+"""
+Measure the database work of requests with SQLAlchemy events.
+
+Every statement run on the app's engines is counted and timed, and the rows
+returned by the SELECT statements of the sessions are counted, whether they
+become ORM objects or stay Core rows, in the stats of the current request.
+Statements are also handed to the query log.
+"""
+
+import time
+from typing import Optional
+
+from sqlalchemy import Engine, Result, event
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app.db.session import async_engine_listeners, engine, read_engine
+
+from .query_log import on_statement
+from .request_stats import current_request_stats
+
+_QUERY_STARTS_KEY = "metrics_query_starts"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Count and time the statements run on an engine.
+
+    :param engine: The engine, the sync_engine of an async one
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+) -> None:
+    connection.info.setdefault(_QUERY_STARTS_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+) -> None:
+    duration = time.perf_counter() - connection.info[_QUERY_STARTS_KEY].pop()
+
+    stats = current_request_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += duration
+
+    on_statement(stats, statement, parameters, duration)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_loaded_rows(orm_execute_state: ORMExecuteState) -> Optional[Result]:
+    stats = current_request_stats()
+    execution_options = orm_execute_state.execution_options
+    # Streamed results are left alone, counting them would buffer them
+    if (
+        stats is None
+        or not orm_execute_state.is_select
+        or execution_options.get("yield_per")
+        or execution_options.get("stream_results")
+    ):
+        return None
+
+    result = orm_execute_state.invoke_statement().freeze()
+    stats.rows_loaded += len(result.data)
+    return result()
+
+
+for instrumented_engine in {engine, read_engine}:
+    instrument_engine(instrumented_engine)
+# The async engines are instrumented when they are created
+async_engine_listeners.append(instrument_engine)
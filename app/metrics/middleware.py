@@ -0,0 +1,128 @@
+"""
+Per operation metrics of the requests, in the Prometheus format.
+
+Metrics are labelled by the name of the operation's handler, which is the
+same whether the app serves the sync or the async endpoints.
+"""
+
+import random
+import time
+
+from connexion.middleware.abstract import ROUTING_CONTEXT
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+)
+from prometheus_client.exposition import generate_latest
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .query_log import report_repeated_statements, settings
+from .request_stats import RequestStats
+
+registry = CollectorRegistry()
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, until the last byte of its response is sent",
+    ["operation", "method", "status"],
+    registry=registry,
+)
+request_queries = Histogram(
+    "http_request_db_queries",
+    "SQL statements run while serving a request",
+    ["operation"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+    registry=registry,
+)
+request_db_duration = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent running SQL statements while serving a request",
+    ["operation"],
+    registry=registry,
+)
+request_rows_loaded = Histogram(
+    "http_request_db_rows_loaded",
+    "Rows returned by SELECT statements while serving a request, streamed "
+    "results excepted",
+    ["operation"],
+    buckets=(0, 1, 10, 100, 1_000, 10_000, 100_000),
+    registry=registry,
+)
+response_size = Histogram(
+    "http_response_size_bytes",
+    "Size of the response bodies, after compression",
+    ["operation"],
+    buckets=tuple(256 * 4**exponent for exponent in range(9)),
+    registry=registry,
+)
+
+repeated_statements = Counter(
+    "http_request_repeated_statements",
+    "Statements run too many times by a request, in the sampled requests",
+    ["operation"],
+    registry=registry,
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Render the metrics in the Prometheus text format.
+
+    :return: The metrics and their content type
+    """
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Measure the requests routed to an operation of the spec.
+
+    It must run after connexion's routing, which tells the operation of the
+    request: app.add_middleware(MetricsMiddleware,
+    position=MiddlewarePosition.BEFORE_SECURITY)
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        operation_id = (
+            scope.get("extensions", {}).get(ROUTING_CONTEXT, {}).get("operation_id")
+        )
+        if scope["type"] != "http" or operation_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        operation = operation_id.rpartition(".")[2]
+        stats = RequestStats(
+            count_statements=random.random() < settings.repeated_statement_sample_rate
+        ).start()
+        # Kept if the endpoint raises, the exception becomes a 500 upstream
+        status = 500
+        body_size = 0
+        start = time.perf_counter()
+
+        async def measured_send(message: Message) -> None:
+            nonlocal status, body_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            request_duration.labels(operation, scope["method"], status).observe(
+                time.perf_counter() - start
+            )
+            request_queries.labels(operation).observe(stats.queries)
+            request_db_duration.labels(operation).observe(stats.db_seconds)
+            request_rows_loaded.labels(operation).observe(stats.rows_loaded)
+            response_size.labels(operation).observe(body_size)
+            if stats.statement_counts is not None:
+                repeated_statements.labels(operation).inc(
+                    report_repeated_statements(stats, operation)
+                )
@@ -0,0 +1,209 @@
+"""
+Slow query log and detection of repeated statements.
+
+Statements slower than SLOW_QUERY_THRESHOLD_MS are logged with their
+parameters and the app's frames which ran them. In a sample of the requests,
+statements run REPEATED_QUERY_THRESHOLD times or more with different
+parameters, the usual sign of a lazy load per row (N+1), are logged once the
+request is served.
+
+Tests can bound the statements run by a block of code with
+assert_max_queries, whatever the thread running them.
+"""
+
+from __future__ import annotations
+
+import logging
+import reprlib
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from types import FrameType
+from typing import Iterator, Optional
+
+import greenlet
+
+from .request_stats import RequestStats
+from .settings import QueryLogSettings
+
+logger = logging.getLogger(__name__)
+
+settings = QueryLogSettings.from_env()
+
+APP_DIR = Path(__file__).resolve().parent.parent
+METRICS_DIR = Path(__file__).resolve().parent
+
+_parameters_repr = reprlib.Repr()
+_parameters_repr.maxstring = 60
+_parameters_repr.maxother = 60
+
+_recorders: list[QueryRecorder] = []
+
+
+class TooManyQueriesError(AssertionError):
+    """Raised when a block of code runs more statements than allowed."""
+
+
+class QueryRecorder:
+    """
+    Statements run on the app's engines while recording, in order.
+
+    :ivar statements: The SQL of the statements
+    """
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def repeated_statements(self, threshold: int = 2) -> dict[str, int]:
+        """
+        Find the statements run several times.
+
+        :param threshold: The minimum number of runs
+
+        :return: The number of runs of the repeated statements, by SQL
+        """
+        return {
+            statement: count
+            for statement, count in Counter(self.statements).items()
+            if count >= threshold
+        }
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryRecorder]:
+    """
+    Record the statements run on the app's engines during a block.
+
+    Statements of every thread are recorded, so requests served by a test
+    client count, and so do the ones of concurrent requests: recorders are
+    meant for tests and scripts.
+
+    :return: The recorder, filled as statements run
+    """
+    recorder = QueryRecorder()
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+
+
+@contextmanager
+def assert_max_queries(count: int) -> Iterator[QueryRecorder]:
+    """
+    Check a block runs at most some statements.
+
+    :param count: The maximum number of statements
+
+    :raise TooManyQueriesError: at the end of the block, if it ran more
+
+    :return: The recorder, filled as statements run
+    """
+    with record_queries() as recorder:
+        yield recorder
+
+    if len(recorder) > count:
+        lines = [f"{len(recorder)} statements were run, at most {count} expected:"]
+        lines.extend(f"  {statement}" for statement in recorder.statements)
+        raise TooManyQueriesError("\n".join(lines))
+
+
+def on_statement(
+    stats: Optional[RequestStats], statement: str, parameters, duration: float
+) -> None:
+    """
+    Log a statement if it's slow and count it in the recorders and the stats.
+
+    :param stats: The stats of the current request, None outside of a request
+    :param statement: The SQL of the statement
+    :param parameters: Its parameters
+    :param duration: Its duration, in seconds
+    """
+    for recorder in _recorders:
+        recorder.statements.append(statement)
+
+    if (
+        settings.slow_query_threshold is not None
+        and duration >= settings.slow_query_threshold
+    ):
+        logger.warning(
+            "Slow query (%.1f ms) %s with parameters %s, from %s",
+            duration * 1000,
+            " ".join(statement.split()),
+            _parameters_repr.repr(parameters),
+            call_site(),
+        )
+
+    if stats is not None and stats.statement_counts is not None:
+        stats.statement_counts[statement] += 1
+        if stats.statement_counts[statement] == settings.repeated_statement_threshold:
+            stats.repeated_statement_call_sites[statement] = call_site()
+
+
+def report_repeated_statements(stats: RequestStats, operation: str) -> int:
+    """
+    Log the statements a request ran too many times.
+
+    :param stats: The stats of the served request
+    :param operation: The name of the request's operation
+
+    :return: The number of repeated statements
+    """
+    for statement, site in stats.repeated_statement_call_sites.items():
+        logger.warning(
+            "Suspected N+1 in %s: %s ran %d times, from %s",
+            operation,
+            " ".join(statement.split()),
+            stats.statement_counts[statement],
+            site,
+        )
+
+    return len(stats.repeated_statement_call_sites)
+
+
+def call_site() -> str:
+    """
+    Describe the frames of the app running the current code.
+
+    The async engines run statements in a greenlet, whose parent greenlets
+    hold the frames of the coroutines which awaited them.
+
+    :return: The frames, outermost first, like
+        "app/endpoints/rule_endpoints.py:182 get_rule >
+        app/db/repositories/rule_repository.py:176 find_row_by_id"
+    """
+    frames = _outer_frames(sys._getframe(1))
+    parent = greenlet.getcurrent().parent
+    while parent is not None:
+        if parent.gr_frame is not None:
+            frames[:0] = _outer_frames(parent.gr_frame)
+        parent = parent.parent
+
+    return (
+        " > ".join(
+            f"{Path(frame.f_code.co_filename).relative_to(APP_DIR.parent)}:"
+            f"{frame.f_lineno} {frame.f_code.co_name}"
+            for frame in frames
+            if _is_app_frame(frame)
+        )
+        or "outside of the app"
+    )
+
+
+def _outer_frames(frame: Optional[FrameType]) -> list[FrameType]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+
+    return frames
+
+
+def _is_app_frame(frame: FrameType) -> bool:
+    path = Path(frame.f_code.co_filename)
+    return path.is_relative_to(APP_DIR) and not path.is_relative_to(METRICS_DIR)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class RequestStats:
+    """
+    Database work done while serving a request.
+
+    The stats are shared by the request's context and the contexts copied
+    from it, so queries run in a threadpool are counted too.
+
+    :ivar statement_counts: The runs of each statement by SQL, None unless
+        the request was sampled to detect repeated statements
+    :ivar repeated_statement_call_sites: Where the statements run too many
+        times were run from, by SQL
+    """
+
+    __slots__ = (
+        "queries",
+        "db_seconds",
+        "rows_loaded",
+        "statement_counts",
+        "repeated_statement_call_sites",
+    )
+
+    def __init__(self, count_statements: bool = False) -> None:
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows_loaded = 0
+        self.statement_counts: Optional[Counter[str]] = (
+            Counter() if count_statements else None
+        )
+        self.repeated_statement_call_sites: dict[str, str] = {}
+
+    def start(self) -> RequestStats:
+        """Collect the stats of the current context's database work."""
+        _request_stats.set(self)
+        return self
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """
+    Find the stats of the request being served.
+
+    :return: The stats, None outside of a measured request
+    """
+    return _request_stats.get()
@@ -0,0 +1,69 @@
+"""Query diagnostics settings, read from the environment or a .env file"""
+
+from __future__ import annotations
+
+import os
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class QueryLogSettings(NamedTuple):
+    """
+    Settings of the slow query log and of the repeated statements detector.
+
+    Both are disabled by default.
+    """
+
+    slow_query_threshold: Optional[float] = None
+    repeated_statement_threshold: int = 5
+    repeated_statement_sample_rate: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> QueryLogSettings:
+        """
+        Read the settings from environment variables.
+
+        SLOW_QUERY_THRESHOLD_MS enables the slow query log, statements running
+        longer are logged. QUERY_SAMPLE_RATE is the fraction of requests whose
+        statements are checked for repetitions, REPEATED_QUERY_THRESHOLD the
+        number of runs of a statement in a request making it a suspected N+1.
+
+        :raise ValueError: if a variable has an invalid value
+
+        :return: The settings
+        """
+        defaults = cls()
+        slow_query_threshold_ms = os.environ.get("SLOW_QUERY_THRESHOLD_MS")
+        settings = cls(
+            slow_query_threshold=(
+                float(slow_query_threshold_ms) / 1000
+                if slow_query_threshold_ms
+                else None
+            ),
+            repeated_statement_threshold=int(
+                os.environ.get(
+                    "REPEATED_QUERY_THRESHOLD", defaults.repeated_statement_threshold
+                )
+            ),
+            repeated_statement_sample_rate=float(
+                os.environ.get(
+                    "QUERY_SAMPLE_RATE", defaults.repeated_statement_sample_rate
+                )
+            ),
+        )
+
+        if settings.repeated_statement_threshold < 2:
+            raise ValueError(
+                "Invalid REPEATED_QUERY_THRESHOLD "
+                f"'{settings.repeated_statement_threshold}', it must be at least 2"
+            )
+        if not 0 <= settings.repeated_statement_sample_rate <= 1:
+            raise ValueError(
+                "Invalid QUERY_SAMPLE_RATE "
+                f"'{settings.repeated_statement_sample_rate}', it must be in [0, 1]"
+            )
+
+        return settings
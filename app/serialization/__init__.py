@@ -0,0 +1,27 @@
+"""Serialization of database rows to JSON and rulesets, without ORM objects"""
+
+from .json_fragments import (
+    add_members,
+    array_fragment,
+    filtering_policy_fragment,
+    firewall_fragment,
+    format_address,
+    format_address_range,
+    rule_fragment,
+    rule_with_hits_fragment,
+)
+from .rulesets import RULESET_RENDERERS, render_iptables_restore, render_nftables
+
+__all__ = [
+    "RULESET_RENDERERS",
+    "add_members",
+    "array_fragment",
+    "filtering_policy_fragment",
+    "firewall_fragment",
+    "format_address",
+    "format_address_range",
+    "render_iptables_restore",
+    "render_nftables",
+    "rule_fragment",
+    "rule_with_hits_fragment",
+]
@@ -0,0 +1,102 @@
+"""
+Builders of JSON fragments from Core rows.
+
+Fragments are JSON texts built with string formatting, only names go through
+json.dumps. Rows hold IP addresses as integers, they are formatted without
+creating IPv4Address objects. A fragment shared by many documents, like the
+firewall of a filtering policy, is built once and embedded with add_members.
+The members are in the order of the models' convert_to_json.
+"""
+
+import json
+from typing import Iterable
+
+from sqlalchemy import Row
+
+from app.db.models.rule import format_address, format_address_range
+
+
+def firewall_fragment(firewall: Row) -> str:
+    """
+    Serialize a firewall row.
+
+    :param firewall: A row with the id, name, ip_address and port columns
+
+    :return: The JSON object
+    """
+    return (
+        f'{{"id": {firewall.id}, "name": {json.dumps(firewall.name)}, '
+        f'"ip_address": "{format_address(firewall.ip_address)}", '
+        f'"port": {firewall.port}}}'
+    )
+
+
+def filtering_policy_fragment(filtering_policy: Row) -> str:
+    """
+    Serialize a filtering policy row.
+
+    :param filtering_policy: A row with the id and name columns
+
+    :return: The JSON object
+    """
+    return (
+        f'{{"id": {filtering_policy.id}, '
+        f'"name": {json.dumps(filtering_policy.name)}}}'
+    )
+
+
+def rule_fragment(rule: Row) -> str:
+    """
+    Serialize a rule row.
+
+    :param rule: A row with the columns of RULE_ROW_COLUMNS
+
+    :return: The JSON object
+    """
+    source_ip = format_address_range(rule.source_ip, rule.source_ip_end)
+    destination_ip = format_address_range(rule.destination_ip, rule.destination_ip_end)
+    return (
+        f'{{"id": {rule.id}, "source_ip": "{source_ip}", '
+        f'"destination_ip": "{destination_ip}", '
+        f'"destination_port": {rule.destination_port}, '
+        f'"destination_port_end": {rule.destination_port_end}, '
+        f'"protocol": "{rule.protocol.name}", "action": "{rule.action.name}", '
+        f'"name": {json.dumps(rule.name)}}}'
+    )
+
+
+def rule_with_hits_fragment(rule: Row) -> str:
+    """
+    Serialize a rule row with the rule's hit counters.
+
+    :param rule: A row with the columns of RULE_ROW_COLUMNS and RULE_HITS_COLUMNS
+
+    :return: The JSON object, the last hit's time is in UTC
+    """
+    last_hit_at = (
+        f'"{rule.last_hit_at.isoformat()}Z"' if rule.last_hit_at is not None else "null"
+    )
+    return add_members(
+        rule_fragment(rule), hits=str(rule.hits), last_hit_at=last_hit_at
+    )
+
+
+def array_fragment(fragments: Iterable[str]) -> str:
+    """Join JSON fragments into a JSON array."""
+    return "[" + ", ".join(fragments) + "]"
+
+
+def add_members(fragment: str, **members: str) -> str:
+    """
+    Add members to a JSON object.
+
+    :param fragment: The JSON object
+    :param members: The JSON fragments of the new members, by name
+
+    :return: The JSON object with the new members last
+    """
+    return (
+        fragment[:-1]
+        + "".join(f', "{name}": {member}' for name, member in members.items())
+        + "}"
+    )
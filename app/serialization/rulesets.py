@@ -0,0 +1,226 @@
+"""
+Renderers of a firewall's configuration into rulesets loadable by devices.
+
+Every filtering policy becomes a chain holding its rules in order, and the
+forward hook jumps to the policies' chains in order, so the first matching
+rule decides like in the API. Flows matching no rule are dropped.
+
+Ports only apply to TCP and UDP, as in the API: rules on ICMP match every
+port and rules on the ANY protocol with a port range only match TCP and UDP
+flows on the range. Such a rule needs one line by protocol with iptables.
+Renderers take Core rows and yield the ruleset's lines.
+"""
+
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import Row
+
+from app.db.models import Protocol, RuleAction
+
+from .json_fragments import format_address, format_address_range
+
+MAX_ADDRESS = 0xFFFFFFFF
+MAX_PORT = 0xFFFF
+
+# Longest comment accepted by nft, iptables accepts twice as long
+MAX_COMMENT_LENGTH = 128
+
+NFTABLES_TABLE = "jouer_flux"
+
+NFTABLES_VERDICTS = {RuleAction.ALLOW: "accept", RuleAction.DENY: "drop"}
+IPTABLES_TARGETS = {RuleAction.ALLOW: "ACCEPT", RuleAction.DENY: "DROP"}
+
+RulesetRenderer = Callable[[Row, list[Row], Iterable[Row]], Iterator[str]]
+
+
+def render_nftables(
+    firewall: Row, filtering_policies: list[Row], rules: Iterable[Row]
+) -> Iterator[str]:
+    """
+    Render a firewall as an nftables script, loaded with `nft -f`.
+
+    The script replaces the ip table "jouer_flux" in a single transaction.
+
+    :param firewall: A row with the columns of FIREWALL_ROW_COLUMNS
+    :param filtering_policies: The rows of the ordered filtering policies,
+        with their id and name
+    :param rules: The rows of RULE_ROW_COLUMNS and the filtering policies'
+        ids, in evaluation order
+
+    :return: The lines of the script
+    """
+    yield "#!/usr/sbin/nft -f\n"
+    yield _header(firewall)
+    yield f"table ip {NFTABLES_TABLE}\n"
+    yield f"delete table ip {NFTABLES_TABLE}\n"
+    yield f"table ip {NFTABLES_TABLE} {{\n"
+
+    for filtering_policy, policy_rules in _group_rules(filtering_policies, rules):
+        yield f"\tchain policy_{filtering_policy.id} {{\n"
+        yield f'\t\tcomment "{_comment(filtering_policy.name)}"\n'
+        for rule in policy_rules:
+            addresses = _nftables_addresses(rule)
+            verdict = _nftables_verdict(rule)
+            for protocol in _nftables_protocols(rule):
+                yield f"\t\t{addresses}{protocol}{verdict}\n"
+        yield "\t}\n"
+
+    yield "\tchain forward {\n"
+    yield "\t\ttype filter hook forward priority filter; policy drop;\n"
+    for filtering_policy in filtering_policies:
+        yield f"\t\tjump policy_{filtering_policy.id}\n"
+    yield "\t}\n"
+    yield "}\n"
+
+
+def render_iptables_restore(
+    firewall: Row, filtering_policies: list[Row], rules: Iterable[Row]
+) -> Iterator[str]:
+    """
+    Render a firewall as an iptables-restore input.
+
+    The input replaces the whole filter table, without --noflush.
+
+    :param firewall: A row with the columns of FIREWALL_ROW_COLUMNS
+    :param filtering_policies: The rows of the ordered filtering policies,
+        with their id and name
+    :param rules: The rows of RULE_ROW_COLUMNS and the filtering policies'
+        ids, in evaluation order
+
+    :return: The lines of the input
+    """
+    yield _header(firewall)
+    yield "*filter\n"
+    yield ":INPUT ACCEPT [0:0]\n"
+    yield ":FORWARD DROP [0:0]\n"
+    yield ":OUTPUT ACCEPT [0:0]\n"
+    for filtering_policy in filtering_policies:
+        yield f":policy_{filtering_policy.id} - [0:0]\n"
+
+    for filtering_policy in filtering_policies:
+        yield f"-A FORWARD -j policy_{filtering_policy.id}\n"
+
+    for filtering_policy, policy_rules in _group_rules(filtering_policies, rules):
+        chain = f"policy_{filtering_policy.id}"
+        for rule in policy_rules:
+            addresses = _iptables_addresses(rule)
+            target = f"-j {IPTABLES_TARGETS[rule.action]}"
+            if rule.name is not None:
+                target = f'-m comment --comment "{_comment(rule.name)}" {target}'
+            for protocol in _iptables_protocols(rule):
+                yield f"-A {chain}{addresses}{protocol} {target}\n"
+
+    yield "COMMIT\n"
+
+
+RULESET_RENDERERS: dict[str, RulesetRenderer] = {
+    "nftables": render_nftables,
+    "iptables-restore": render_iptables_restore,
+}
+
+
+def _header(firewall: Row) -> str:
+    return (
+        f'# Firewall {firewall.id} "{_comment(firewall.name)}" '
+        f"({format_address(firewall.ip_address)}:{firewall.port})\n"
+    )
+
+
+def _group_rules(
+    filtering_policies: list[Row], rules: Iterable[Row]
+) -> Iterator[tuple[Row, list[Row]]]:
+    rules_by_filtering_policy_id = {
+        filtering_policy.id: [] for filtering_policy in filtering_policies
+    }
+    for rule in rules:
+        if rule.filtering_policy_id in rules_by_filtering_policy_id:
+            rules_by_filtering_policy_id[rule.filtering_policy_id].append(rule)
+
+    for filtering_policy in filtering_policies:
+        yield filtering_policy, rules_by_filtering_policy_id[filtering_policy.id]
+
+
+def _comment(text: str) -> str:
+    """Make a name fit in a quoted comment of nft and iptables."""
+    text = "".join(" " if not char.isprintable() else char for char in text)
+    return text.replace("\\", "/").replace('"', "'")[:MAX_COMMENT_LENGTH]
+
+
+def _has_port_range(rule: Row) -> bool:
+    return rule.destination_port != 0 or rule.destination_port_end != MAX_PORT
+
+
+def _format_port_range(rule: Row, separator: str) -> str:
+    if rule.destination_port == rule.destination_port_end:
+        return str(rule.destination_port)
+
+    return f"{rule.destination_port}{separator}{rule.destination_port_end}"
+
+
+def _nftables_addresses(rule: Row) -> str:
+    addresses = ""
+    if rule.source_ip != 0 or rule.source_ip_end != MAX_ADDRESS:
+        addresses += (
+            f"ip saddr {format_address_range(rule.source_ip, rule.source_ip_end)} "
+        )
+    if rule.destination_ip != 0 or rule.destination_ip_end != MAX_ADDRESS:
+        addresses += (
+            "ip daddr "
+            f"{format_address_range(rule.destination_ip, rule.destination_ip_end)} "
+        )
+
+    return addresses
+
+
+def _nftables_protocols(rule: Row) -> list[str]:
+    """Build the protocol and port matches, a rule may need several lines."""
+    if rule.protocol == Protocol.ICMP:
+        return ["meta l4proto icmp "]
+    if not _has_port_range(rule):
+        if rule.protocol == Protocol.ANY:
+            return [""]
+        return [f"meta l4proto {rule.protocol.name.lower()} "]
+
+    if rule.protocol != Protocol.ANY:
+        return [f"{rule.protocol.name.lower()} dport {_format_port_range(rule, '-')} "]
+    return [f"meta l4proto {{ tcp, udp }} th dport {_format_port_range(rule, '-')} "]
+
+
+def _nftables_verdict(rule: Row) -> str:
+    if rule.name is None:
+        return NFTABLES_VERDICTS[rule.action]
+
+    return f'{NFTABLES_VERDICTS[rule.action]} comment "{_comment(rule.name)}"'
+
+
+def _iptables_addresses(rule: Row) -> str:
+    addresses = ""
+    if rule.source_ip != 0 or rule.source_ip_end != MAX_ADDRESS:
+        addresses += f" -s {format_address_range(rule.source_ip, rule.source_ip_end)}"
+    if rule.destination_ip != 0 or rule.destination_ip_end != MAX_ADDRESS:
+        addresses += (
+            f" -d {format_address_range(rule.destination_ip, rule.destination_ip_end)}"
+        )
+
+    return addresses
+
+
+def _iptables_protocols(rule: Row) -> list[str]:
+    """Build the protocol and port matches, a rule may need several lines."""
+    if rule.protocol == Protocol.ICMP:
+        return [" -p icmp"]
+    if not _has_port_range(rule):
+        if rule.protocol == Protocol.ANY:
+            return [""]
+        return [f" -p {rule.protocol.name.lower()}"]
+
+    protocols = (
+        [rule.protocol]
+        if rule.protocol != Protocol.ANY
+        else [Protocol.TCP, Protocol.UDP]
+    )
+    return [
+        f" -p {protocol.name.lower()} -m {protocol.name.lower()} "
+        f"--dport {_format_port_range(rule, ':')}"
+        for protocol in protocols
+    ]
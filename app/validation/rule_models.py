@@ -1,16 +1,77 @@
-from ipaddress import IPv4Address
+from ipaddress import IPv4Address, IPv4Network
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter, ValidationInfo, field_validator
+from pydantic_core import PydanticCustomError
 
 from app.db.models import Protocol, RuleAction
 
 
-class PostRuleModel(BaseModel):
-    previous_rule_id: Optional[int] = None
+class RuleModel(BaseModel):
     name: Optional[str] = Field(min_length=0, max_length=50, default=None)
-    source_ip: IPv4Address
-    destination_ip: IPv4Address
+    source_ip: IPv4Network
+    destination_ip: IPv4Network
     destination_port: int = Field(ge=0, le=65535)
+    destination_port_end: Optional[int] = Field(ge=0, le=65535, default=None)
     protocol: Protocol
     action: RuleAction
+
+    @field_validator("destination_port_end")
+    @classmethod
+    def check_port_range(
+        cls, destination_port_end: Optional[int], info: ValidationInfo
+    ) -> Optional[int]:
+        destination_port = info.data.get("destination_port")
+        if (
+            destination_port_end is not None
+            and destination_port is not None
+            and destination_port_end < destination_port
+        ):
+            raise PydanticCustomError(
+                "port_range",
+                "Input should be greater than or equal to destination_port",
+            )
+
+        return destination_port_end
+
+    def to_columns(self) -> dict:
+        """
+        Convert the rule into the column values of a Rule.
+
+        :return: The values by column name
+        """
+        destination_port = self.destination_port
+        destination_port_end = (
+            destination_port
+            if self.destination_port_end is None
+            else self.destination_port_end
+        )
+        if self.protocol == Protocol.ICMP:
+            # Ports only apply to TCP and UDP, ICMP rules are on every port
+            destination_port, destination_port_end = 0, 65535
+
+        return {
+            "name": self.name,
+            "source_ip": self.source_ip.network_address,
+            "source_ip_end": self.source_ip.broadcast_address,
+            "destination_ip": self.destination_ip.network_address,
+            "destination_ip_end": self.destination_ip.broadcast_address,
+            "destination_port": destination_port,
+            "destination_port_end": destination_port_end,
+            "protocol": self.protocol,
+            "action": self.action,
+        }
+
+
+class PostRuleModel(RuleModel):
+    previous_rule_id: Optional[int] = None
+
+
+RuleListModel = TypeAdapter(list[RuleModel])
+
+
+class MatchRulesModel(BaseModel):
+    source_ip: Optional[IPv4Address] = None
+    destination_ip: Optional[IPv4Address] = None
+    destination_port: Optional[int] = Field(ge=0, le=65535, default=None)
+    protocol: Optional[Protocol] = None
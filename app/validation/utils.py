@@ -1,8 +1,14 @@
+import json
 import re
+from typing import Any, Iterator
 
 from pydantic_core import ErrorDetails
 
 
+class InvalidNDJSONError(ValueError):
+    """Raised when a line of an NDJSON document is not valid JSON."""
+
+
 def translate_errors(errors: list[ErrorDetails]):
     """
     Translate pydantic errors into more readable ones.
@@ -14,3 +20,40 @@ def translate_errors(errors: list[ErrorDetails]):
             re.sub(r"^\w+", str(error["loc"][0]), error["msg"]) for error in errors
         ]
     }
+
+
+def translate_list_errors(errors: list[ErrorDetails], item_name: str):
+    """
+    Translate pydantic errors raised while validating a list into more readable ones.
+
+    :param errors: result of ValidationError::errors function
+    :param item_name: The name given to the list items in the messages
+    """
+    return {
+        "errors": [
+            f"{item_name} {error['loc'][0]}: "
+            + (
+                re.sub(r"^\w+", str(error["loc"][1]), error["msg"])
+                if len(error["loc"]) > 1
+                else error["msg"]
+            )
+            for error in errors
+        ]
+    }
+
+
+def decode_ndjson(data: bytes) -> Iterator[Any]:
+    """
+    Decode a newline delimited JSON document lazily, blank lines are skipped.
+
+    :param data: The NDJSON document
+
+    :raise InvalidNDJSONError: if a line is not valid JSON
+    """
+    for line_number, line in enumerate(data.splitlines(), start=1):
+        if not line or line.isspace():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise InvalidNDJSONError(f"Line {line_number}: invalid JSON")
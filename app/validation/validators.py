@@ -0,0 +1,23 @@
+from connexion.datastructures import MediaTypeDict
+from connexion.validators import VALIDATOR_MAP, AbstractRequestBodyValidator
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class NDJSONRequestBodyValidator(AbstractRequestBodyValidator):
+    """
+    Let NDJSON bodies through untouched.
+
+    Connexion would otherwise try to parse them as a single JSON document,
+    endpoints accepting NDJSON decode them line by line themselves.
+    """
+
+
+validator_map = {
+    "body": MediaTypeDict(
+        {
+            **VALIDATOR_MAP["body"],
+            NDJSON_MIMETYPE: NDJSONRequestBodyValidator,
+        }
+    )
+}
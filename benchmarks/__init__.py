@@ -0,0 +1,8 @@
+"""
+Benchmarks of the repositories, the serialization, the evaluation and the
+HTTP endpoints.
+
+Run them with ``python -m benchmarks``, see ``python -m benchmarks --help``.
+They use a throwaway SQLite database filled with synthetic firewalls, so the
+modules of the app must only be imported once DATABASE_URL points to it.
+"""
@@ -0,0 +1,174 @@
+"""
+Run the benchmarks against a throwaway database.
+
+    python -m benchmarks [--rules 500] [--output results.json]
+
+The results are compared to benchmarks/baseline.json, the run fails when the
+median or the 99th percentile latency of a benchmark got slower than the
+baseline's beyond their tolerance. Save a new baseline with --save-baseline
+after an intended change of performance.
+"""
+
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def parse_arguments(arguments: Optional[list[str]] = None):
+    parser = ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--firewalls", type=int, default=2)
+    parser.add_argument(
+        "--policies", type=int, default=10, help="Filtering policies per firewall"
+    )
+    parser.add_argument(
+        "--rules", type=int, default=200, help="Rules per filtering policy"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--iterations", type=int, default=200, help="Timed operations per benchmark"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=10, help="Untimed operations run first"
+    )
+    parser.add_argument(
+        "--filter",
+        dest="name_filter",
+        default="",
+        help="Only run the benchmarks whose name contains this text",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="Write the results to this JSON file"
+    )
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results to the baseline instead of comparing them",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Accepted p50 latency increase before failing, 0.5 allows 50%% slower",
+    )
+    parser.add_argument(
+        "--p99-tolerance",
+        type=float,
+        default=2.0,
+        help="Accepted p99 latency increase before failing, tail latencies are "
+        "noisier than medians",
+    )
+    return parser.parse_args(arguments)
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    args = parse_arguments(arguments)
+
+    with tempfile.TemporaryDirectory() as database_dir:
+        # The app's engines are created on import, from the environment
+        os.environ["DATABASE_URL"] = f"sqlite:///{database_dir}/benchmarks.sqlite3"
+        os.environ.pop("DATABASE_READ_URL", None)
+        _create_schema()
+        logging.getLogger("connexion").setLevel(logging.ERROR)
+
+        # Importing the modules registers their benchmarks
+        from . import (  # noqa: F401
+            endpoint_benchmarks,
+            evaluation_benchmarks,
+            repository_benchmarks,
+        )
+        from .harness import find_regressions, registered_benchmarks, run_benchmark
+        from .workload import WorkloadSettings, generate_workload
+
+        settings = WorkloadSettings(
+            firewalls=args.firewalls,
+            policies=args.policies,
+            rules=args.rules,
+            seed=args.seed,
+        )
+        workload = generate_workload(settings)
+
+        results = {}
+        for name, function in registered_benchmarks().items():
+            if args.name_filter not in name:
+                continue
+
+            result = run_benchmark(
+                name, function, workload, args.iterations, args.warmup
+            )
+            results[name] = result.convert_to_json()
+            print(
+                f"{name:<64} {result.throughput:>10.1f} ops/s "
+                f"p50 {result.p50_ms:>9.3f} ms  p99 {result.p99_ms:>9.3f} ms"
+            )
+
+    report = {
+        "workload": settings._asdict(),
+        "iterations": args.iterations,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, nothing to compare to")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["workload"] != report["workload"]:
+        print(
+            f"The baseline was measured with the workload {baseline['workload']}, "
+            "run the benchmarks with the same one to compare them",
+            file=sys.stderr,
+        )
+        return 2
+
+    regressions = find_regressions(
+        results,
+        baseline["results"],
+        {"p50_ms": args.tolerance, "p99_ms": args.p99_tolerance},
+    )
+    if regressions:
+        print(
+            f"\nPERFORMANCE REGRESSIONS ({len(regressions)}) compared to "
+            f"{args.baseline}:",
+            file=sys.stderr,
+        )
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        return 1
+
+    print(f"\nNo regression compared to {args.baseline}")
+    return 0
+
+
+def _create_schema() -> None:
+    # Without an ini file, the migrations don't configure the logging
+    config = Config()
+    config.set_main_option("script_location", str(ROOT_DIR / "alembic"))
+    command.upgrade(config, "head")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Benchmarks of the main HTTP endpoints through connexion's in-process client.
+
+Requests go through the whole stack: routing, validation, the endpoint and
+the serialization of the response. Reads of an unchanged firewall are served
+by the configuration cache after the first request, as they would be in
+production, the cold variants clear the cache before each request.
+"""
+
+import json
+from functools import partial
+from pathlib import Path
+
+from connexion import FlaskApp
+
+from app.cache import configuration_cache
+from app.serialization import format_address
+from app.validation.validators import NDJSON_MIMETYPE, validator_map
+
+from .harness import benchmark
+from .workload import DESTINATION_START, RULE_SOURCE_START, Workload
+
+SPECIFICATION_DIR = Path(__file__).resolve().parent.parent
+EVALUATED_FLOWS = 1000
+
+_client = None
+
+
+def client():
+    """Give the test client of the app, created on first use."""
+    global _client
+    if _client is None:
+        app = FlaskApp(__name__, specification_dir=SPECIFICATION_DIR)
+        app.add_api("openapi.yaml", validator_map=validator_map)
+        _client = app.test_client()
+
+    return _client
+
+
+def _request(method: str, url: str, expected_status: int, **kwargs):
+    response = client().request(method, url, **kwargs)
+    if response.status_code != expected_status:
+        raise AssertionError(
+            f"{method} {url} answered {response.status_code}: {response.text}"
+        )
+
+
+def _cold_request(method: str, url: str, expected_status: int, **kwargs):
+    configuration_cache.clear()
+    _request(method, url, expected_status, **kwargs)
+
+
+def _get_requests(urls: list[str], cold: bool = False):
+    return [
+        partial(_cold_request if cold else _request, "GET", url, 200) for url in urls
+    ]
+
+
+@benchmark("GET /firewalls/{id}")
+def get_firewall(workload: Workload, count: int):
+    return _get_requests(
+        [
+            f"/firewalls/{id}"
+            for id in workload.random.choices(workload.firewall_ids, k=count)
+        ]
+    )
+
+
+@benchmark("GET /firewalls/{id}/filtering_policies")
+def get_filtering_policies(workload: Workload, count: int):
+    return _get_requests(
+        [
+            f"/firewalls/{id}/filtering_policies"
+            for id in workload.random.choices(workload.firewall_ids, k=count)
+        ]
+    )
+
+
+@benchmark("GET /filtering_policies/{id}?show_rules=true")
+def get_filtering_policy_with_rules(workload: Workload, count: int):
+    return _get_requests(
+        [
+            f"/filtering_policies/{id}?show_rules=true"
+            for id in workload.random.choices(
+                workload.all_filtering_policy_ids, k=count
+            )
+        ]
+    )
+
+
+@benchmark("GET /filtering_policies/{id}?show_rules=true (cold)")
+def get_filtering_policy_with_rules_cold(workload: Workload, count: int):
+    return _get_requests(
+        [
+            f"/filtering_policies/{id}?show_rules=true"
+            for id in workload.random.choices(
+                workload.all_filtering_policy_ids, k=count
+            )
+        ],
+        cold=True,
+    )
+
+
+@benchmark("GET /filtering_policies/{id}?show_rules=true&limit=100")
+def get_filtering_policy_rules_page(workload: Workload, count: int):
+    return _get_requests(
+        [
+            f"/filtering_policies/{id}?show_rules=true&limit=100"
+            for id in workload.random.choices(
+                workload.all_filtering_policy_ids, k=count
+            )
+        ]
+    )
+
+
+@benchmark("GET /rules/{id}")
+def get_rule(workload: Workload, count: int):
+    return _get_requests(
+        [
+            f"/rules/{id}"
+            for id in workload.random.choices(workload.all_rule_ids, k=count)
+        ]
+    )
+
+
+@benchmark("POST /filtering_policies/{id}/rules")
+def add_rule(workload: Workload, count: int):
+    return [
+        partial(
+            _request,
+            "POST",
+            f"/filtering_policies/{id}/rules",
+            201,
+            json=workload.new_rule_json(),
+        )
+        for id in workload.random.choices(workload.all_filtering_policy_ids, k=count)
+    ]
+
+
+@benchmark("GET /firewalls/{id}/export")
+def export_firewall(workload: Workload, count: int):
+    return [
+        partial(_request, "GET", f"/firewalls/{id}/export", 200)
+        for id in workload.random.choices(workload.firewall_ids, k=count)
+    ]
+
+
+@benchmark(f"POST /firewalls/{{id}}/evaluate ({EVALUATED_FLOWS} flows)")
+def evaluate_flows(workload: Workload, count: int):
+    flows = "".join(
+        json.dumps(
+            {
+                "source_ip": format_address(
+                    RULE_SOURCE_START + workload.random.randrange(1 << 20)
+                ),
+                "destination_ip": format_address(
+                    DESTINATION_START + workload.random.randrange(1 << 16)
+                ),
+                "destination_port": workload.random.randrange(1, 65_536),
+                "protocol": "TCP",
+            }
+        )
+        + "\n"
+        for _ in range(EVALUATED_FLOWS)
+    )
+
+    return [
+        partial(
+            _request,
+            "POST",
+            f"/firewalls/{id}/evaluate",
+            200,
+            content=flows,
+            headers={"Content-Type": NDJSON_MIMETYPE},
+        )
+        for id in workload.random.choices(workload.firewall_ids, k=count)
+    ]
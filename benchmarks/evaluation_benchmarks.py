@@ -0,0 +1,62 @@
+"""
+Benchmarks of the evaluation of flows by a compiled firewall.
+
+Rules of the workload are on source prefixes and port ranges, so the flows
+are matched through the bitsets of the range rules, built by the warmup.
+"""
+
+from functools import partial
+
+import numpy as np
+
+from app.db.models import Protocol
+from app.db.unit_of_work import unit_of_work
+from app.evaluation import compile_firewall
+from app.evaluation.compiled_firewall import PROTOCOL_CODES
+from app.evaluation.flow_batch import FlowBatch
+
+from .harness import benchmark
+from .workload import DESTINATION_START, RULE_SOURCE_START, Workload
+
+MATCHED_FLOWS = 1000
+
+
+def _random_flow(workload: Workload) -> tuple[int, int, int, int]:
+    return (
+        RULE_SOURCE_START + workload.random.randrange(1 << 16),
+        DESTINATION_START + workload.random.randrange(1 << 16),
+        workload.random.randrange(1, 65_536),
+        PROTOCOL_CODES[Protocol.TCP],
+    )
+
+
+def _compiled_firewall(workload: Workload):
+    with unit_of_work(read_only=True):
+        return compile_firewall(workload.firewall_ids[0])
+
+
+@benchmark("compiled_firewall.match")
+def match(workload: Workload, count: int):
+    compiled_firewall = _compiled_firewall(workload)
+
+    return [
+        partial(compiled_firewall.match, *_random_flow(workload)) for _ in range(count)
+    ]
+
+
+@benchmark(f"compiled_firewall.match_batch ({MATCHED_FLOWS} flows)")
+def match_batch(workload: Workload, count: int):
+    compiled_firewall = _compiled_firewall(workload)
+
+    def flow_batch() -> FlowBatch:
+        source_ips, destination_ips, destination_ports, protocol_codes = zip(
+            *(_random_flow(workload) for _ in range(MATCHED_FLOWS))
+        )
+        return FlowBatch(
+            np.array(source_ips, dtype=np.uint32),
+            np.array(destination_ips, dtype=np.uint32),
+            np.array(destination_ports, dtype=np.uint16),
+            np.array(protocol_codes, dtype=np.uint8),
+        )
+
+    return [partial(compiled_firewall.match_batch, flow_batch()) for _ in range(count)]
@@ -0,0 +1,148 @@
+"""
+Registration, timing and comparison of benchmarks.
+
+A benchmark is a function building the operations to time from a workload:
+everything it does before returning is setup and isn't measured. Each
+operation is timed on its own, so the results hold latency percentiles as
+well as the throughput of the whole run.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Callable, NamedTuple, Sequence
+
+import numpy as np
+
+Operation = Callable[[], object]
+BenchmarkFunction = Callable[..., Sequence[Operation]]
+
+_benchmarks: dict[str, BenchmarkFunction] = {}
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    total_seconds: float
+    throughput: float
+    mean_ms: float
+    p50_ms: float
+    p99_ms: float
+
+    def convert_to_json(self) -> dict:
+        return {
+            "iterations": self.iterations,
+            "total_seconds": round(self.total_seconds, 6),
+            "throughput": round(self.throughput, 2),
+            "mean_ms": round(self.mean_ms, 4),
+            "p50_ms": round(self.p50_ms, 4),
+            "p99_ms": round(self.p99_ms, 4),
+        }
+
+
+class Regression(NamedTuple):
+    name: str
+    statistic: str
+    baseline: float
+    current: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.statistic} went from {self.baseline:.4f} to "
+            f"{self.current:.4f} ({self.current / self.baseline - 1:+.0%})"
+        )
+
+
+def benchmark(name: str) -> Callable[[BenchmarkFunction], BenchmarkFunction]:
+    """
+    Register a benchmark.
+
+    The decorated function is called with the workload and the number of
+    operations to build, warmup included.
+
+    :param name: The unique name of the benchmark in the results
+
+    :return: The decorator
+    """
+
+    def register(function: BenchmarkFunction) -> BenchmarkFunction:
+        if name in _benchmarks:
+            raise ValueError(f"Benchmark '{name}' is already registered")
+        _benchmarks[name] = function
+        return function
+
+    return register
+
+
+def registered_benchmarks() -> dict[str, BenchmarkFunction]:
+    """Get the registered benchmarks by name, in registration order."""
+    return dict(_benchmarks)
+
+
+def run_benchmark(
+    name: str, function: BenchmarkFunction, workload, iterations: int, warmup: int
+) -> BenchmarkResult:
+    """
+    Build the operations of a benchmark and time them.
+
+    :param name: The benchmark's name
+    :param function: The benchmark
+    :param workload: The synthetic data the operations run against
+    :param iterations: The number of timed operations
+    :param warmup: The number of operations run first, without timing them
+
+    :return: The result
+    """
+    operations = function(workload, warmup + iterations)
+    for operation in operations[:warmup]:
+        operation()
+
+    timed_operations = operations[warmup:]
+    durations = np.empty(len(timed_operations), dtype=np.int64)
+    for index, operation in enumerate(timed_operations):
+        start = time.perf_counter_ns()
+        operation()
+        durations[index] = time.perf_counter_ns() - start
+
+    total_seconds = durations.sum() / 1e9
+    durations_ms = durations / 1e6
+    return BenchmarkResult(
+        name=name,
+        iterations=len(durations),
+        total_seconds=total_seconds,
+        throughput=len(durations) / total_seconds if total_seconds else 0.0,
+        mean_ms=float(durations_ms.mean()),
+        p50_ms=float(np.percentile(durations_ms, 50)),
+        p99_ms=float(np.percentile(durations_ms, 99)),
+    )
+
+
+def find_regressions(
+    results: dict[str, dict], baseline: dict[str, dict], tolerances: dict[str, float]
+) -> list[Regression]:
+    """
+    Compare results to a baseline.
+
+    Benchmarks missing from one of them are ignored.
+
+    :param results: The statistics of the current run, by benchmark name
+    :param baseline: The statistics of the baseline, by benchmark name
+    :param tolerances: The accepted slowdown of the compared latency
+        statistics, by name, 0.25 allows latencies 25% higher than the
+        baseline's
+
+    :return: The statistics slower than the baseline beyond their tolerance
+    """
+    regressions = []
+    for name, statistics in results.items():
+        if name not in baseline:
+            continue
+
+        for statistic, tolerance in tolerances.items():
+            baseline_value = baseline[name][statistic]
+            if statistics[statistic] > baseline_value * (1 + tolerance):
+                regressions.append(
+                    Regression(name, statistic, baseline_value, statistics[statistic])
+                )
+
+    return regressions
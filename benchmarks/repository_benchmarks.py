@@ -0,0 +1,103 @@
+"""
+Benchmarks of the repositories, the ORM ordering and the serialization.
+
+Repository calls are made outside of any unit of work, so each operation
+runs and commits its own transaction like a single call endpoint would.
+"""
+
+from functools import partial
+
+from app.cache import FirewallConfiguration
+from app.db.repositories import (
+    FilteringPolicyRepository,
+    FirewallRepository,
+    RuleRepository,
+)
+from app.db.unit_of_work import unit_of_work
+
+from .harness import benchmark
+from .workload import Workload
+
+
+@benchmark("rule_repository.add_after_rule")
+def add_after_rule(workload: Workload, count: int):
+    previous_rule_ids = workload.random.choices(workload.all_rule_ids, k=count)
+
+    return [
+        partial(RuleRepository.add_after_rule, previous_rule_id, workload.new_rule())
+        for previous_rule_id in previous_rule_ids
+    ]
+
+
+@benchmark("rule_repository.add_to_filtering_policy_as_first_rule")
+def add_to_filtering_policy_as_first_rule(workload: Workload, count: int):
+    filtering_policy_ids = workload.random.choices(
+        workload.all_filtering_policy_ids, k=count
+    )
+
+    return [
+        partial(
+            RuleRepository.add_to_filtering_policy_as_first_rule,
+            filtering_policy_id,
+            workload.new_rule(),
+        )
+        for filtering_policy_id in filtering_policy_ids
+    ]
+
+
+@benchmark("rule_repository.delete")
+def delete(workload: Workload, count: int):
+    # Rules of the workload are kept for the other benchmarks
+    rule_ids = []
+    for filtering_policy_id in workload.random.choices(
+        workload.all_filtering_policy_ids, k=count
+    ):
+        rule_ids.append(
+            RuleRepository.add_to_filtering_policy_as_first_rule(
+                filtering_policy_id, workload.new_rule()
+            ).id
+        )
+
+    return [partial(RuleRepository.delete, rule_id) for rule_id in rule_ids]
+
+
+@benchmark("filtering_policy.rules")
+def filtering_policy_rules(workload: Workload, count: int):
+    def load_ordered_rules(filtering_policy_id: int):
+        with unit_of_work(read_only=True):
+            return len(FilteringPolicyRepository.find_by_id(filtering_policy_id).rules)
+
+    return [
+        partial(load_ordered_rules, filtering_policy_id)
+        for filtering_policy_id in workload.random.choices(
+            workload.all_filtering_policy_ids, k=count
+        )
+    ]
+
+
+@benchmark("filtering_policy.convert_to_json")
+def filtering_policy_convert_to_json(workload: Workload, count: int):
+    filtering_policy_id = workload.random.choice(workload.all_filtering_policy_ids)
+    with unit_of_work(read_only=True):
+        filtering_policy = FilteringPolicyRepository.find_by_id_with_rules(
+            filtering_policy_id
+        )
+
+    return [
+        partial(filtering_policy.convert_to_json, show_rules=True) for _ in range(count)
+    ]
+
+
+@benchmark("firewall_configuration.filtering_policies_with_rules_by_id")
+def configuration_filtering_policies_with_rules(workload: Workload, count: int):
+    # A new configuration is loaded each time, as after a revision change
+    def load_configuration(firewall_id: int):
+        with unit_of_work(read_only=True):
+            return FirewallConfiguration(
+                firewall_id, FirewallRepository.find_revision(firewall_id)
+            ).filtering_policies_with_rules_by_id
+
+    return [
+        partial(load_configuration, firewall_id)
+        for firewall_id in workload.random.choices(workload.firewall_ids, k=count)
+    ]
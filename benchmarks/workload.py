@@ -0,0 +1,164 @@
+"""
+Synthetic firewalls the benchmarks run against.
+
+The rows are bulk inserted in a single transaction, bypassing the
+repositories, so building large workloads stays fast. Rule addresses are
+derived from the rule's rank, so the rules of a policy never clash, and
+addresses handed out by new_source_ip are out of the generated ranges.
+"""
+
+from __future__ import annotations
+
+import random
+from ipaddress import IPv4Address
+from typing import NamedTuple
+
+from sqlalchemy import insert
+
+from app.db.models import FilteringPolicy, Firewall, Rule
+from app.db.models.rule import Protocol, RuleAction
+from app.db.repositories.positions import POSITION_GAP
+from app.db.unit_of_work import unit_of_work
+
+FIREWALL_ADDRESS_START = int(IPv4Address("192.168.0.1"))
+RULE_SOURCE_START = int(IPv4Address("10.0.0.0"))
+NEW_RULE_SOURCE_START = int(IPv4Address("172.16.0.0"))
+DESTINATION_START = int(IPv4Address("100.64.0.0"))
+RULE_PROTOCOLS = (Protocol.TCP, Protocol.UDP, Protocol.ANY)
+
+
+class WorkloadSettings(NamedTuple):
+    firewalls: int = 2
+    policies: int = 10
+    rules: int = 200
+    seed: int = 0
+
+
+class Workload:
+    """
+    Ids of the generated rows and helpers to create more rules.
+
+    :ivar settings: The settings the workload was generated with
+    :ivar firewall_ids: The firewalls' ids
+    :ivar filtering_policy_ids: The filtering policies' ids, by firewall id
+    :ivar rule_ids: The rules' ids in order, by filtering policy id
+    :ivar random: The seeded random generator the benchmarks pick rows with
+    """
+
+    def __init__(self, settings: WorkloadSettings) -> None:
+        self.settings = settings
+        self.firewall_ids: list[int] = []
+        self.filtering_policy_ids: dict[int, list[int]] = {}
+        self.rule_ids: dict[int, list[int]] = {}
+        self.random = random.Random(settings.seed)
+        self._new_rules_count = 0
+
+    @property
+    def all_filtering_policy_ids(self) -> list[int]:
+        return [id for ids in self.filtering_policy_ids.values() for id in ids]
+
+    @property
+    def all_rule_ids(self) -> list[int]:
+        return [id for ids in self.rule_ids.values() for id in ids]
+
+    def new_source_ip(self) -> IPv4Address:
+        """Give a source address used by no rule yet."""
+        self._new_rules_count += 1
+        return IPv4Address(NEW_RULE_SOURCE_START + self._new_rules_count)
+
+    def new_rule(self) -> Rule:
+        """Build a rule which doesn't clash with any other one."""
+        source_ip = self.new_source_ip()
+        return Rule(
+            source_ip=source_ip,
+            source_ip_end=source_ip,
+            destination_ip=IPv4Address(DESTINATION_START),
+            destination_ip_end=IPv4Address(DESTINATION_START),
+            destination_port=443,
+            destination_port_end=443,
+            protocol=Protocol.TCP,
+            action=RuleAction.ALLOW,
+        )
+
+    def new_rule_json(self) -> dict:
+        """Build the body of a rule which doesn't clash with any other one."""
+        return {
+            "source_ip": str(self.new_source_ip()),
+            "destination_ip": str(IPv4Address(DESTINATION_START)),
+            "destination_port": 443,
+            "protocol": Protocol.TCP.name,
+            "action": RuleAction.ALLOW.name,
+        }
+
+
+def generate_workload(settings: WorkloadSettings) -> Workload:
+    """
+    Fill the database with synthetic firewalls.
+
+    :param settings: The number of firewalls, of filtering policies per
+        firewall and of rules per filtering policy, and the random seed
+
+    :return: The generated workload
+    """
+    workload = Workload(settings)
+    generator = random.Random(settings.seed)
+
+    with unit_of_work() as session:
+        for firewall_rank in range(settings.firewalls):
+            firewall = Firewall(
+                name=f"firewall-{firewall_rank}",
+                ip_address=IPv4Address(FIREWALL_ADDRESS_START + firewall_rank),
+                port=22,
+            )
+            session.add(firewall)
+            session.flush()
+            workload.firewall_ids.append(firewall.id)
+
+            filtering_policy_ids = session.scalars(
+                insert(FilteringPolicy).returning(
+                    FilteringPolicy.id, sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "firewall_id": firewall.id,
+                        "name": f"policy-{policy_rank}",
+                        "position": (policy_rank + 1) * POSITION_GAP,
+                    }
+                    for policy_rank in range(settings.policies)
+                ],
+            ).all()
+            workload.filtering_policy_ids[firewall.id] = list(filtering_policy_ids)
+
+            for filtering_policy_id in filtering_policy_ids:
+                workload.rule_ids[filtering_policy_id] = list(
+                    session.scalars(
+                        insert(Rule).returning(Rule.id, sort_by_parameter_order=True),
+                        [
+                            _rule_values(filtering_policy_id, rule_rank, generator)
+                            for rule_rank in range(settings.rules)
+                        ],
+                    ).all()
+                )
+
+    return workload
+
+
+def _rule_values(
+    filtering_policy_id: int, rule_rank: int, generator: random.Random
+) -> dict:
+    source_ip = RULE_SOURCE_START + rule_rank * 256
+    destination_ip = DESTINATION_START + generator.randrange(1 << 16)
+    destination_port = generator.randrange(1, 65_000)
+    return {
+        "filtering_policy_id": filtering_policy_id,
+        "name": f"rule-{rule_rank}",
+        "source_ip": source_ip,
+        "source_ip_end": source_ip + 255,
+        "destination_ip": destination_ip,
+        "destination_ip_end": destination_ip,
+        "destination_port": destination_port,
+        "destination_port_end": destination_port + generator.randrange(100),
+        "protocol": generator.choice(RULE_PROTOCOLS),
+        "action": generator.choice(list(RuleAction)),
+        "position": (rule_rank + 1) * POSITION_GAP,
+    }
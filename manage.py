@@ -1,5 +1,142 @@
-from connexion import FlaskApp
+import json
+from argparse import ArgumentParser, FileType, Namespace
 
-app = FlaskApp(__name__)
-app.add_api("openapi.yaml")
-app.run()
+from connexion import AsyncApp, FlaskApp
+from connexion.middleware import MiddlewarePosition
+from sqlalchemy.exc import NoResultFound
+
+from app.cache import get_configuration
+from app.db.repositories import FirewallRepository
+from app.db.repositories.firewall_repository import FilteringPolicyExistsError
+from app.db.unit_of_work import unit_of_work
+from app.endpoints.async_resolver import AsyncResolver
+from app.evaluation import FLOW_LOG_FORMATS, InvalidFlowError, replay_flow_log
+from app.importing import DUMP_FORMATS, DumpReader, InvalidDumpError
+from app.metrics import MetricsMiddleware
+from app.validation.validators import validator_map
+
+
+def serve(args: Namespace) -> None:
+    if args.use_async:
+        app = AsyncApp(__name__)
+        app.add_api(
+            "openapi.yaml", validator_map=validator_map, resolver=AsyncResolver()
+        )
+    else:
+        app = FlaskApp(__name__)
+        app.add_api("openapi.yaml", validator_map=validator_map)
+    # After the routing, which tells the operation of each request
+    app.add_middleware(MetricsMiddleware, position=MiddlewarePosition.BEFORE_SECURITY)
+    app.run()
+
+
+def import_dump(args: Namespace) -> None:
+    reader = DumpReader(args.dump, args.format)
+    try:
+        with args.dump:
+            counts = FirewallRepository.import_configuration(args.firewall_id, reader)
+    except NoResultFound:
+        parser.exit(1, f"No firewall found with id '{args.firewall_id}'\n")
+    except InvalidDumpError as err:
+        parser.exit(1, f"{err}\n")
+    except FilteringPolicyExistsError as err:
+        parser.exit(
+            1,
+            f"Filtering policy with name '{err.name}' already exists on firewall "
+            f"with id '{args.firewall_id}'\n",
+        )
+
+    print(
+        f"Added {counts['filtering_policies']} filtering policies and "
+        f"{counts['rules']} rules"
+    )
+    if reader.skipped_rules:
+        print(
+            f"Skipped {reader.skipped_rules} rules the API can't express, on lines "
+            + ", ".join(map(str, reader.skipped_rule_lines))
+            + (", ..." if reader.skipped_rules > len(reader.skipped_rule_lines) else "")
+        )
+
+
+def replay(args: Namespace) -> None:
+    with unit_of_work(read_only=True):
+        configuration = get_configuration(args.firewall_id)
+        compiled_firewall = configuration.compiled if configuration else None
+    if compiled_firewall is None:
+        parser.exit(1, f"No firewall found with id '{args.firewall_id}'\n")
+
+    try:
+        report = replay_flow_log(
+            args.flow_log, compiled_firewall, args.format, args.workers
+        )
+    except (OSError, InvalidFlowError) as err:
+        parser.exit(1, f"{err}\n")
+
+    with args.output:
+        json.dump(report.to_dict(), args.output, indent=2)
+        args.output.write("\n")
+
+
+parser = ArgumentParser()
+parser.add_argument(
+    "--async",
+    dest="use_async",
+    action="store_true",
+    help="Serve the API with the async endpoints and repositories",
+)
+parser.set_defaults(command=serve)
+subparsers = parser.add_subparsers(title="commands")
+
+import_parser = subparsers.add_parser(
+    "import",
+    help="Import an iptables-save or nftables dump into a firewall",
+    description="Add a filtering policy for each chain of the dump's filter "
+    "table, holding the chain's rules in order, in a single transaction.",
+)
+import_parser.add_argument("firewall_id", type=int, help="The firewall's id")
+import_parser.add_argument(
+    "dump",
+    type=FileType(encoding="utf-8", errors="replace"),
+    help="The iptables-save or `nft list ruleset` dump, - to read it from stdin",
+)
+import_parser.add_argument(
+    "--format",
+    choices=DUMP_FORMATS,
+    help="The dump's format, guessed from its first statement by default",
+)
+import_parser.set_defaults(command=import_dump)
+
+replay_parser = subparsers.add_parser(
+    "replay",
+    help="Replay a flow log against a firewall",
+    description="Evaluate every flow of a CSV or NDJSON flow log against the "
+    "firewall's policies and rules, in parallel, and write the number of flows "
+    "by action and by rule with samples of the flows matching no rule.",
+)
+replay_parser.add_argument("firewall_id", type=int, help="The firewall's id")
+replay_parser.add_argument(
+    "flow_log",
+    help="The flow log, a CSV file with a header or an NDJSON file, whose "
+    "flows have a source_ip, destination_ip, destination_port and protocol",
+)
+replay_parser.add_argument(
+    "--format",
+    choices=FLOW_LOG_FORMATS,
+    help="The flow log's format, guessed from its first byte by default",
+)
+replay_parser.add_argument(
+    "--workers",
+    type=int,
+    help="The number of worker processes, the number of CPUs by default",
+)
+replay_parser.add_argument(
+    "--output",
+    type=FileType("w", encoding="utf-8"),
+    default="-",
+    help="The JSON report's file, the standard output by default",
+)
+replay_parser.set_defaults(command=replay)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    args.command(args)